@@ -1,6 +1,8 @@
+import os
+
 from app.app import app
-from app.db.neo4j_db import Neo4jDB
-from app.db.postgres_db import PostgresDB
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    # Serveur de développement, un seul processus ; en production : gunicorn -c app/gunicorn.conf.py app.app:app
+    debug = os.getenv("FLASK_DEBUG", "false").lower() == "true"
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), debug=debug, threaded=True)
@@ -1,15 +1,158 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory
+import bisect
+from functools import partial
 
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
+
+from app.db.base_db import BATCH_SIZE, COMMIT_INTERVAL, GeneratedBackend
+from app.db.generator import GeneratorConfig
+from app.db.memory_db import MemoryDB
 from app.db.neo4j_db import Neo4jDB
 from app.db.postgres_db import PostgresDB
+from app.db.query_cache import QueryCache
+from app.db.registry import BackendRegistry
+from app.jobs import Job, JobManager
+from app.snapshot import export_snapshot, import_snapshot, list_snapshots, snapshot_path
 from app.utils import *
 
-postgres_db = PostgresDB()
-postgres_db.init_db()
+GENERATOR_DIR = os.getenv("GENERATOR_DIR", "/app/logs/generator")
+
+query_cache = QueryCache()
+
+
+def share_state(db_target, backend):
+    # Registre d'identifiants et générateur de chaque worker suivent l'état commun : génération du cache
+    # de requêtes et configuration écrite par /generator
+    if isinstance(backend, GeneratedBackend):
+        backend.share_state(partial(query_cache.generation, db_target),
+                            GeneratorConfig(os.path.join(GENERATOR_DIR, f"{db_target}.json")))
+
+
+# Backends créés à la première requête qui les utilise, dans chaque processus : le démarrage n'attend aucune
+# base et un worker issu d'un fork n'hérite d'aucune connexion
+databases = BackendRegistry({"postgres": PostgresDB, "neo4j": Neo4jDB, "memory": MemoryDB}, on_create=share_state)
+
+
+def invalidate(db_target, failed=False):
+    # Après une écriture de ce processus : les autres workers relisent, son registre suit la nouvelle génération.
+    # Après un échec, le registre a pu retenir des identifiants jamais validés : il est relu lui aussi
+    before, after = query_cache.invalidate(db_target)
+    generator = getattr(databases.get(db_target), "generator", None)
+    if generator is None:
+        return
+    if failed:
+        generator.registry.loaded = False
+    else:
+        generator.registry.follow(before, after)
+
+
+def run_job(job, checkpoint):
+    db = databases.get(job.db_target)
+    try:
+        if job.params["action"] == "clear":
+            for _ in job.chunks():
+                checkpoint(0, execute_with_timer(db.clear_db))
+            job.result = f"Base de données {job.db_target} réinitialisée"
+            nb_entities = 0
+        elif job.params["action"] in ("snapshot_export", "snapshot_import"):
+            for _ in job.chunks():
+                if job.params["action"] == "snapshot_export":
+                    job.result, execution_time = export_snapshot(db, job.db_target, job.params["name"])
+                    rows = sum(entity["rows"] for entity in job.result["entities"].values())
+                else:
+                    job.result, execution_time = import_snapshot(db, job.params["name"])
+                    rows = sum(job.result["counts"].values())
+                checkpoint(rows, execution_time)
+            nb_entities = job.rows_done
+        else:
+            nb_entities = run_create_job(job, db, checkpoint)
+    except BaseException:
+        invalidate(job.db_target, failed=True)
+        raise
+    invalidate(job.db_target)
+
+    job.command_history = add_to_history(job.db_target, job.command, nb_entities, round(job.execution_time, 3))
+
+
+def run_create_job(job, db, checkpoint):
+    # Le backend signale chaque commit : le job est sauvegardé avec ce qui est validé avant le commit suivant.
+    # job.state garde les utilisateurs dont les follows restent à écrire et, pour les achats, la plage en cours
+    entity_type = job.params["entity"]
+    options = {"mode": job.params["mode"], "batch_size": job.params["batch_size"],
+               "commit_interval": job.params["commit_interval"]}
+    state = job.state
+
+    def committed(stage, ids):
+        if stage == "users":
+            state.setdefault("pending_follows", []).extend(ids)
+        elif stage == "follows":
+            done = set(ids)
+            state["pending_follows"] = [user_id for user_id in state.get("pending_follows", []) if user_id not in done]
+        elif stage == "achats":
+            state["achats_done"].extend(ids)
+        checkpoint(len(ids) if stage != "follows" else 0, 0)
+
+    if entity_type == "achats":
+        user_ids = db.user_ids()
+        if "last_id" not in state:
+            if not user_ids:
+                raise ValueError("Pas assez d'utilisateurs ou de produits disponibles.")
+            # Première exécution : utilisateurs présents à cet instant, parcourus par plages d'identifiants triés
+            job.total = len(user_ids)
+            state.update(last_id=user_ids[-1], after_id=None, achats_done=[])
+        user_ids = user_ids[:bisect.bisect_right(user_ids, state["last_id"])]
+
+    # Index et clés étrangères différés une seule fois pour le reste du job, pas à chaque morceau
+    estimated_rows = 0
+    if job.params["mode"] != "default":
+        estimated_rows = db.estimated_rows(entity_type, job.total - job.rows_done)
+    with db.bulk_load(estimated_rows) as bulk_stats:
+        if entity_type == "achats":
+            start = bisect.bisect_right(user_ids, state["after_id"]) if state["after_id"] is not None else 0
+            for start in range(start, len(user_ids), job.chunk_size):
+                job.check_cancelled()
+                chunk_ids = user_ids[start:start + job.chunk_size]
+                # Reprise au milieu d'une plage : ses utilisateurs déjà validés ne sont pas rejoués
+                done = set(state["achats_done"])
+                pending = [user_id for user_id in chunk_ids if user_id not in done]
+                execution_time = 0
+                if pending:
+                    _, execution_time = db.create_achats(len(pending), user_ids=pending, checkpoint=committed,
+                                                         **options)
+                state.update(after_id=chunk_ids[-1], achats_done=[])
+                checkpoint(0, execution_time)
+        else:
+            if state.get("pending_follows"):
+                # Reprise : utilisateurs validés dont les follows ne l'ont pas été
+                _, execution_time = db.create_follows(list(state["pending_follows"]), checkpoint=committed,
+                                                      **options)
+                checkpoint(0, execution_time)
+            create_function = getattr(db, f"create_{entity_type}")
+            for chunk in job.chunks():
+                _, execution_time = create_function(chunk, checkpoint=committed, **options)
+                checkpoint(0, execution_time)
+    if bulk_stats["deferred"]:
+        checkpoint(0, bulk_stats["execution_time"])
+        job.result = {"bulk_load": bulk_stats}
+    return job.total if entity_type != "achats" else 0
+
+
+jobs = JobManager(run_job)
 
-neo4j_db = Neo4jDB()
-neo4j_db.init_db()
 app = Flask(__name__)
+
+
+@app.before_request
+def memory_single_worker():
+    # La base memory vit dans un processus : avec plusieurs workers, chargement et requêtes tomberaient
+    # sur des copies différentes. WEB_WORKERS est renseigné par gunicorn.conf.py, absent en développement
+    if int(os.getenv("WEB_WORKERS", 1)) == 1:
+        return None
+    data = request.get_json(silent=True)
+    if request.path == "/memory/load" or (isinstance(data, dict) and data.get("db_target") == "memory"):
+        return jsonify({"error": "La base memory n'est servie qu'avec un seul worker (WEB_WORKERS=1)"}), 400
+    return None
+
+
 @app.route('/')
 def home():
     return render_template('index.html')
@@ -23,19 +166,35 @@ def favicon():
 
 @app.route('/history', methods=["GET"])
 def history():
-    return jsonify(get_history())
+    # Pagination par curseur (id de la dernière entrée reçue), filtres optionnels db_target, command, since, until ;
+    # order=desc part des entrées les plus récentes
+    try:
+        return jsonify(get_history(request.args.get("cursor"), request.args.get("limit"),
+                                   request.args.get("order", "asc"), **history_filters()))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/history/stats', methods=["GET"])
+def historyStats():
+    return jsonify(history_stats(**history_filters()))
+
+
+def history_filters():
+    return {name: request.args.get(name) for name in ("db_target", "command", "since", "until")}
 
 
 def create_entities(entity_type):
     data = request.json
     nb_entities = int(data.get(f"nb_entities", 1))
     db_target = data.get("db_target")
+    mode = data.get("mode", "default")
+    batch_size = int(data.get("batch_size", BATCH_SIZE))
+    commit_interval = int(data.get("commit_interval", COMMIT_INTERVAL))
+    background = data.get("background", True)
 
-    if db_target == "postgres":
-        db = postgres_db
-    elif db_target == "neo4j":
-        db = neo4j_db
-    else:
+    db = databases.get(db_target)
+    if db is None:
         return jsonify({"error": "Invalid database target"}), 400
 
     create_function = getattr(db, f"create_{entity_type}", None)
@@ -43,11 +202,41 @@ def create_entities(entity_type):
     if not create_function:
         return jsonify({"error": f"Function create_{entity_type} not found"}), 400
 
-    results, execution_time = create_function(nb_entities)
+    command = f"insert_{entity_type}" if mode == "default" else f"insert_{entity_type}_{mode}"
+
+    if background:
+        try:
+            db.check_insert_mode(mode, batch_size, commit_interval)
+            chunk_size = int(data.get("chunk_size", batch_size * commit_interval))
+            if chunk_size < 1:
+                raise ValueError("chunk_size doit être supérieur à 0.")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Achats : le total (utilisateurs parcourus) est fixé au démarrage du job
+        job = jobs.submit(Job(db_target, command, {
+            "action": "create",
+            "entity": entity_type,
+            "mode": mode,
+            "batch_size": batch_size,
+            "commit_interval": commit_interval
+        }, total=nb_entities if entity_type != "achats" else None, chunk_size=chunk_size))
+        return jsonify({"job": job.to_dict()}), 202
+
+    try:
+        results, execution_time = create_function(nb_entities, mode=mode, batch_size=batch_size,
+                                                   commit_interval=commit_interval)
+    except ValueError as e:
+        invalidate(db_target, failed=True)
+        return jsonify({"error": str(e)}), 400
+    except BaseException:
+        invalidate(db_target, failed=True)
+        raise
+    invalidate(db_target)
 
     return jsonify({
         "results": results,
-        "command_history": add_to_history(db_target, f"insert_{entity_type}",
+        "command_history": add_to_history(db_target, command,
                                           nb_entities if entity_type != "achats" else 0, round(execution_time, 3))
     })
 
@@ -57,11 +246,8 @@ def select_entities(entity_type):
     nb_entities = int(data.get(f"nb_entities", 1))
     db_target = data.get("db_target")
 
-    if db_target == "postgres":
-        db = postgres_db
-    elif db_target == "neo4j":
-        db = neo4j_db
-    else:
+    db = databases.get(db_target)
+    if db is None:
         return jsonify({"error": "Invalid database target"}), 400
 
     select_function = getattr(db, f"select_{entity_type}", None)
@@ -69,14 +255,69 @@ def select_entities(entity_type):
     if not select_function:
         return jsonify({"error": f"Function select_{entity_type} not found"}), 400
 
-    results, execution_time = select_function(nb_entities)
+    try:
+        results, execution_time = select_function(nb_entities, data.get("sampling", "uniform"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     return jsonify({
         "results": results,
-        "command_history": add_to_history(db_target, f"select_{entity_type}", nb_entities, round(execution_time, 3))
+        "command_history": add_to_history(db_target, f"select_{entity_type}", nb_entities, round(execution_time, 3),
+                                          timing_phases(execution_time))
     })
 
 
+def query_results(db_target, db, command, method, *params, semantics=None, nb_entities=0):
+    # Les résultats servis depuis le cache sont historisés sous une commande distincte
+    try:
+        if request.json.get("cache", True):
+            results, execution_time, cache = query_cache.call(db_target, db, method, *params)
+        else:
+            results, execution_time = getattr(db, method)(*params)
+            cache = None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if cache and cache["hit"]:
+        command = f"{command}_cached"
+
+    response = {
+        "results": results,
+        "command_history": add_to_history(db_target, command, nb_entities, round(execution_time, 3),
+                                          timing_phases(execution_time)),
+        "cache": cache
+    }
+    if semantics:
+        response["semantics"] = semantics
+
+    return jsonify(response)
+
+
+def traversal_semantics(data):
+    # "path" : un follower compte une fois par chemin, "distinct" : une fois par utilisateur
+    distinct = data.get("semantics", "path") == "distinct"
+    return distinct, "distinct" if distinct else "path", "_distinct" if distinct else ""
+
+
+def stream_results(db_target, command, rows):
+    # Une ligne JSON par résultat, l'entrée d'historique arrive en dernière ligne une fois le flux terminé
+    def generate():
+        start_ns = time.perf_counter_ns()
+        first_row = None
+        for row in rows:
+            if first_row is None:
+                first_row = elapsed_ms(start_ns)
+            yield json.dumps(row, default=str) + "\n"
+        execution_time = elapsed_ms(start_ns)
+
+        phases = {"first_row": round(first_row if first_row is not None else execution_time, 3)}
+        yield json.dumps({
+            "command_history": add_to_history(db_target, f"{command}_stream", 0, round(execution_time, 3), phases)
+        }) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
 @app.route('/create_users', methods=["POST"])
 def create_users():
     return create_entities("users")
@@ -107,17 +348,17 @@ def db_size():
     data = request.json
     db_target = data.get("db_target")
 
-    if db_target == "postgres":
-        db = postgres_db
-    elif db_target == "neo4j":
-        db = neo4j_db
-    else:
+    db = databases.get(db_target)
+    if db is None:
         return jsonify({"error": "Invalid database target"}), 400
 
-    size, execution_time = db.db_size()
+    # Le mode approché (statistiques du moteur) est historisé sous une commande distincte
+    exact = bool(data.get("exact", False))
+    size, execution_time = db.db_size(exact)
+    command = "db_size" if exact else "db_size_approx"
 
     return jsonify({
-        "command_history": add_to_history(db_target, "db_size", 0, round(execution_time, 3)),
+        "command_history": add_to_history(db_target, command, 0, round(execution_time, 3), timing_phases(execution_time)),
         "size": size
     })
 
@@ -127,14 +368,16 @@ def clear_db():
     data = request.json
     db_target = data.get("db_target")
 
-    if db_target == "postgres":
-        db = postgres_db
-    elif db_target == "neo4j":
-        db = neo4j_db
-    else:
+    db = databases.get(db_target)
+    if db is None:
         return jsonify({"error": "Invalid database target"}), 400
 
+    if data.get("background", True):
+        job = jobs.submit(Job(db_target, "clear_db", {"action": "clear"}))
+        return jsonify({"job": job.to_dict()}), 202
+
     execution_time = execute_with_timer(db.clear_db)
+    invalidate(db_target)
 
     return jsonify({
         "result": f"Base de données {db_target} réinitialisée",
@@ -142,6 +385,135 @@ def clear_db():
     })
 
 
+@app.route('/generator', methods=["POST"])
+def configure_generator():
+    # Même graine et même modèle sur une base vide, puis mêmes commandes : le même graphe, identifiants compris,
+    # sur chaque backend. La configuration est écrite pour tous les workers, qui l'appliquent à leur prochaine
+    # génération
+    data = request.json
+    db = databases.get(data.get("db_target"))
+    if db is None or getattr(db, "generator", None) is None:
+        return jsonify({"error": "Invalid database target"}), 400
+
+    try:
+        db.generator.share(db.generator_config, data.get("model"), data.get("seed"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"generator": db.generator.stats()})
+
+
+@app.route('/snapshots', methods=["GET"])
+def snapshots():
+    return jsonify(list_snapshots())
+
+
+@app.route('/snapshot/<action>', methods=["POST"])
+def snapshot(action):
+    # export : la base cible est écrite dans un snapshot ; import : le snapshot remplace son contenu
+    if action not in ("export", "import"):
+        return jsonify({"error": f"Action inconnue : {action}"}), 400
+
+    data = request.json
+    db_target = data.get("db_target")
+    if databases.get(db_target) is None:
+        return jsonify({"error": "Invalid database target"}), 400
+    try:
+        snapshot_path(data.get("name"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job = jobs.submit(Job(db_target, f"snapshot_{action}_{data['name']}",
+                          {"action": f"snapshot_{action}", "name": data["name"]}))
+    return jsonify({"job": job.to_dict()}), 202
+
+
+@app.route('/jobs', methods=["GET"])
+def list_jobs():
+    return jsonify([job.to_dict() for job in jobs.list()])
+
+
+@app.route('/jobs/<job_id>', methods=["GET"])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job inconnu"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route('/jobs/<job_id>/cancel', methods=["POST"])
+def cancel_job(job_id):
+    # L'annulation prend effet à la prochaine frontière de commit
+    try:
+        return jsonify(jobs.cancel(job_id).to_dict())
+    except KeyError:
+        return jsonify({"error": "Job inconnu"}), 404
+
+
+@app.route('/jobs/<job_id>/resume', methods=["POST"])
+def resume_job(job_id):
+    try:
+        return jsonify(jobs.resume(job_id).to_dict()), 202
+    except KeyError:
+        return jsonify({"error": "Job inconnu"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/refresh_aggregates', methods=["POST"])
+def refresh_aggregates():
+    data = request.json
+    db_target = data.get("db_target")
+
+    db = databases.get(db_target)
+    if db is None:
+        return jsonify({"error": "Invalid database target"}), 400
+
+    execution_time = db.refresh_aggregates()
+    invalidate(db_target)
+
+    return jsonify({
+        "result": f"Agrégats {db_target} recalculés",
+        "command_history": add_to_history(db_target, "refresh_aggregates", 0, round(execution_time, 3))
+    })
+
+
+@app.route('/memory/load', methods=["POST"])
+def load_memory():
+    data = request.json
+    source = data.get("source")
+
+    if source == "memory" or databases.get(source) is None:
+        return jsonify({"error": "Invalid database source"}), 400
+
+    size, execution_time = databases.get("memory").load_from(databases.get(source))
+    invalidate("memory")
+
+    return jsonify({
+        "size": size,
+        "command_history": add_to_history("memory", f"load_{source}", size["nb_utilisateurs"],
+                                          round(execution_time, 3))
+    })
+
+
+@app.route('/health', methods=["GET"])
+def health():
+    # Sonde de disponibilité : 503 tant qu'une des bases demandées (toutes par défaut) ne répond pas
+    targets = request.args.getlist("db_target") or databases.targets()
+    if any(target not in databases.targets() for target in targets):
+        return jsonify({"error": "Invalid database target"}), 400
+
+    backends = {target: databases.health(target) for target in targets}
+    ready = all(backend["status"] == "ok" for backend in backends.values())
+    status = 200 if ready else 503
+    return jsonify({"status": "ok" if ready else "unavailable", "pid": os.getpid(), "backends": backends}), status
+
+
+@app.route('/pool', methods=["GET"])
+def pool_stats():
+    return jsonify({"postgres": databases.get("postgres").pool_stats()})
+
+
 @app.route('/clear_history', methods=["POST"])
 def clearHistory():
     clear_history()
@@ -153,19 +525,18 @@ def requestGlobalFollows():
     data = request.json
     db_target = data.get("db_target")
 
-    if db_target == "postgres":
-        db = postgres_db
-    elif db_target == "neo4j":
-        db = neo4j_db
-    else:
+    db = databases.get(db_target)
+    if db is None:
         return jsonify({"error": "Invalid database target"}), 400
 
-    results, execution_time = db.requestGlobalFollows()
+    exact = bool(data.get("exact", False))
+    command = "nb_followers_exact" if exact else "nb_followers"
 
-    return jsonify({
-        "results": results,
-        "command_history": add_to_history(db_target, "nb_followers", 0, round(execution_time, 3))
-    })
+    if data.get("stream"):
+        return stream_results(db_target, command, db.streamGlobalFollows(exact))
+
+    # limit / cursor : une page à la fois, la suite se demande avec le next_cursor renvoyé
+    return query_results(db_target, db, command, "requestGlobalFollows", exact, data.get("limit"), data.get("cursor"))
 
 
 @app.route('/request/global/achats', methods=["POST"])
@@ -173,19 +544,18 @@ def requestGlobalAchatsByProduit():
     data = request.json
     db_target = data.get("db_target")
 
-    if db_target == "postgres":
-        db = postgres_db
-    elif db_target == "neo4j":
-        db = neo4j_db
-    else:
+    db = databases.get(db_target)
+    if db is None:
         return jsonify({"error": "Invalid database target"}), 400
 
-    results, execution_time = db.requestGlobalAchatsByProduit()
+    exact = bool(data.get("exact", False))
+    command = "nb_achats_exact" if exact else "nb_achats"
 
-    return jsonify({
-        "results": results,
-        "command_history": add_to_history(db_target, "nb_achats", 0, round(execution_time, 3))
-    })
+    if data.get("stream"):
+        return stream_results(db_target, command, db.streamGlobalAchatsByProduit(exact))
+
+    return query_results(db_target, db, command, "requestGlobalAchatsByProduit", exact, data.get("limit"),
+                         data.get("cursor"))
 
 
 @app.route('/request/specific/1', methods=["POST"])
@@ -194,21 +564,14 @@ def requestSpecific1():
     db_target = data.get("db_target")
     user_id = data.get("user_id")
     deep_level = data.get("deep_level")
+    distinct, semantics, suffix = traversal_semantics(data)
 
-    if db_target == "postgres":
-        db = postgres_db
-    elif db_target == "neo4j":
-        db = neo4j_db
-    else:
+    db = databases.get(db_target)
+    if db is None:
         return jsonify({"error": "Invalid database target"}), 400
 
-    results, execution_time = db.requestSpecific1(user_id, deep_level)
-
-    return jsonify({
-        "results": results,
-        "command_history": add_to_history(db_target, "nb_achats_produits_deep" + deep_level, 0,
-                                          round(execution_time, 3))
-    })
+    return query_results(db_target, db, f"nb_achats_produits_deep{deep_level}{suffix}", "requestSpecific1",
+                         user_id, deep_level, distinct, data.get("limit"), data.get("cursor"), semantics=semantics)
 
 
 @app.route('/request/specific/2', methods=["POST"])
@@ -218,21 +581,14 @@ def requestSpecific2():
     user_id = data.get("user_id")
     product_id = data.get("product_id")
     deep_level = data.get("deep_level")
+    distinct, semantics, suffix = traversal_semantics(data)
 
-    if db_target == "postgres":
-        db = postgres_db
-    elif db_target == "neo4j":
-        db = neo4j_db
-    else:
+    db = databases.get(db_target)
+    if db is None:
         return jsonify({"error": "Invalid database target"}), 400
 
-    results, execution_time = db.requestSpecific2(user_id, product_id, deep_level)
-
-    return jsonify({
-        "results": results,
-        "command_history": add_to_history(db_target, "nb_achats_produit_unique_deep" + deep_level, 0,
-                                          round(execution_time, 3))
-    })
+    return query_results(db_target, db, f"nb_achats_produit_unique_deep{deep_level}{suffix}", "requestSpecific2",
+                         user_id, product_id, deep_level, distinct, semantics=semantics)
 
 
 @app.route('/request/specific/3', methods=["POST"])
@@ -241,17 +597,62 @@ def requestSpecific3():
     db_target = data.get("db_target")
     product_id = data.get("product_id")
     deep_level = data.get("deep_level")
+    distinct, semantics, suffix = traversal_semantics(data)
 
-    if db_target == "postgres":
-        db = postgres_db
-    elif db_target == "neo4j":
-        db = neo4j_db
-    else:
+    db = databases.get(db_target)
+    if db is None:
         return jsonify({"error": "Invalid database target"}), 400
 
-    results, execution_time = db.requestSpecific3(product_id, deep_level)
+    return query_results(db_target, db, f"viralité_produits_deep{deep_level}{suffix}", "requestSpecific3",
+                         product_id, deep_level, distinct, semantics=semantics)
 
-    return jsonify({
-        "results": results,
-        "command_history": add_to_history(db_target, "viralité_produits_deep" + deep_level, 0, round(execution_time, 3))
-    })
+
+# Variantes multi-ancres : une liste d'identifiants, un seul aller-retour, résultats indexés par ancre
+@app.route('/request/specific/1/batch', methods=["POST"])
+def requestSpecific1Batch():
+    data = request.json
+    db_target = data.get("db_target")
+    user_ids = data.get("user_ids")
+    deep_level = data.get("deep_level")
+    distinct, semantics, suffix = traversal_semantics(data)
+
+    db = databases.get(db_target)
+    if db is None:
+        return jsonify({"error": "Invalid database target"}), 400
+
+    return query_results(db_target, db, f"nb_achats_produits_deep{deep_level}{suffix}_batch", "requestSpecific1Batch",
+                         user_ids, deep_level, distinct, semantics=semantics, nb_entities=len(user_ids or []))
+
+
+@app.route('/request/specific/2/batch', methods=["POST"])
+def requestSpecific2Batch():
+    data = request.json
+    db_target = data.get("db_target")
+    user_ids = data.get("user_ids")
+    product_id = data.get("product_id")
+    deep_level = data.get("deep_level")
+    distinct, semantics, suffix = traversal_semantics(data)
+
+    db = databases.get(db_target)
+    if db is None:
+        return jsonify({"error": "Invalid database target"}), 400
+
+    return query_results(db_target, db, f"nb_achats_produit_unique_deep{deep_level}{suffix}_batch",
+                         "requestSpecific2Batch", user_ids, product_id, deep_level, distinct, semantics=semantics,
+                         nb_entities=len(user_ids or []))
+
+
+@app.route('/request/specific/3/batch', methods=["POST"])
+def requestSpecific3Batch():
+    data = request.json
+    db_target = data.get("db_target")
+    product_ids = data.get("product_ids")
+    deep_level = data.get("deep_level")
+    distinct, semantics, suffix = traversal_semantics(data)
+
+    db = databases.get(db_target)
+    if db is None:
+        return jsonify({"error": "Invalid database target"}), 400
+
+    return query_results(db_target, db, f"viralité_produits_deep{deep_level}{suffix}_batch", "requestSpecific3Batch",
+                         product_ids, deep_level, distinct, semantics=semantics, nb_entities=len(product_ids or []))
@@ -0,0 +1,187 @@
+import argparse
+import csv
+import json
+import sys
+import time
+
+from app.utils import add_to_history, elapsed_ms, percentile
+
+QUERIES = {
+    "specific1": ("requestSpecific1", "nb_achats_produits_deep"),
+    "specific2": ("requestSpecific2", "nb_achats_produit_unique_deep"),
+    "specific3": ("requestSpecific3", "viralité_produits_deep"),
+    "global_follows": ("requestGlobalFollows", "nb_followers"),
+    "global_achats": ("requestGlobalAchatsByProduit", "nb_achats")
+}
+
+COLUMNS = ("db_target", "query", "depth", "semantics", "cache", "plan_cache_mode", "samples", "repetitions",
+           "p50", "p90", "p99", "max", "mean", "rows", "throughput", "phases")
+
+
+def create_backend(db_target, memory_source=None):
+    if db_target == "postgres":
+        from app.db.postgres_db import PostgresDB
+        return PostgresDB()
+    if db_target == "neo4j":
+        from app.db.neo4j_db import Neo4jDB
+        return Neo4jDB()
+    if db_target == "memory":
+        from app.db.memory_db import MemoryDB
+        db = MemoryDB()
+        if memory_source:
+            db.load_from(create_backend(memory_source))
+        return db
+    raise ValueError(f"Base de données inconnue : {db_target}")
+
+
+def sample_ids(db, nb_samples):
+    users, _ = db.select_users(nb_samples)
+    produits, _ = db.select_produits(nb_samples)
+    if not users or not produits:
+        raise ValueError("Pas assez d'utilisateurs ou de produits pour échantillonner.")
+
+    # Autant de couples (utilisateur, produit) que demandé, en bouclant si la base est plus petite
+    return [(users[i % len(users)]["id"], produits[i % len(produits)]["id"]) for i in range(nb_samples)]
+
+
+def query_params(query, depth, user_id, product_id, distinct):
+    if query == "specific1":
+        return user_id, depth, distinct
+    if query == "specific2":
+        return user_id, product_id, depth, distinct
+    if query == "specific3":
+        return product_id, depth, distinct
+    return ()
+
+
+def run_scenario(db, query, depth, samples, args):
+    method = getattr(db, QUERIES[query][0])
+    distinct = args.semantics == "distinct"
+
+    if args.cache == "warm":
+        for i in range(args.warmup):
+            method(*query_params(query, depth, *samples[i % len(samples)], distinct))
+
+    timings = []
+    phases = {}
+    rows = 0
+    start_ns = time.perf_counter_ns()
+    for repetition in range(args.repetitions):
+        for user_id, product_id in samples:
+            if args.cache == "cold":
+                db.clear_caches()
+            results, execution_time = method(*query_params(query, depth, user_id, product_id, distinct))
+            timings.append(execution_time)
+            for phase, duration in getattr(execution_time, "phases", {}).items():
+                phases.setdefault(phase, []).append(duration)
+            rows += len(results) if isinstance(results, list) else 1
+    total_time = elapsed_ms(start_ns) / 1000
+
+    return {
+        "p50": round(percentile(timings, 50), 3),
+        "p90": round(percentile(timings, 90), 3),
+        "p99": round(percentile(timings, 99), 3),
+        "max": round(max(timings), 3),
+        "mean": round(sum(timings) / len(timings), 3),
+        "rows": rows,
+        "throughput": round(len(timings) / total_time, 3) if total_time else None,
+        # p50 de chaque phase, pour voir où part le temps d'un backend à l'autre
+        "phases": {phase: round(percentile(durations, 50), 3) for phase, durations in phases.items()}
+    }
+
+
+def run(args):
+    results = []
+    for db_target in args.backends:
+        db = create_backend(db_target, args.memory_source)
+        samples = sample_ids(db, args.samples)
+
+        # Plans génériques ou personnalisés des requêtes préparées : PostgreSQL uniquement
+        plan_cache_modes = [None]
+        if db_target == "postgres":
+            db.prepared = not args.simple_statements
+            if args.plan_cache_modes and db.prepared:
+                plan_cache_modes = args.plan_cache_modes
+
+        for plan_cache_mode in plan_cache_modes:
+            if plan_cache_mode:
+                db.set_plan_cache_mode(plan_cache_mode)
+
+            for query in args.queries:
+                # Les requêtes globales ne dépendent ni de la profondeur ni des identifiants
+                specific = query.startswith("specific")
+                for depth in args.depths if specific else [None]:
+                    scenario = {
+                        "db_target": db_target,
+                        "query": query,
+                        "depth": depth,
+                        "semantics": args.semantics if specific else None,
+                        "cache": args.cache,
+                        "plan_cache_mode": plan_cache_mode,
+                        "samples": len(samples) if specific else 1,
+                        "repetitions": args.repetitions
+                    }
+                    scenario.update(run_scenario(db, query, depth, samples if specific else samples[:1], args))
+                    results.append(scenario)
+                    print(f"{db_target} {query} {depth or ''} {plan_cache_mode or ''} p50={scenario['p50']} ms",
+                          file=sys.stderr)
+
+                    if args.history:
+                        command = QUERIES[query][1] + (str(depth) if specific else "")
+                        add_to_history(db_target, f"bench_{command}", scenario["rows"], scenario["p50"])
+
+    return results
+
+
+def write_results(results, output_format, output):
+    if output_format == "csv":
+        writer = csv.DictWriter(output, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows({**result, "phases": json.dumps(result["phases"])} for result in results)
+    else:
+        json.dump(results, output, indent=2, ensure_ascii=False)
+        output.write("\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark répétable des requêtes analytiques")
+    parser.add_argument("--backends", type=lambda value: value.split(","), default=["postgres", "neo4j"])
+    parser.add_argument("--queries", type=lambda value: value.split(","), default=list(QUERIES))
+    parser.add_argument("--depths", type=lambda value: [int(depth) for depth in value.split(",")],
+                        default=[3, 4, 5])
+    parser.add_argument("--samples", type=int, default=10, help="nombre d'identifiants tirés par base")
+    parser.add_argument("--warmup", type=int, default=5, help="exécutions ignorées avant la mesure (cache warm)")
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--cache", choices=("warm", "cold"), default="warm",
+                        help="cold purge les caches de plans avant chaque exécution")
+    parser.add_argument("--semantics", choices=("path", "distinct"), default="path")
+    parser.add_argument("--plan-cache-modes", type=lambda value: value.split(","),
+                        help="modes plan_cache_mode PostgreSQL à comparer (auto,force_generic_plan,force_custom_plan)")
+    parser.add_argument("--simple-statements", action="store_true",
+                        help="envoie le texte SQL à chaque appel au lieu des requêtes préparées (PostgreSQL)")
+    parser.add_argument("--memory-source", choices=("postgres", "neo4j"),
+                        help="base à charger dans le backend mémoire")
+    parser.add_argument("--format", choices=("json", "csv"), default="json")
+    parser.add_argument("--output", help="fichier de sortie (stdout par défaut)")
+    parser.add_argument("--history", action="store_true", help="ajoute le p50 de chaque scénario à l'historique")
+
+    args = parser.parse_args(argv)
+    unknown = set(args.queries) - set(QUERIES)
+    if unknown:
+        parser.error(f"requêtes inconnues : {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            write_results(results, args.format, f)
+    else:
+        write_results(results, args.format, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
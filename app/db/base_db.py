@@ -1,12 +1,136 @@
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
 
 from faker import Faker
 
+from app.utils import elapsed_ms
+
 fake = Faker()
 
+INSERT_MODES = ("default", "bulk", "parallel")
+SAMPLING_MODES = ("uniform", "fast")
+BATCH_SIZE = 10000
+COMMIT_INTERVAL = 1
+MAX_DEEP_LEVEL = 10
+MAX_BATCH_IDS = 10000
+MAX_PAGE_SIZE = 10000
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+# Lignes écrites par entité créée : 10 follows en moyenne par utilisateur, 2.5 achats par utilisateur parcouru
+ROWS_PER_ENTITY = {"users": 11, "produits": 1, "achats": 2.5}
+
+_partition_backends = {}
+_parent_backends = {}
+# Un seul fork à la fois par processus : deux jobs du même worker ne mélangent pas leurs backends parents
+_fork_lock = threading.Lock()
+# File héritée par les processus du pool : chaque commit d'une partition y remonte (étape, identifiants)
+_progress_queue = None
+
+
+def run_partition(backend_class, method, seed, *args):
+    # Exécuté dans un processus fils : il ouvre ses propres connexions, jamais celles héritées du parent
+    backend = _partition_backends.get(backend_class)
+    if backend is None:
+        # Après un fork, tous les fils partent du même état aléatoire que le parent
+        random.seed()
+        fake.seed_instance()
+        backend = _partition_backends[backend_class] = backend_class()
+
+    # Le générateur du parent est hérité par le fork avec son registre d'identifiants : aucune relecture en base.
+    # Chaque partition reçoit sa propre graine, dérivée de celle du parent
+    parent = _parent_backends.get(backend_class)
+    if getattr(parent, "generator", None) is not None:
+        backend.generator = parent.generator
+        backend.generator.registry.lock = threading.Lock()
+        backend.generator.configure(parent.generator.model, seed)
+    if _progress_queue is not None:
+        progress = _progress_queue
+        return getattr(backend, method)(*args, checkpoint=lambda stage, ids: progress.put((stage, ids)))
+    return getattr(backend, method)(*args)
+
+
+def split_count(count, parts):
+    return [count // parts + (1 if i < count % parts else 0) for i in range(parts)]
+
+
+def split_list(items, parts):
+    return [items[i * len(items) // parts:(i + 1) * len(items) // parts] for i in range(parts)]
+
+
+class CommitProgress:
+    # Appelé après chaque commit avec la dernière ligne validée, puis sans ligne à la fin : transmet au checkpoint
+    # du job les entités désormais complètes. Les lignes arrivent groupées par entité, dans l'ordre de ids ; une
+    # entité à plusieurs lignes (follows, achats d'un utilisateur) n'est complète qu'une fois la suivante commencée
+    def __init__(self, checkpoint, stage, ids, key=lambda row: row[0], single_row=False):
+        self.checkpoint = checkpoint
+        self.stage = stage
+        # Sans checkpoint, ids n'est pas parcouru : il peut dériver des lignes elles-mêmes
+        self.ids = list(ids) if checkpoint else []
+        self.key = key
+        self.single_row = single_row
+        self.position = {entity_id: i for i, entity_id in enumerate(self.ids)}
+        self.done = 0
+
+    def __call__(self, last_row=None):
+        if self.checkpoint is None:
+            return
+        end = len(self.ids) if last_row is None else self.position[self.key(last_row)] + self.single_row
+        if end > self.done:
+            self.checkpoint(self.stage, self.ids[self.done:end])
+            self.done = end
+
+
+class GeneratedBackend(ABC):
+    # Backends dont les données viennent du générateur de graphe (self.generator) et de son registre d'identifiants.
+    # État partagé entre workers, branché par l'application : génération des écritures (celle du cache de requêtes)
+    # et configuration du générateur. Sans lui (scripts, partitions parallèles), le registre n'est lu qu'une fois
+    generation_source = None
+    generator_config = None
+
+    def share_state(self, generation_source, generator_config):
+        self.generation_source = generation_source
+        self.generator_config = generator_config
+
+    def generation(self):
+        return self.generation_source() if self.generation_source is not None else 0
+
+    @abstractmethod
+    def read_registry(self):
+        # Couples (id, degré) des utilisateurs et des produits
+        pass
+
+    def id_registry(self):
+        # Relu depuis la base au premier usage puis dès qu'un autre processus y a écrit (génération changée) ;
+        # entre-temps tenu à jour par les insertions de ce processus
+        if self.generator_config is not None:
+            self.generator.sync(self.generator_config)
+        registry = self.generator.registry
+        generation = self.generation()
+        if not registry.loaded or registry.generation != generation:
+            # Génération lue avant la base : une écriture concurrente à la lecture provoquera un nouveau chargement
+            users, produits = self.read_registry()
+            registry.load(users, produits, generation)
+        return registry
+
+    def start_generation(self):
+        # Début d'une création : registre à jour et nouvelle position dans le flux de la graine
+        registry = self.id_registry()
+        self.generator.next_stream(self.generator_config)
+        return registry
+
+    def user_ids(self):
+        registry = self.id_registry()
+        with registry.lock:
+            return sorted(registry.users)
 
-class base_db(ABC):
 
+class base_db(ABC):
     @abstractmethod
     def init_db(self):
         pass
@@ -16,45 +140,225 @@ class base_db(ABC):
         pass
 
     @abstractmethod
-    def create_users(self, num_users):
+    def ping(self):
+        pass
+
+    # checkpoint(étape, identifiants) est appelé après chaque commit : "users" puis "follows" pour les utilisateurs,
+    # "produits", "achats" pour les utilisateurs dont les achats sont validés. C'est le point de reprise des jobs
+    @abstractmethod
+    def create_users(self, num_users, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                     checkpoint=None):
+        pass
+
+    @abstractmethod
+    def create_follows(self, user_ids, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                       checkpoint=None):
+        # Follows d'utilisateurs déjà validés, sans doublon avec ceux qui existent : reprise d'un job interrompu
+        pass
+
+    @abstractmethod
+    def create_produits(self, num_produits, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                        checkpoint=None):
+        pass
+
+    @abstractmethod
+    def create_achats(self, num_achats, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                      user_ids=None, checkpoint=None):
+        # user_ids : utilisateurs dont on génère les achats, tous par défaut
+        pass
+
+    @staticmethod
+    def check_insert_mode(mode, batch_size, commit_interval):
+        if mode not in INSERT_MODES:
+            raise ValueError(f"Mode d'insertion inconnu : {mode}")
+        if batch_size < 1 or commit_interval < 1:
+            raise ValueError("batch_size et commit_interval doivent être positifs")
+
+    @abstractmethod
+    def user_ids(self):
+        # Utilisateurs triés par identifiant : un job d'achats s'y découpe en plages
+        pass
+
+    @staticmethod
+    def estimated_rows(entity_type, count):
+        return int(count * ROWS_PER_ENTITY.get(entity_type, 1))
+
+    @contextmanager
+    def bulk_load(self, estimated_rows):
+        # Rien à différer par défaut : seul PostgreSQL retire ses index le temps d'un chargement massif
+        yield {"deferred": False, "execution_time": 0}
+
+    def run_partitions(self, method, partitions, checkpoint=None):
+        # fork plutôt que spawn : le processus fils hérite du registre d'identifiants complet, qu'il faudrait sinon
+        # sérialiser vers chaque partition. Sous gunicorn gthread, le fork part d'un processus multi-threadé : le fils
+        # ne reçoit que le thread appelant, et tout verrou tenu par un autre thread y resterait pris. Le fils n'utilise
+        # donc que des verrous recréés après le fork (registres, historique, jobs : register_at_fork, registre
+        # d'identifiants : run_partition) et ses propres connexions ; le verrou du registre est tenu pendant le fork
+        # pour qu'aucun thread ne soit en train de le modifier
+        global _progress_queue
+        start_ns = time.perf_counter_ns()
+        generator = getattr(self, "generator", None)
+        seeds = generator.partition_seeds(len(partitions)) if generator else [None] * len(partitions)
+        registry_lock = generator.registry.lock if generator else nullcontext()
+        context = multiprocessing.get_context("fork")
+        progress = context.Queue() if checkpoint is not None else None
+        executor = ProcessPoolExecutor(max_workers=len(partitions), mp_context=context)
+        try:
+            with executor:
+                # Avec fork, tous les processus du pool sont créés à la première soumission
+                with _fork_lock, registry_lock:
+                    _parent_backends[type(self)] = self
+                    _progress_queue = progress
+                    futures = [executor.submit(run_partition, type(self), method, seed, *args)
+                               for seed, args in zip(seeds, partitions)]
+                    _progress_queue = None
+                # Commits des partitions relayés au fil de l'eau, par ce thread : le job les sauvegarde comme les siens
+                while progress is not None and not all(future.done() for future in futures):
+                    try:
+                        checkpoint(*progress.get(timeout=0.1))
+                    except queue.Empty:
+                        pass
+                results = [future.result() for future in futures]
+        finally:
+            # Processus terminés, y compris en cas d'échec : leurs derniers commits sont tous dans la file
+            if progress is not None:
+                while True:
+                    try:
+                        checkpoint(*progress.get_nowait())
+                    except queue.Empty:
+                        break
+                progress.close()
+        return results, elapsed_ms(start_ns)
+
+    @staticmethod
+    def partition_stats(partitions, wall_time):
+        # partitions : (lignes, temps base) par processus ; le débit combiné se mesure sur le temps mur
+        rows = sum(nb_rows for nb_rows, _ in partitions)
+        return {
+            "rows": rows,
+            "wall_time": round(wall_time, 3),
+            "rows_per_second": round(rows / wall_time * 1000, 1) if wall_time else None,
+            "partitions": [{"rows": nb_rows, "execution_time": round(execution_time, 3)}
+                           for nb_rows, execution_time in partitions]
+        }
+
+    @staticmethod
+    def check_deep_level(max_level):
+        max_level = int(max_level)
+        if not 1 <= max_level <= MAX_DEEP_LEVEL:
+            raise ValueError(f"La profondeur doit être comprise entre 1 et {MAX_DEEP_LEVEL}")
+        return max_level
+
+    @staticmethod
+    def check_batch_ids(ids):
+        # Doublons retirés en gardant l'ordre : chaque ancre n'est parcourue qu'une fois
+        if not isinstance(ids, (list, tuple)) or not ids:
+            raise ValueError("La liste d'identifiants doit être non vide")
+        ids = list(dict.fromkeys(str(value) for value in ids))
+        if len(ids) > MAX_BATCH_IDS:
+            raise ValueError(f"Au plus {MAX_BATCH_IDS} identifiants par requête")
+        return ids
+
+    @staticmethod
+    def group_by_anchor(anchors, rows):
+        # rows : couples (ancre, ligne) ; une ancre sans résultat garde une liste vide
+        results = {anchor: [] for anchor in anchors}
+        for anchor, row in rows:
+            results[str(anchor)].append(row)
+        return results
+
+    @staticmethod
+    def check_page(limit, cursor):
+        # Jeton de continuation "compte:identifiant" : la dernière ligne servie dans l'ordre total
+        # (compte décroissant, identifiant croissant)
+        limit = int(limit)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit doit être compris entre 1 et {MAX_PAGE_SIZE}")
+        if cursor is None:
+            return limit, None
+        count, separator, last_id = str(cursor).partition(":")
+        if not separator or not count.isdigit():
+            raise ValueError(f"Curseur invalide : {cursor}")
+        return limit, (int(count), last_id)
+
+    @staticmethod
+    def page(rows, limit, count_key, id_key):
+        # Le moteur renvoie une ligne de plus que la page : elle indique seulement qu'il reste une suite
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f"{last[count_key]}:{last[id_key]}"
+        return {"results": rows[:limit], "next_cursor": next_cursor}
+
+    @abstractmethod
+    def export_rows(self, entity):
+        pass
+
+    @abstractmethod
+    def import_snapshot(self, snapshot, batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL):
+        pass
+
+    @abstractmethod
+    def clear_caches(self):
+        pass
+
+    @staticmethod
+    def check_sampling(sampling):
+        if sampling not in SAMPLING_MODES:
+            raise ValueError(f"Mode d'échantillonnage inconnu : {sampling}")
+
+    @abstractmethod
+    def select_users(self, num_users, sampling="uniform"):
+        pass
+
+    @abstractmethod
+    def select_produits(self, num_produits, sampling="uniform"):
+        pass
+
+    @abstractmethod
+    def db_size(self, exact=False):
+        pass
+
+    @abstractmethod
+    def refresh_aggregates(self):
         pass
 
     @abstractmethod
-    def create_produits(self, num_produits):
+    def requestGlobalFollows(self, exact=False, limit=None, cursor=None):
         pass
 
     @abstractmethod
-    def create_achats(self, num_achats):
+    def requestGlobalAchatsByProduit(self, exact=False, limit=None, cursor=None):
         pass
 
     @abstractmethod
-    def select_users(self, num_users):
+    def streamGlobalFollows(self, exact=False):
         pass
 
     @abstractmethod
-    def select_produits(self, num_produits):
+    def streamGlobalAchatsByProduit(self, exact=False):
         pass
 
     @abstractmethod
-    def db_size(self):
+    def requestSpecific1(self, user_id, max_level=3, distinct=False, limit=None, cursor=None):
         pass
 
     @abstractmethod
-    def requestGlobalFollows(self):
+    def requestSpecific2(self, user_id, product_id, max_level=3, distinct=False):
         pass
 
     @abstractmethod
-    def requestGlobalAchatsByProduit(self):
+    def requestSpecific3(self, product_id, max_level=3, distinct=False):
         pass
 
     @abstractmethod
-    def requestSpecific1(self, user_id, max_level=3):
+    def requestSpecific1Batch(self, user_ids, max_level=3, distinct=False):
         pass
 
     @abstractmethod
-    def requestSpecific2(self, user_id, product_id, max_level=3):
+    def requestSpecific2Batch(self, user_ids, product_id, max_level=3, distinct=False):
         pass
 
     @abstractmethod
-    def requestSpecific3(self, product_id, max_level=3):
+    def requestSpecific3Batch(self, product_ids, max_level=3, distinct=False):
         pass
@@ -0,0 +1,236 @@
+import fcntl
+import json
+import os
+import random
+import threading
+import uuid
+from datetime import datetime
+
+from faker import Faker
+
+GRAPH_MODELS = ("uniform", "powerlaw", "community")
+NB_COMMUNITIES = 20
+COMMUNITY_AFFINITY = 0.9
+
+
+class IdRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+        self.loaded = False
+        # Génération partagée (celle du cache de requêtes) de la base au moment de la lecture
+        self.generation = None
+
+    def reset(self):
+        self.loaded = True
+        self.users = []
+        self.produits = []
+        # Un identifiant y figure une fois, plus une fois par arête reçue : un tirage uniforme dans cette liste
+        # est un tirage proportionnel au degré + 1, en O(1) (attachement préférentiel)
+        self.user_weights = []
+        self.produit_weights = []
+        self.user_communities = [[] for _ in range(NB_COMMUNITIES)]
+        self.produit_communities = [[] for _ in range(NB_COMMUNITIES)]
+        self.user_community = {}
+
+    def load(self, users, produits, generation=None):
+        # users, produits : couples (id, degré) relus depuis la base
+        with self.lock:
+            self.reset()
+            for user_id, degree in users:
+                self.add_user(str(user_id), degree or 0)
+            for produit_id, degree in produits:
+                self.add_produit(str(produit_id), degree or 0)
+            self.generation = generation
+
+    def follow(self, before, after):
+        # Écriture de ce processus : le registre l'a déjà vue. S'il était à jour juste avant, il le reste ;
+        # sinon un autre worker a écrit entre-temps et la prochaine lecture le rechargera
+        with self.lock:
+            if self.loaded and self.generation == before:
+                self.generation = after
+
+    def add_user(self, user_id, degree=0):
+        community = len(self.users) % NB_COMMUNITIES
+        self.users.append(user_id)
+        self.user_weights.extend([user_id] * (degree + 1))
+        self.user_communities[community].append(user_id)
+        self.user_community[user_id] = community
+
+    def add_produit(self, produit_id, degree=0):
+        self.produit_communities[len(self.produits) % NB_COMMUNITIES].append(produit_id)
+        self.produits.append(produit_id)
+        self.produit_weights.extend([produit_id] * (degree + 1))
+
+
+class GeneratorConfig:
+    # Modèle et graine choisis par /generator, dans un fichier par backend : chaque worker les applique
+    # à sa prochaine génération
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def version(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def read(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def write(self, model, seed):
+        # Écriture puis renommage : un worker ne lit jamais un fichier à moitié écrit
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model": model, "seed": seed}, f)
+        os.replace(tmp_path, self.path)
+        return self.version()
+
+    def next_position(self, version):
+        # Compteur commun à tous les workers, sous verrou de fichier : chaque création reçoit sa propre position
+        # dans le flux de la graine. Il repart de zéro avec chaque nouvelle configuration
+        with open(f"{self.path}.position", "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            counter = f.read().split()
+            position = int(counter[1]) if len(counter) == 2 and int(counter[0]) == version else 0
+            f.seek(0)
+            f.truncate()
+            f.write(f"{version} {position + 1}")
+        return position
+
+
+class GraphGenerator:
+    def __init__(self, model=None, seed=None, registry=None):
+        self.registry = registry or IdRegistry()
+        self.config_version = 0
+        self.configure(model, seed)
+
+    def configure(self, model=None, seed=None):
+        model = model or os.getenv("GENERATOR_MODEL", "uniform")
+        if model not in GRAPH_MODELS:
+            raise ValueError(f"Modèle de graphe inconnu : {model}")
+        if seed is None:
+            seed = os.getenv("GENERATOR_SEED")
+        seed = int(seed) if seed is not None else random.SystemRandom().randrange(2 ** 32)
+
+        self.model = model
+        self.seed = seed
+        self.fake = Faker()
+        self.position = 0
+        self.start_stream(0)
+
+    def start_stream(self, position):
+        # Tirages dérivés de la graine et d'une position : les mêmes d'une exécution et d'un backend à l'autre,
+        # indépendants de ceux des autres positions
+        self.rng = random.Random(f"{self.seed}:{position}")
+        self.fake.seed_instance(f"{self.seed}:{position}")
+
+    def next_stream(self, config=None):
+        # Une position par création, réservée auprès des autres workers quand la configuration est partagée :
+        # deux workers à la même graine ne rejouent jamais les mêmes tirages
+        position = config.next_position(self.config_version) if config is not None else self.position
+        self.position = position + 1
+        self.start_stream(position)
+
+    def sync(self, config):
+        # Configuration partagée plus récente que celle appliquée ici : même modèle, même graine
+        version = config.version()
+        if version and version != self.config_version:
+            shared = config.read()
+            self.configure(shared["model"], shared["seed"])
+            self.config_version = version
+
+    def share(self, config, model=None, seed=None):
+        self.configure(model, seed)
+        self.config_version = config.write(self.model, self.seed)
+
+    def partition_seeds(self, count):
+        # Graines dérivées pour les processus d'ingestion parallèle : même graine, mêmes partitions
+        return [self.rng.getrandbits(64) for _ in range(count)]
+
+    def new_id(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def user_rows(self, num_users):
+        rows = [(self.new_id(), self.fake.name()) for _ in range(num_users)]
+        with self.registry.lock:
+            for user_id, _ in rows:
+                self.registry.add_user(user_id)
+        return rows
+
+    def produit_rows(self, num_produits):
+        rows = [(self.new_id(), self.fake.word(), round(self.rng.uniform(5, 500), 2)) for _ in range(num_produits)]
+        with self.registry.lock:
+            for produit_id, _, _ in rows:
+                self.registry.add_produit(produit_id)
+        return rows
+
+    def nb_follows(self):
+        if self.model == "powerlaw":
+            # Pareto alpha = 2 : 10 follows en moyenne comme le modèle uniforme, mais une queue lourde
+            return min(int(5 * self.rng.paretovariate(2)), 1000)
+        return self.rng.randint(0, 20)
+
+    def pick_follower(self, user_id):
+        registry = self.registry
+        if self.model == "powerlaw":
+            return self.rng.choice(registry.user_weights)
+        if self.model == "community" and self.rng.random() < COMMUNITY_AFFINITY:
+            return self.rng.choice(registry.user_communities[registry.user_community.get(user_id, 0)])
+        return self.rng.choice(registry.users)
+
+    def follow_rows(self, users_ids):
+        registry = self.registry
+        for user_id in users_ids:
+            followers = self.distinct_picks(self.nb_follows(), len(registry.users) - 1,
+                                            lambda: self.pick_follower(user_id), exclude=user_id)
+            for follower_id in followers:
+                if self.model == "powerlaw":
+                    registry.user_weights.append(follower_id)
+                yield user_id, follower_id
+
+    def pick_produit(self, user_id):
+        registry = self.registry
+        if self.model == "powerlaw":
+            return self.rng.choice(registry.produit_weights)
+        if self.model == "community" and self.rng.random() < COMMUNITY_AFFINITY:
+            community = registry.produit_communities[registry.user_community.get(user_id, 0)]
+            if community:
+                return self.rng.choice(community)
+        return self.rng.choice(registry.produits)
+
+    def achat_rows(self, user_ids):
+        registry = self.registry
+        for user_id in user_ids:
+            produits = self.distinct_picks(self.rng.randint(0, 5), len(registry.produits),
+                                           lambda: self.pick_produit(user_id))
+            for produit_id in produits:
+                if self.model == "powerlaw":
+                    registry.produit_weights.append(produit_id)
+                yield user_id, produit_id, datetime.now().isoformat()
+
+    def distinct_picks(self, count, available, pick, exclude=None):
+        # Tirages O(1) avec rejet des doublons ; le nombre d'essais est borné pour les petits graphes
+        # (liste et non set : l'ordre d'itération d'un set de chaînes change d'un processus à l'autre)
+        count = min(count, available)
+        picks = []
+        seen = {exclude}
+        attempts = 0
+        while len(picks) < count and attempts < 4 * count + 10:
+            attempts += 1
+            value = pick()
+            if value not in seen:
+                seen.add(value)
+                picks.append(value)
+        return picks
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "seed": self.seed,
+            "nb_utilisateurs": len(self.registry.users),
+            "nb_produits": len(self.registry.produits)
+        }
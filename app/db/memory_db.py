@@ -0,0 +1,482 @@
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from app.db.base_db import *
+from app.utils import PhaseTimer, elapsed_ms
+
+
+class MemoryDB(base_db):
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rng = np.random.default_rng()
+        self.reset()
+
+    def reset(self):
+        self.users_id = []
+        self.users_nom = []
+        self.users_index = {}
+
+        self.produits_id = []
+        self.produits_nom = []
+        self.produits_prix = []
+        self.produits_index = {}
+
+        # Arêtes stockées par indices entiers, dédoublonnées à l'insertion
+        self.follows_user = np.empty(0, dtype=np.int64)
+        self.follows_follower = np.empty(0, dtype=np.int64)
+        self.achats_user = np.empty(0, dtype=np.int64)
+        self.achats_produit = np.empty(0, dtype=np.int64)
+        self.achats_date = np.empty(0, dtype="datetime64[us]")
+
+        self.csr = None
+
+    def init_db(self):
+        pass
+
+    def ping(self):
+        pass
+
+    def clear_db(self):
+        with self.lock:
+            self.reset()
+        print("Base de données mémoire réinitialisée avec succès.")
+
+    def graph(self):
+        # Les CSR sont reconstruits paresseusement après chaque écriture
+        with self.lock:
+            if self.csr is None:
+                nb_users = len(self.users_id)
+                nb_produits = len(self.produits_id)
+                self.csr = {
+                    "followers": self.build_csr(self.follows_user, self.follows_follower, nb_users),
+                    "achats": self.build_csr(self.achats_user, self.achats_produit, nb_users),
+                    "acheteurs": self.build_csr(self.achats_produit, self.achats_user, nb_produits)
+                }
+            return self.csr
+
+    @staticmethod
+    def build_csr(sources, targets, nb_nodes):
+        order = np.argsort(sources, kind="stable")
+        indptr = np.zeros(nb_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=nb_nodes), out=indptr[1:])
+        return indptr, targets[order]
+
+    @staticmethod
+    def expand(csr, nodes, weights):
+        indptr, indices = csr
+        starts = indptr[nodes]
+        degrees = indptr[nodes + 1] - starts
+        positions = np.repeat(starts - np.cumsum(degrees) + degrees, degrees) + np.arange(degrees.sum())
+        return indices[positions], np.repeat(weights, degrees)
+
+    @staticmethod
+    def aggregate(nodes, weights):
+        nodes, inverse = np.unique(nodes, return_inverse=True)
+        return nodes, np.bincount(inverse, weights=weights, minlength=len(nodes))
+
+    def follower_paths(self, user_index, max_level, distinct=False):
+        if distinct:
+            reached = self.follower_circle(np.array([user_index], dtype=np.int64), max_level + 1, include_seeds=False)
+            return reached, np.ones(len(reached))
+
+        # Parcours par niveau : chaque nœud porte le nombre de chemins qui l'atteignent, comme le UNION ALL SQL
+        followers = self.graph()["followers"]
+        frontier = np.array([user_index], dtype=np.int64), np.ones(1)
+        reached_nodes, reached_weights = [], []
+        for _ in range(max_level):
+            nodes, weights = self.expand(followers, *frontier)
+            if not len(nodes):
+                break
+            frontier = self.aggregate(nodes, weights)
+            reached_nodes.append(frontier[0])
+            reached_weights.append(frontier[1])
+
+        if not reached_nodes:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return self.aggregate(np.concatenate(reached_nodes), np.concatenate(reached_weights))
+
+    def follower_circle(self, seeds, max_level, include_seeds=True):
+        # BFS avec ensemble de visités : un utilisateur déjà atteint n'est jamais ré-expansé
+        followers = self.graph()["followers"]
+        visited = np.zeros(len(self.users_id), dtype=bool)
+        reached = np.zeros(len(self.users_id), dtype=bool)
+        visited[seeds] = True
+        reached[seeds] = include_seeds
+        frontier = seeds
+        for _ in range(max_level - 1):
+            nodes, _ = self.expand(followers, frontier, np.ones(len(frontier)))
+            reached[nodes] = True
+            frontier = np.unique(nodes[~visited[nodes]])
+            if not len(frontier):
+                break
+            visited[frontier] = True
+        return np.flatnonzero(reached)
+
+    def create_users(self, num_users, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                     checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        new_ids = [str(uuid.uuid4()) for _ in range(num_users)]
+        noms = [fake.name() for _ in range(num_users)]
+
+        start_ns = time.perf_counter_ns()
+        with self.lock:
+            first_index = len(self.users_id)
+            self.users_id.extend(new_ids)
+            self.users_nom.extend(noms)
+            self.users_index.update((user_id, first_index + i) for i, user_id in enumerate(new_ids))
+            nb_follows = self.add_follows(np.arange(first_index, len(self.users_id)))
+        execution_time = elapsed_ms(start_ns)
+        # Utilisateurs et follows ajoutés ensemble sous le verrou : les deux étapes sont validées à la fois
+        if checkpoint is not None:
+            checkpoint("users", new_ids)
+            checkpoint("follows", new_ids)
+
+        return {"nb_utilisateurs": num_users, "nb_follows": nb_follows}, execution_time
+
+    def create_follows(self, user_ids, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                       checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        start_ns = time.perf_counter_ns()
+        with self.lock:
+            users = np.array([self.users_index[user_id] for user_id in user_ids], dtype=np.int64)
+            # Les follows d'un utilisateur sont ajoutés d'un bloc : seuls ceux qui n'en ont aucun sont complétés
+            nb_follows = self.add_follows(users[~np.isin(users, self.follows_user)])
+        execution_time = elapsed_ms(start_ns)
+        if checkpoint is not None:
+            checkpoint("follows", user_ids)
+
+        return {"nb_follows": nb_follows}, execution_time
+
+    def add_follows(self, users):
+        # users : indices des utilisateurs suivis, de 0 à 20 followers chacun ; appelé sous self.lock
+        nb_users = len(self.users_id)
+        users = np.repeat(users, self.rng.integers(0, 21, size=len(users)))
+        followers = self.rng.integers(0, nb_users, size=len(users))
+        keep = users != followers
+        keys = np.unique(users[keep] * nb_users + followers[keep])
+
+        self.follows_user = np.concatenate([self.follows_user, keys // nb_users])
+        self.follows_follower = np.concatenate([self.follows_follower, keys % nb_users])
+        self.csr = None
+        return len(keys)
+
+    def create_produits(self, num_produits, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                        checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        new_ids = [str(uuid.uuid4()) for _ in range(num_produits)]
+        noms = [fake.word() for _ in range(num_produits)]
+        prix = [round(random.uniform(5, 500), 2) for _ in range(num_produits)]
+
+        start_ns = time.perf_counter_ns()
+        with self.lock:
+            first_index = len(self.produits_id)
+            self.produits_id.extend(new_ids)
+            self.produits_nom.extend(noms)
+            self.produits_prix.extend(prix)
+            self.produits_index.update((produit_id, first_index + i) for i, produit_id in enumerate(new_ids))
+            self.csr = None
+        execution_time = elapsed_ms(start_ns)
+        if checkpoint is not None:
+            checkpoint("produits", new_ids)
+
+        return {"nb_produits": num_produits}, execution_time
+
+    def create_achats(self, num_achats_not_used, mode="default", batch_size=BATCH_SIZE,
+                      commit_interval=COMMIT_INTERVAL, user_ids=None, checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        if not self.users_id or not self.produits_id:
+            raise ValueError("Pas assez d'utilisateurs ou de produits disponibles.")
+
+        start_ns = time.perf_counter_ns()
+        with self.lock:
+            if user_ids is None:
+                buyers = np.arange(len(self.users_id))
+            else:
+                buyers = np.array([self.users_index[user_id] for user_id in user_ids], dtype=np.int64)
+            nb_produits = len(self.produits_id)
+            users = np.repeat(buyers, self.rng.integers(0, 6, size=len(buyers)))
+            produits = self.rng.integers(0, nb_produits, size=len(users))
+            dates = np.full(len(users), np.datetime64(datetime.now(), "us"))
+
+            nb_achats_before = len(self.achats_user)
+            self.add_achats(users, produits, dates)
+            self.csr = None
+        execution_time = elapsed_ms(start_ns)
+        if checkpoint is not None:
+            checkpoint("achats", user_ids if user_ids is not None else list(self.users_id))
+
+        return {"nb_achats": len(self.achats_user) - nb_achats_before}, execution_time
+
+    def user_ids(self):
+        with self.lock:
+            return sorted(self.users_id)
+
+    def add_achats(self, users, produits, dates):
+        # Équivalent du ON CONFLICT DO NOTHING : on garde la première occurrence de chaque couple
+        nb_produits = len(self.produits_id)
+        users = np.concatenate([self.achats_user, users])
+        produits = np.concatenate([self.achats_produit, produits])
+        _, first = np.unique(users * nb_produits + produits, return_index=True)
+        first.sort()
+
+        self.achats_user = users[first]
+        self.achats_produit = produits[first]
+        self.achats_date = np.concatenate([self.achats_date, dates])[first]
+
+    def load_from(self, db):
+        start_ns = time.perf_counter_ns()
+        users = list(db.export_rows("utilisateurs"))
+        produits = list(db.export_rows("produits"))
+
+        with self.lock:
+            self.reset()
+            self.users_id = [str(row[0]) for row in users]
+            self.users_nom = [row[1] for row in users]
+            self.users_index = {user_id: i for i, user_id in enumerate(self.users_id)}
+            self.produits_id = [str(row[0]) for row in produits]
+            self.produits_nom = [row[1] for row in produits]
+            self.produits_prix = [float(row[2]) for row in produits]
+            self.produits_index = {produit_id: i for i, produit_id in enumerate(self.produits_id)}
+
+            follows = np.array([(self.users_index[str(user_id)], self.users_index[str(follower_id)])
+                                for user_id, follower_id in db.export_rows("follows")],
+                               dtype=np.int64).reshape(-1, 2)
+            self.follows_user, self.follows_follower = follows[:, 0].copy(), follows[:, 1].copy()
+
+            achats = [(self.users_index[str(user_id)], self.produits_index[str(produit_id)],
+                       date if isinstance(date, str) or date is None else date.isoformat())
+                      for user_id, produit_id, date in db.export_rows("achats")]
+            self.add_achats(np.array([row[0] for row in achats], dtype=np.int64),
+                            np.array([row[1] for row in achats], dtype=np.int64),
+                            np.array([row[2] for row in achats], dtype="datetime64[us]"))
+        self.graph()
+        execution_time = elapsed_ms(start_ns)
+
+        return self.db_size()[0], execution_time
+
+    def import_snapshot(self, snapshot, batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL):
+        # Un snapshot expose export_rows comme une base source
+        size, execution_time = self.load_from(snapshot)
+        return {"counts": {"utilisateurs": size["nb_utilisateurs"], "produits": size["nb_produits"],
+                           "follows": size["nb_follows"], "achats": size["nb_achats"]}}, execution_time
+
+    def export_rows(self, entity):
+        if entity == "utilisateurs":
+            yield from zip(self.users_id, self.users_nom)
+        elif entity == "follows":
+            for user, follower in zip(self.follows_user.tolist(), self.follows_follower.tolist()):
+                yield self.users_id[user], self.users_id[follower]
+        elif entity == "produits":
+            yield from zip(self.produits_id, self.produits_nom, self.produits_prix)
+        elif entity == "achats":
+            for user, produit, date in zip(self.achats_user.tolist(), self.achats_produit.tolist(),
+                                           self.achats_date.astype(str).tolist()):
+                yield self.users_id[user], self.produits_id[produit], date
+        else:
+            raise ValueError(f"Entité inconnue : {entity}")
+
+    def clear_caches(self):
+        with self.lock:
+            self.csr = None
+
+    def select_users(self, num_users, sampling="uniform"):
+        # Le tirage sans remise de numpy est déjà en O(num_users) : les deux modes sont identiques ici
+        self.check_sampling(sampling)
+        timer = PhaseTimer()
+        with timer.phase("compute"):
+            indexes = self.rng.choice(len(self.users_id), size=min(num_users, len(self.users_id)), replace=False)
+        with timer.phase("convert"):
+            result = [{"id": self.users_id[i], "nom": self.users_nom[i]} for i in indexes.tolist()]
+
+        return result, timer.timing()
+
+    def select_produits(self, num_produits, sampling="uniform"):
+        self.check_sampling(sampling)
+        timer = PhaseTimer()
+        with timer.phase("compute"):
+            indexes = self.rng.choice(len(self.produits_id), size=min(num_produits, len(self.produits_id)),
+                                      replace=False)
+        with timer.phase("convert"):
+            result = [{"id": self.produits_id[i], "nom": self.produits_nom[i], "prix": self.produits_prix[i]}
+                      for i in indexes.tolist()]
+
+        return result, timer.timing()
+
+    def db_size(self, exact=False):
+        # Les tailles sont toujours exactes en mémoire
+        timer = PhaseTimer()
+        with timer.phase("compute"):
+            size = {
+                "nb_utilisateurs": len(self.users_id),
+                "nb_follows": len(self.follows_user),
+                "nb_produits": len(self.produits_id),
+                "nb_achats": len(self.achats_user),
+                "method": "count"
+            }
+
+        return size, timer.timing()
+
+    def refresh_aggregates(self):
+        start_ns = time.perf_counter_ns()
+        with self.lock:
+            self.csr = None
+        self.graph()
+        execution_time = elapsed_ms(start_ns)
+
+        return execution_time
+
+    def global_follows(self):
+        nb_followers = np.bincount(self.follows_follower, minlength=len(self.users_id))
+        for i in np.argsort(-nb_followers, kind="stable").tolist():
+            yield {"id": self.users_id[i], "nom": self.users_nom[i], "nb_followers": int(nb_followers[i])}
+
+    def global_achats(self):
+        indptr, _ = self.graph()["acheteurs"]
+        num_buyers = np.diff(indptr)
+        for i in np.argsort(-num_buyers, kind="stable").tolist():
+            if not num_buyers[i]:
+                break
+            yield {"product_id": self.produits_id[i], "product_name": self.produits_nom[i],
+                   "num_buyers": int(num_buyers[i])}
+
+    @staticmethod
+    def top_page(counts, candidates, id_of, limit, cursor):
+        # Même ordre total que les autres backends (compte décroissant, identifiant croissant) ;
+        # seuls les candidats au niveau des limit + 1 premiers comptes sont triés
+        if cursor is not None:
+            count, last_id = cursor
+            ties = [i for i in candidates[counts[candidates] == count].tolist() if id_of(i) > last_id]
+            candidates = np.concatenate([candidates[counts[candidates] < count], np.array(ties, dtype=np.int64)])
+        if len(candidates) > limit + 1:
+            threshold = np.partition(-counts[candidates], limit)[limit]
+            candidates = candidates[-counts[candidates] <= threshold]
+        return sorted(candidates.tolist(), key=lambda i: (-counts[i], id_of(i)))[:limit + 1]
+
+    def requestGlobalFollows(self, exact=False, limit=None, cursor=None):
+        timer = PhaseTimer()
+        if limit is None:
+            # Le tri et la conversion sont entrelacés dans le générateur : une seule phase
+            with timer.phase("compute"):
+                results = list(self.global_follows())
+            return results, timer.timing()
+
+        limit, cursor = self.check_page(limit, cursor)
+        with timer.phase("compute"):
+            nb_followers = np.bincount(self.follows_follower, minlength=len(self.users_id))
+            order = self.top_page(nb_followers, np.arange(len(self.users_id)), self.users_id.__getitem__,
+                                  limit, cursor)
+        with timer.phase("convert"):
+            rows = [{"id": self.users_id[i], "nom": self.users_nom[i], "nb_followers": int(nb_followers[i])}
+                    for i in order]
+
+        return self.page(rows, limit, "nb_followers", "id"), timer.timing()
+
+    def requestGlobalAchatsByProduit(self, exact=False, limit=None, cursor=None):
+        timer = PhaseTimer()
+        if limit is None:
+            with timer.phase("compute"):
+                results = list(self.global_achats())
+            return results, timer.timing()
+
+        limit, cursor = self.check_page(limit, cursor)
+        with timer.phase("compute"):
+            indptr, _ = self.graph()["acheteurs"]
+            num_buyers = np.diff(indptr)
+            order = self.top_page(num_buyers, np.flatnonzero(num_buyers), self.produits_id.__getitem__,
+                                  limit, cursor)
+        with timer.phase("convert"):
+            rows = [{"product_id": self.produits_id[i], "product_name": self.produits_nom[i],
+                     "num_buyers": int(num_buyers[i])} for i in order]
+
+        return self.page(rows, limit, "num_buyers", "product_id"), timer.timing()
+
+    def streamGlobalFollows(self, exact=False):
+        yield from self.global_follows()
+
+    def streamGlobalAchatsByProduit(self, exact=False):
+        yield from self.global_achats()
+
+    def requestSpecific1(self, user_id, max_level=3, distinct=False, limit=None, cursor=None):
+        max_level = self.check_deep_level(max_level)
+        if limit is not None:
+            limit, cursor = self.check_page(limit, cursor)
+
+        timer = PhaseTimer()
+        results = []
+        if user_id in self.users_index:
+            with timer.phase("compute"):
+                followers, weights = self.follower_paths(self.users_index[user_id], max_level, distinct)
+                produits, weights = self.expand(self.graph()["achats"], followers, weights)
+                produits, nb_achats = self.aggregate(produits, weights)
+                if limit is None:
+                    order = np.argsort(-nb_achats, kind="stable").tolist()
+                else:
+                    order = self.top_page(nb_achats, np.arange(len(produits)),
+                                          lambda i: self.produits_id[produits[i]], limit, cursor)
+            with timer.phase("convert"):
+                for i in order:
+                    results.append({"product_id": self.produits_id[produits[i]],
+                                    "product_name": self.produits_nom[produits[i]],
+                                    "nb_achats": int(nb_achats[i])})
+
+        if limit is not None:
+            results = self.page(results, limit, "nb_achats", "product_id")
+        return results, timer.timing()
+
+    def requestSpecific2(self, user_id, product_id, max_level=3, distinct=False):
+        max_level = self.check_deep_level(max_level)
+
+        timer = PhaseTimer()
+        nb_achats = 0
+        if user_id in self.users_index and product_id in self.produits_index:
+            with timer.phase("compute"):
+                followers, weights = self.follower_paths(self.users_index[user_id], max_level, distinct)
+                produits, weights = self.expand(self.graph()["achats"], followers, weights)
+                nb_achats = int(weights[produits == self.produits_index[product_id]].sum())
+
+        return nb_achats, timer.timing()
+
+    def requestSpecific3(self, product_id, max_level=3, distinct=False):
+        max_level = self.check_deep_level(max_level)
+
+        timer = PhaseTimer()
+        results = []
+        if product_id in self.produits_index:
+            with timer.phase("compute"):
+                produit = self.produits_index[product_id]
+                indptr, acheteurs = self.graph()["acheteurs"]
+                buyers = acheteurs[indptr[produit]:indptr[produit + 1]]
+                if len(buyers):
+                    circle = self.follower_circle(np.unique(buyers), max_level)
+                    results.append({"product_id": product_id, "product_name": self.produits_nom[produit],
+                                    "num_buyers": int(np.isin(buyers, circle).sum())})
+
+        return results, timer.timing()
+
+    def requestSpecific1Batch(self, user_ids, max_level=3, distinct=False):
+        return self.run_batch(self.check_batch_ids(user_ids),
+                              lambda user_id: self.requestSpecific1(user_id, max_level, distinct))
+
+    def requestSpecific2Batch(self, user_ids, product_id, max_level=3, distinct=False):
+        return self.run_batch(self.check_batch_ids(user_ids),
+                              lambda user_id: self.requestSpecific2(user_id, product_id, max_level, distinct))
+
+    def requestSpecific3Batch(self, product_ids, max_level=3, distinct=False):
+        return self.run_batch(self.check_batch_ids(product_ids),
+                              lambda product_id: self.requestSpecific3(product_id, max_level, distinct))
+
+    @staticmethod
+    def run_batch(anchors, request):
+        # Pas d'aller-retour à économiser en mémoire : une ancre après l'autre, phases cumulées
+        timer = PhaseTimer()
+        results = {}
+        for anchor in anchors:
+            results[anchor], execution_time = request(anchor)
+            for phase, duration in execution_time.phases.items():
+                timer.add(phase, duration)
+        return results, timer.timing()
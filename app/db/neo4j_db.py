@@ -1,271 +1,884 @@
 import os
 import random
-import uuid
-from datetime import datetime
+import time
 
 from neo4j import GraphDatabase
 
 from app.db.base_db import *
-from app.utils import execute_with_timer
+from app.db.generator import GraphGenerator
+from app.utils import PhaseTimer, batched, elapsed_ms, execute_with_timer
+
+# Tirage rapide : une fenêtre de noeuds consécutifs sur la clé aléatoire indexée rnd, à partir d'un point tiré
+# au hasard ; la seconde branche n'est lue que si la fenêtre dépasse la fin de l'index
+FAST_SAMPLE_QUERY = """
+    CALL {{
+        MATCH (n:{label}) WHERE n.rnd >= $start
+        RETURN n ORDER BY n.rnd LIMIT $num
+        UNION ALL
+        MATCH (n:{label}) WHERE n.rnd < $start
+        RETURN n ORDER BY n.rnd LIMIT $num
+    }}
+    WITH n LIMIT $num
+    RETURN {returns}
+"""
+
+# Tirage uniforme : une sonde par point tiré au hasard, chacune un seek sur l'index rnd jusqu'au premier noeud
+# au-delà du point. Les valeurs rnd étant elles-mêmes uniformes et indépendantes, chaque noeud a la même chance
+# d'être retenu ; une sonde tirée au-delà du dernier noeud ne renvoie rien
+UNIFORM_SAMPLE_QUERY = """
+    UNWIND $starts AS start
+    CALL {{
+        WITH start
+        MATCH (n:{label}) WHERE n.rnd >= start
+        RETURN n ORDER BY n.rnd LIMIT 1
+    }}
+    RETURN DISTINCT {returns}
+"""
+# Sondes par noeud demandé (les doublons sont écartés), puis multipliées par 4 à chaque complément
+SAMPLE_MARGIN = 1.5
+SAMPLE_ROUNDS = 3
+
+# Comptes par label ou type seul : servis par le count store, sans parcourir les noeuds ni les relations
+COUNT_STORE_QUERY = """
+    CALL { MATCH (u:Utilisateur) RETURN count(u) AS nb_utilisateurs }
+    CALL { MATCH ()-[f:FOLLOWS]->() RETURN count(f) AS nb_follows }
+    CALL { MATCH (p:Produit) RETURN count(p) AS nb_produits }
+    CALL { MATCH ()-[a:ACHAT]->() RETURN count(a) AS nb_achats }
+    RETURN nb_utilisateurs, nb_follows, nb_produits, nb_achats
+"""
+
+NEO4J_DATABASE = "neo4j"
+
+# Pagination par jeu de clés : les colonnes sont nommées dans un WITH pour que {keyset} reprenne strictement
+# après la dernière ligne servie ; {limit} borne la page (tri top-N). Les deux restent vides sans pagination
+KEYSET = "WHERE {count} < $cursor_count OR ({count} = $cursor_count AND {id} > $cursor_id)"
+
+GLOBAL_FOLLOWS_QUERY = """
+    MATCH (u:Utilisateur)
+    OPTIONAL MATCH (f)-[:FOLLOWS]->(u)
+    WITH u.id AS id, u.nom AS nom, COUNT(f) AS nb_followers
+    {keyset}
+    RETURN id, nom, nb_followers ORDER BY nb_followers DESC, id
+    {limit}
+"""
+
+GLOBAL_FOLLOWS_PRECOMPUTED_QUERY = """
+    MATCH (u:Utilisateur)
+    WHERE u.nb_followers IS NOT NULL
+    WITH u.id AS id, u.nom AS nom, u.nb_followers AS nb_followers
+    {keyset}
+    RETURN id, nom, nb_followers ORDER BY nb_followers DESC, id
+    {limit}
+"""
+
+GLOBAL_ACHATS_QUERY = """
+    MATCH (u:Utilisateur)-[:ACHAT]->(p:Produit)
+    WITH
+        p.id AS product_id,
+        p.nom AS product_name,
+        COUNT(DISTINCT u) AS num_buyers
+    {keyset}
+    RETURN product_id, product_name, num_buyers
+    ORDER BY num_buyers DESC, product_id
+    {limit}
+"""
+
+GLOBAL_ACHATS_PRECOMPUTED_QUERY = """
+    MATCH (p:Produit)
+    WHERE p.num_buyers > 0
+    WITH
+        p.id AS product_id,
+        p.nom AS product_name,
+        p.num_buyers AS num_buyers
+    {keyset}
+    RETURN product_id, product_name, num_buyers
+    ORDER BY num_buyers DESC, product_id
+    {limit}
+"""
+
+EXPORT_QUERIES = {
+    "utilisateurs": "MATCH (u:Utilisateur) RETURN u.id, u.nom",
+    "follows": "MATCH (a:Utilisateur)-[:FOLLOWS]->(b:Utilisateur) RETURN a.id, b.id",
+    "produits": "MATCH (p:Produit) RETURN p.id, p.nom, p.prix",
+    "achats": "MATCH (u:Utilisateur)-[a:ACHAT]->(p:Produit) RETURN u.id, p.id, a.date"
+}
+
+# Cypher ne permet pas de paramétrer les bornes d'un chemin variable : une requête figée par profondeur,
+# les identifiants passant en $paramètres pour que le plan soit réutilisé par le cache de requêtes
+# Sémantique "distinct" : le WITH DISTINCT juste après le chemin variable permet au planificateur
+# d'élaguer l'expansion (VarLengthExpand(Pruning)) au lieu d'énumérer chaque chemin
+TRAVERSAL_SEMANTICS = {False: "", True: "WITH DISTINCT follower"}
+
+SPECIFIC1_QUERIES = {
+    (level, distinct): f"""
+        MATCH (follower)-[:FOLLOWS*1..{level}]->(u:Utilisateur)
+        WHERE u.id = $user_id
+        {with_distinct}
+        MATCH (follower)-[:ACHAT]->(p:Produit)
+        WITH
+            p.id AS product_id,
+            p.nom AS product_name,
+            COUNT(*) AS nb_achats
+        {{keyset}}
+        RETURN product_id, product_name, nb_achats
+        ORDER BY nb_achats DESC, product_id
+        {{limit}}
+        """
+    for level in range(1, MAX_DEEP_LEVEL + 1)
+    for distinct, with_distinct in TRAVERSAL_SEMANTICS.items()
+}
+
+SPECIFIC2_QUERIES = {
+    (level, distinct): f"""
+        MATCH (follower)-[:FOLLOWS*1..{level}]->(u:Utilisateur {{id: $user_id}})
+        {with_distinct}
+        MATCH (follower)-[:ACHAT]->(p:Produit {{id: $product_id}})
+        RETURN
+            COUNT(*) AS nb_achats
+        ORDER BY nb_achats DESC
+        """
+    for level in range(1, MAX_DEEP_LEVEL + 1)
+    for distinct, with_distinct in TRAVERSAL_SEMANTICS.items()
+}
+
+# Un chemin de 1 à N FOLLOWS existe dès qu'il en existe un de longueur 1 : en mode distinct,
+# on part des acheteurs et on teste l'existence d'un FOLLOWS sortant au lieu de parcourir le graphe
+SPECIFIC3_QUERIES = {
+    (level, False): f"""
+        MATCH (follower)-[:FOLLOWS*1..{level}]->(u:Utilisateur)
+        MATCH (follower)-[:ACHAT]->(p:Produit {{id: $product_id}})
+        RETURN p.id AS product_id, p.nom AS product_name, COUNT(DISTINCT follower) AS num_buyers
+        ORDER BY num_buyers DESC
+        """
+    for level in range(1, MAX_DEEP_LEVEL + 1)
+}
+SPECIFIC3_QUERIES.update({
+    (level, True): """
+        MATCH (follower)-[:ACHAT]->(p:Produit {id: $product_id})
+        WHERE EXISTS { (follower)-[:FOLLOWS]->(:Utilisateur) }
+        RETURN p.id AS product_id, p.nom AS product_name, COUNT(DISTINCT follower) AS num_buyers
+        ORDER BY num_buyers DESC
+        """
+    for level in range(1, MAX_DEEP_LEVEL + 1)
+})
 
+# Variantes multi-ancres : UNWIND des identifiants dans une seule requête, chaque ligne portant son ancre
+BATCH_TRAVERSAL_SEMANTICS = {False: "", True: "WITH DISTINCT anchor, follower"}
 
-class Neo4jDB(base_db):
+BATCH_SPECIFIC1_QUERIES = {
+    (level, distinct): f"""
+        UNWIND $ids AS anchor
+        MATCH (follower)-[:FOLLOWS*1..{level}]->(u:Utilisateur {{id: anchor}})
+        {with_distinct}
+        MATCH (follower)-[:ACHAT]->(p:Produit)
+        RETURN
+            anchor,
+            p.id AS product_id,
+            p.nom AS product_name,
+            COUNT(*) AS nb_achats
+        ORDER BY anchor, nb_achats DESC
+        """
+    for level in range(1, MAX_DEEP_LEVEL + 1)
+    for distinct, with_distinct in BATCH_TRAVERSAL_SEMANTICS.items()
+}
+
+BATCH_SPECIFIC2_QUERIES = {
+    (level, distinct): f"""
+        UNWIND $ids AS anchor
+        MATCH (follower)-[:FOLLOWS*1..{level}]->(u:Utilisateur {{id: anchor}})
+        {with_distinct}
+        MATCH (follower)-[:ACHAT]->(p:Produit {{id: $product_id}})
+        RETURN anchor, COUNT(*) AS nb_achats
+        """
+    for level in range(1, MAX_DEEP_LEVEL + 1)
+    for distinct, with_distinct in BATCH_TRAVERSAL_SEMANTICS.items()
+}
+
+BATCH_SPECIFIC3_QUERIES = {
+    (level, False): f"""
+        UNWIND $ids AS anchor
+        MATCH (follower)-[:ACHAT]->(p:Produit {{id: anchor}})
+        MATCH (follower)-[:FOLLOWS*1..{level}]->(u:Utilisateur)
+        RETURN anchor, p.id AS product_id, p.nom AS product_name, COUNT(DISTINCT follower) AS num_buyers
+        """
+    for level in range(1, MAX_DEEP_LEVEL + 1)
+}
+BATCH_SPECIFIC3_QUERIES.update({
+    (level, True): """
+        UNWIND $ids AS anchor
+        MATCH (follower)-[:ACHAT]->(p:Produit {id: anchor})
+        WHERE EXISTS { (follower)-[:FOLLOWS]->(:Utilisateur) }
+        RETURN anchor, p.id AS product_id, p.nom AS product_name, COUNT(DISTINCT follower) AS num_buyers
+        """
+    for level in range(1, MAX_DEEP_LEVEL + 1)
+})
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        # Fichier supprimé pendant le parcours (rotation des journaux de transactions)
+        return 0
+
+
+def directory_size(path):
+    return sum(file_size(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class Neo4jDB(GeneratedBackend, base_db):
     def __init__(self):
         self.neo4j_driver = GraphDatabase.driver(
             f"bolt://{os.getenv('ENV_NEO4J_HOST')}:{os.getenv('ENV_NEO4J_BOLT_PORT')}",
             auth=(os.getenv("ENV_NEO4J_USER"), os.getenv("ENV_NEO4J_PASSWORD"))
         )
+        self.generator = GraphGenerator()
+        # Neo4j n'expose pas la taille de ses fichiers en Cypher : le volume de données est monté en lecture seule
+        self.data_dir = os.getenv("NEO4J_DATA_DIR", "/neo4j/data")
+
+    def ping(self):
+        self.neo4j_driver.verify_connectivity()
 
     def init_db(self):
         with self.neo4j_driver.session() as session:
             session.run("CREATE CONSTRAINT IF NOT EXISTS FOR (u:Utilisateur) REQUIRE u.id IS UNIQUE;")
             session.run("CREATE CONSTRAINT IF NOT EXISTS FOR (p:Produit) REQUIRE p.id IS UNIQUE;")
+            session.run("CREATE INDEX IF NOT EXISTS FOR (u:Utilisateur) ON (u.nb_followers);")
+            session.run("CREATE INDEX IF NOT EXISTS FOR (p:Produit) ON (p.num_buyers);")
+            session.run("CREATE INDEX IF NOT EXISTS FOR (u:Utilisateur) ON (u.rnd);")
+            session.run("CREATE INDEX IF NOT EXISTS FOR (p:Produit) ON (p.rnd);")
+            # Clé d'échantillonnage des noeuds créés avant son introduction
+            for label in ("Utilisateur", "Produit"):
+                session.run(f"""
+                    MATCH (n:{label}) WHERE n.rnd IS NULL
+                    CALL {{
+                        WITH n
+                        SET n.rnd = rand()
+                    }} IN TRANSACTIONS OF 10000 ROWS
+                """).consume()
+
+            missing_aggregates = session.run("""
+                OPTIONAL MATCH (u:Utilisateur) WHERE u.nb_followers IS NULL
+                WITH u LIMIT 1
+                OPTIONAL MATCH (p:Produit) WHERE p.num_buyers IS NULL
+                WITH u, p LIMIT 1
+                RETURN u IS NOT NULL OR p IS NOT NULL AS missing
+            """).single()["missing"]
+
+        if missing_aggregates:
+            self.refresh_aggregates()
+
+    def refresh_aggregates(self):
+        with self.neo4j_driver.session() as session:
+            start_ns = time.perf_counter_ns()
+            session.run("""
+                MATCH (u:Utilisateur)
+                CALL {
+                    WITH u
+                    SET u.nb_followers = COUNT { ()-[:FOLLOWS]->(u) }
+                } IN TRANSACTIONS OF 10000 ROWS
+            """).consume()
+            session.run("""
+                MATCH (p:Produit)
+                CALL {
+                    WITH p
+                    SET p.num_buyers = COUNT { MATCH (u:Utilisateur)-[:ACHAT]->(p) RETURN DISTINCT u }
+                } IN TRANSACTIONS OF 10000 ROWS
+            """).consume()
+            execution_time = elapsed_ms(start_ns)
+
+        return execution_time
 
     def clear_db(self):
         try:
             with self.neo4j_driver.session() as session:
                 session.run("MATCH (n) DETACH DELETE n;")
+                self.generator.registry.reset()
                 print("Base de données Neo4j réinitialisée avec succès.")
 
                 self.init_db()
         except Exception as e:
             print(f"Erreur lors de la réinitialisation de la base de données Neo4j: {e}")
 
-    def create_users(self, num_users):
-        users = []
+    def create_users(self, num_users, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                     checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        if mode == "bulk":
+            return self.bulk_create_users(num_users, batch_size, commit_interval, checkpoint)
+        if mode == "parallel":
+            return self.parallel_create_users(num_users, batch_size, commit_interval, checkpoint)
+
+        self.start_generation()
+        users = [{"id": user_id, "nom": nom} for user_id, nom in self.generator.user_rows(num_users)]
+        users_ids = [user["id"] for user in users]
         execution_time = 0
+        # Une transaction pour les noeuds puis une pour les follows, comme PostgreSQL : deux points de reprise
         with self.neo4j_driver.session() as session:
-            for _ in range(num_users):
-                nom = fake.name()
-                user_id = str(uuid.uuid4())
-                execution_time += execute_with_timer(session.run,
-                                                     "CREATE (u:Utilisateur {id: $id, nom: $nom})",
-                                                     id=user_id,
-                                                     nom=nom)
-                users.append({"id": user_id, "nom": nom})
-
-            users_list = session.run("MATCH (u:Utilisateur) RETURN u.id AS id")
-            users_id = [record["id"] for record in users_list]
-
-            for user in users:
-                num_followers = random.randint(0, 20)
-                followers = random.sample(users_id, min(num_followers, len(users_id)))
-
-                for follower_id in followers:
-                    if follower_id != user["id"]:
-                        execution_time += execute_with_timer(session.run,
-                                                             """
-                                                                 MATCH (a:Utilisateur {id: $user_id}), (b:Utilisateur {id: $follower_id})
-                                                                 CREATE (a)-[:FOLLOWS]->(b)
-                                                             """,
-                                                             follower_id=follower_id,
-                                                             user_id=user["id"])
+            with session.begin_transaction() as tx:
+                for user in users:
+                    execution_time += execute_with_timer(tx.run,
+                                                         "CREATE (u:Utilisateur {id: $id, nom: $nom, nb_followers: 0, rnd: rand()})",
+                                                         id=user["id"],
+                                                         nom=user["nom"])
+                execution_time += execute_with_timer(tx.commit)
+            if checkpoint is not None:
+                checkpoint("users", users_ids)
+
+            execution_time += self.run_follows(session, users_ids, checkpoint)
 
         return users, execution_time
 
-    def create_produits(self, num_produits):
+    def create_follows(self, user_ids, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                       checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        self.start_generation()
+        if mode != "default":
+            # Une reprise ne porte que sur les utilisateurs d'un seul morceau : pas de partitions
+            return self.write_follows(user_ids, batch_size, commit_interval, checkpoint, merge=True)
+
+        with self.neo4j_driver.session() as session:
+            return None, self.run_follows(session, user_ids, checkpoint, merge=True)
+
+    def run_follows(self, session, users_ids, checkpoint=None, merge=False):
+        execution_time = 0
+        with session.begin_transaction() as tx:
+            for user_id, follower_id in self.generator.follow_rows(users_ids):
+                execution_time += execute_with_timer(tx.run,
+                                                     f"""
+                                                         MATCH (a:Utilisateur {{id: $user_id}}), (b:Utilisateur {{id: $follower_id}})
+                                                         {self.follow_clause(merge)}
+                                                     """,
+                                                     follower_id=follower_id,
+                                                     user_id=user_id)
+            execution_time += execute_with_timer(tx.commit)
+        if checkpoint is not None:
+            checkpoint("follows", users_ids)
+        return execution_time
+
+    @staticmethod
+    def follow_clause(merge):
+        # MERGE pour une reprise : les follows d'un utilisateur ont pu être validés en partie
+        if merge:
+            return """MERGE (a)-[:FOLLOWS]->(b)
+            ON CREATE SET b.nb_followers = coalesce(b.nb_followers, 0) + 1"""
+        return """CREATE (a)-[:FOLLOWS]->(b)
+            SET b.nb_followers = coalesce(b.nb_followers, 0) + 1"""
+
+    def create_produits(self, num_produits, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                        checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        if mode == "bulk":
+            return self.bulk_create_produits(num_produits, batch_size, commit_interval, checkpoint)
+        if mode == "parallel":
+            return self.parallel_create_produits(num_produits, batch_size, commit_interval, checkpoint)
+
+        self.start_generation()
         produits = []
         execution_time = 0
         with self.neo4j_driver.session() as session:
-            for _ in range(num_produits):
-                nom = fake.word()
-                prix = round(random.uniform(5, 500), 2)
-                produit_id = str(uuid.uuid4())
-                execution_time += execute_with_timer(session.run,
-                                                     "CREATE (p:Produit {id: $id, nom: $nom, prix: $prix})",
-                                                     id=produit_id,
-                                                     nom=nom,
-                                                     prix=prix)
-                produits.append({"id": produit_id, "nom": nom, "prix": prix})
+            with session.begin_transaction() as tx:
+                for produit_id, nom, prix in self.generator.produit_rows(num_produits):
+                    execution_time += execute_with_timer(tx.run,
+                                                         "CREATE (p:Produit {id: $id, nom: $nom, prix: $prix, num_buyers: 0, rnd: rand()})",
+                                                         id=produit_id,
+                                                         nom=nom,
+                                                         prix=prix)
+                    produits.append({"id": produit_id, "nom": nom, "prix": prix})
+                execution_time += execute_with_timer(tx.commit)
+        if checkpoint is not None:
+            checkpoint("produits", [produit["id"] for produit in produits])
 
         return produits, execution_time
 
-    def create_achats(self, num_achats_not_used):
+    def create_achats(self, num_achats_not_used, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                      user_ids=None, checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        registry = self.start_generation()
+        if not registry.users or not registry.produits:
+            raise ValueError("Pas assez d'utilisateurs ou de produits disponibles.")
+        if user_ids is None:
+            user_ids = list(registry.users)
+        if mode == "bulk":
+            return self.bulk_create_achats(user_ids, batch_size, commit_interval, checkpoint)
+        if mode == "parallel":
+            return self.parallel_create_achats(user_ids, batch_size, commit_interval, checkpoint)
+
         achats = []
         execution_time = 0
         with self.neo4j_driver.session() as session:
-            user_results = session.run("MATCH (u:Utilisateur) RETURN u.id AS id")
-            user_ids = [record["id"] for record in user_results]
-
-            produit_results = session.run("MATCH (p:Produit) RETURN p.id AS id")
-            produit_ids = [record["id"] for record in produit_results]
-
-            if not user_ids or not produit_ids:
-                raise ValueError("Pas assez d'utilisateurs ou de produits disponibles.")
-
-            for utilisateur_id in user_ids:
-                num_achats_utilisateur = random.randint(0, 5)
-                produits_achetes = random.sample(produit_ids, min(num_achats_utilisateur, len(produit_ids)))
-
-                for produit_id in produits_achetes:
-                    date_achat = datetime.now().isoformat()
-                    execution_time += execute_with_timer(session.run,
+            with session.begin_transaction() as tx:
+                for utilisateur_id, produit_id, date_achat in self.generator.achat_rows(user_ids):
+                    execution_time += execute_with_timer(tx.run,
                                                          """
                                                              MATCH (u:Utilisateur {id: $utilisateur_id}), (p:Produit {id: $produit_id})
-                                                             CREATE (u)-[:ACHAT {date: $date}]->(p)
+                                                             MERGE (u)-[a:ACHAT]->(p)
+                                                             ON CREATE SET a.date = $date,
+                                                                 p.num_buyers = coalesce(p.num_buyers, 0) + 1
                                                          """,
                                                          utilisateur_id=utilisateur_id,
                                                          produit_id=produit_id,
                                                          date=date_achat)
 
-                    achats.append(
-                        {"utilisateur_id": utilisateur_id, "produit_id": produit_id, "date_achat": date_achat})
+                    achats.append({"utilisateur_id": utilisateur_id, "produit_id": produit_id, "date_achat": date_achat})
+                execution_time += execute_with_timer(tx.commit)
+        if checkpoint is not None:
+            checkpoint("achats", user_ids)
 
         return achats, execution_time
 
-    def select_users(self, num_users):
+    def bulk_create_users(self, num_users, batch_size, commit_interval, checkpoint=None):
+        self.start_generation()
+        new_users = self.generator.user_rows(num_users)
+
+        users_batches, execution_time = self.write_users(new_users, batch_size, commit_interval, checkpoint)
+        follows_batches, follows_time = self.write_follows([user_id for user_id, _ in new_users],
+                                                           batch_size, commit_interval, checkpoint)
+
+        return {
+            "nb_utilisateurs": sum(batch["rows"] for batch in users_batches),
+            "nb_follows": sum(batch["rows"] for batch in follows_batches),
+            "batches": {"utilisateurs": users_batches, "follows": follows_batches}
+        }, execution_time + follows_time
+
+    def bulk_create_produits(self, num_produits, batch_size, commit_interval, checkpoint=None):
+        self.start_generation()
+        produits_batches, execution_time = self.write_produits(self.generator.produit_rows(num_produits),
+                                                               batch_size, commit_interval, checkpoint)
+
+        return {
+            "nb_produits": sum(batch["rows"] for batch in produits_batches),
+            "batches": {"produits": produits_batches}
+        }, execution_time
+
+    def bulk_create_achats(self, user_ids, batch_size, commit_interval, checkpoint=None):
+        achats_batches, execution_time = self.write_achats(user_ids, batch_size, commit_interval, checkpoint)
+
+        return {
+            "nb_achats": sum(batch["rows"] for batch in achats_batches),
+            "batches": {"achats": achats_batches}
+        }, execution_time
+
+    def parallel_create_users(self, num_users, batch_size, commit_interval, checkpoint=None):
+        registry = self.start_generation()
+        workers = min(INGEST_WORKERS, max(num_users, 1))
+
+        users, users_time = self.run_partitions("generate_users", [
+            (nb_users, batch_size, commit_interval) for nb_users in split_count(num_users, workers)
+        ], checkpoint)
+        new_users_id = [user_id for ids, _, _ in users for user_id in ids]
+        with registry.lock:
+            for user_id in new_users_id:
+                registry.add_user(user_id)
+
+        # Une fois tous les noeuds créés et enregistrés, chaque processus hérite du registre complet :
+        # ses follows peuvent pointer vers des utilisateurs créés par les autres partitions
+        follows, follows_time = self.run_partitions("count_batches", [
+            ("write_follows", users_id, batch_size, commit_interval) for users_id in split_list(new_users_id, workers)
+        ], checkpoint)
+
+        return {
+            "nb_utilisateurs": len(new_users_id),
+            "nb_follows": sum(nb_follows for nb_follows, _ in follows),
+            "parallel": {
+                "workers": workers,
+                "utilisateurs": self.partition_stats(
+                    [(nb_users, execution_time) for _, nb_users, execution_time in users], users_time),
+                "follows": self.partition_stats(follows, follows_time)
+            }
+        }, users_time + follows_time
+
+    def parallel_create_produits(self, num_produits, batch_size, commit_interval, checkpoint=None):
+        registry = self.start_generation()
+        workers = min(INGEST_WORKERS, max(num_produits, 1))
+
+        produits, execution_time = self.run_partitions("generate_produits", [
+            (nb_produits, batch_size, commit_interval) for nb_produits in split_count(num_produits, workers)
+        ], checkpoint)
+        with registry.lock:
+            for produit_id in (produit_id for ids, _, _ in produits for produit_id in ids):
+                registry.add_produit(produit_id)
+
+        return {
+            "nb_produits": sum(nb_produits for _, nb_produits, _ in produits),
+            "parallel": {"workers": workers, "produits": self.partition_stats(
+                [(nb_produits, execution_time) for _, nb_produits, execution_time in produits], execution_time)}
+        }, execution_time
+
+    def parallel_create_achats(self, user_ids, batch_size, commit_interval, checkpoint=None):
+        workers = min(INGEST_WORKERS, max(len(user_ids), 1))
+
+        # Les verrous pris sur les produits populaires peuvent provoquer des deadlocks : execute_write rejoue
+        achats, execution_time = self.run_partitions("count_batches", [
+            ("write_achats", users_id, batch_size, commit_interval)
+            for users_id in split_list(user_ids, workers)
+        ], checkpoint)
+
+        return {
+            "nb_achats": sum(nb_achats for nb_achats, _ in achats),
+            "parallel": {"workers": workers, "achats": self.partition_stats(achats, execution_time)}
+        }, execution_time
+
+    def generate_users(self, num_users, batch_size, commit_interval, checkpoint=None):
+        new_users = self.generator.user_rows(num_users)
+        users_batches, execution_time = self.write_users(new_users, batch_size, commit_interval, checkpoint)
+        return [user_id for user_id, _ in new_users], sum(batch["rows"] for batch in users_batches), execution_time
+
+    def generate_produits(self, num_produits, batch_size, commit_interval, checkpoint=None):
+        new_produits = self.generator.produit_rows(num_produits)
+        produits_batches, execution_time = self.write_produits(new_produits, batch_size, commit_interval, checkpoint)
+        return ([produit_id for produit_id, _, _ in new_produits], sum(batch["rows"] for batch in produits_batches),
+                execution_time)
+
+    def count_batches(self, method, *args, checkpoint=None):
+        # Les processus ne renvoient que le total, pas le détail de chaque lot
+        batches, execution_time = getattr(self, method)(*args, checkpoint=checkpoint)
+        return sum(batch["rows"] for batch in batches), execution_time
+
+    def read_registry(self):
         with self.neo4j_driver.session() as session:
-            start_time = datetime.now()
-            result = session.run(
-                """
-                MATCH (u:Utilisateur)
-                RETURN u.id AS id, u.nom AS nom
-                ORDER BY rand()
-                LIMIT $num
-                """,
-                {"num": num_users}
-            )
-            end_time = datetime.now()
-
-            result = [record.data() for record in result]
-
-            return result, (end_time - start_time).total_seconds() * 1000
-
-    def select_produits(self, num_produits):
+            users = [tuple(record.values()) for record in
+                     session.run("MATCH (u:Utilisateur) RETURN u.id AS id, u.nb_followers AS degree")]
+            produits = [tuple(record.values()) for record in
+                        session.run("MATCH (p:Produit) RETURN p.id AS id, p.num_buyers AS degree")]
+        return users, produits
+
+    def write_users(self, new_users, batch_size, commit_interval, checkpoint=None):
+        return self.write_batches(
+            "UNWIND $rows AS row CREATE (:Utilisateur {id: row.id, nom: row.nom, nb_followers: 0, rnd: rand()})",
+            ({"id": user_id, "nom": nom} for user_id, nom in new_users),
+            batch_size, commit_interval,
+            CommitProgress(checkpoint, "users", (user_id for user_id, _ in new_users), key=lambda row: row["id"],
+                           single_row=True))
+
+    def write_follows(self, new_users_id, batch_size, commit_interval, checkpoint=None, merge=False):
+        return self.write_follow_rows(self.generator.follow_rows(new_users_id), batch_size, commit_interval,
+                                      CommitProgress(checkpoint, "follows", new_users_id,
+                                                     key=lambda row: row["user_id"]), merge)
+
+    def write_follow_rows(self, follows, batch_size, commit_interval, on_commit=None, merge=False):
+        return self.write_batches(
+            f"""
+            UNWIND $rows AS row
+            MATCH (a:Utilisateur {{id: row.user_id}})
+            MATCH (b:Utilisateur {{id: row.follower_id}})
+            {self.follow_clause(merge)}
+            """,
+            ({"user_id": user_id, "follower_id": follower_id} for user_id, follower_id in follows),
+            batch_size, commit_interval, on_commit)
+
+    def write_produits(self, new_produits, batch_size, commit_interval, checkpoint=None):
+        return self.write_batches(
+            """
+            UNWIND $rows AS row
+            CREATE (:Produit {id: row.id, nom: row.nom, prix: row.prix, num_buyers: 0, rnd: rand()})
+            """,
+            ({"id": produit_id, "nom": nom, "prix": prix} for produit_id, nom, prix in new_produits),
+            batch_size, commit_interval,
+            CommitProgress(checkpoint, "produits", (produit_id for produit_id, _, _ in new_produits),
+                           key=lambda row: row["id"], single_row=True))
+
+    def write_achats(self, user_ids, batch_size, commit_interval, checkpoint=None):
+        return self.write_achat_rows(self.generator.achat_rows(user_ids), batch_size, commit_interval,
+                                     CommitProgress(checkpoint, "achats", user_ids,
+                                                    key=lambda row: row["utilisateur_id"]))
+
+    def write_achat_rows(self, achats, batch_size, commit_interval, on_commit=None):
+        return self.write_batches(
+            """
+            UNWIND $rows AS row
+            MATCH (u:Utilisateur {id: row.utilisateur_id})
+            MATCH (p:Produit {id: row.produit_id})
+            MERGE (u)-[a:ACHAT]->(p)
+            ON CREATE SET a.date = row.date, p.num_buyers = coalesce(p.num_buyers, 0) + 1
+            """,
+            ({"utilisateur_id": utilisateur_id, "produit_id": produit_id, "date": date}
+             for utilisateur_id, produit_id, date in achats),
+            batch_size, commit_interval, on_commit)
+
+    def write_batches(self, query, rows, batch_size, commit_interval, on_commit=None):
+        # commit_interval lots de batch_size lignes par transaction, chaque lot étant un seul UNWIND
+        batches = []
+        execution_time = 0
         with self.neo4j_driver.session() as session:
-            start_time = datetime.now()
-            result = session.run(
-                """
-                MATCH (p:Produit)
-                RETURN p.id AS id, p.nom AS nom, p.prix AS prix
-                ORDER BY rand()
-                LIMIT $num
-                """,
-                {"num": num_produits}
-            )
-            end_time = datetime.now()
-
-            result = [record.data() for record in result]
+            for transaction_batches in batched(batched(rows, batch_size), commit_interval):
+                transaction_stats = []
+                execution_time += execute_with_timer(session.execute_write, self.run_batches, query,
+                                                     transaction_batches, transaction_stats)
+                batches.extend(transaction_stats)
+                if on_commit is not None:
+                    on_commit(transaction_batches[-1][-1])
+        if on_commit is not None:
+            on_commit()
+
+        for num_batch, batch in enumerate(batches, start=1):
+            batch["batch"] = num_batch
+
+        return batches, execution_time
+
+    @staticmethod
+    def run_batches(tx, query, transaction_batches, transaction_stats):
+        # La fonction peut être rejouée par execute_write : on repart de zéro à chaque essai
+        transaction_stats.clear()
+        for rows in transaction_batches:
+            start_ns = time.perf_counter_ns()
+            tx.run(query, rows=rows).consume()
+            batch_time = elapsed_ms(start_ns)
+            transaction_stats.append({
+                "rows": len(rows),
+                "execution_time": round(batch_time, 3),
+                "rows_per_second": round(len(rows) / batch_time * 1000, 1) if batch_time else None
+            })
+
+    def import_snapshot(self, snapshot, batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL):
+        # Lots UNWIND plutôt que LOAD CSV : les fichiers du snapshot ne sont pas dans le répertoire import du serveur
+        users_batches, users_time = self.write_users(snapshot.export_rows("utilisateurs"), batch_size, commit_interval)
+        produits_batches, produits_time = self.write_produits(
+            ((produit_id, nom, float(prix)) for produit_id, nom, prix in snapshot.export_rows("produits")),
+            batch_size, commit_interval)
+        follows_batches, follows_time = self.write_follow_rows(snapshot.export_rows("follows"),
+                                                               batch_size, commit_interval)
+        achats_batches, achats_time = self.write_achat_rows(snapshot.export_rows("achats"),
+                                                            batch_size, commit_interval)
+
+        # Les identifiants chargés n'ont pas été vus par le générateur
+        self.generator.registry.loaded = False
+
+        return {
+            "counts": {
+                entity: sum(batch["rows"] for batch in batches)
+                for entity, batches in (("utilisateurs", users_batches), ("produits", produits_batches),
+                                        ("follows", follows_batches), ("achats", achats_batches))
+            }
+        }, users_time + produits_time + follows_time + achats_time
+
+    def export_rows(self, entity):
+        if entity not in EXPORT_QUERIES:
+            raise ValueError(f"Entité inconnue : {entity}")
 
-            return result, (end_time - start_time).total_seconds() * 1000
-
-    def db_size(self):
         with self.neo4j_driver.session() as session:
-            start_time = datetime.now()
-            result = session.run("MATCH (u:Utilisateur) RETURN count(u) AS nb_utilisateurs")
-            nb_utilisateurs = result.single()["nb_utilisateurs"]
+            for record in session.run(EXPORT_QUERIES[entity]):
+                yield tuple(record.values())
 
-            result = session.run("MATCH ()-[:FOLLOWS]->() RETURN count(*) AS nb_follows")
-            nb_follows = result.single()["nb_follows"]
+    def clear_caches(self):
+        with self.neo4j_driver.session() as session:
+            session.run("CALL db.clearQueryCaches()").consume()
 
-            result = session.run("MATCH (p:Produit) RETURN count(p) AS nb_produits")
-            nb_produits = result.single()["nb_produits"]
+    def select_users(self, num_users, sampling="uniform"):
+        return self.sample_nodes("Utilisateur", "n.id AS id, n.nom AS nom", num_users, sampling)
 
-            result = session.run("MATCH ()-[:ACHAT]->() RETURN count(*) AS nb_achats")
-            nb_achats = result.single()["nb_achats"]
+    def select_produits(self, num_produits, sampling="uniform"):
+        return self.sample_nodes("Produit", "n.id AS id, n.nom AS nom, n.prix AS prix", num_produits, sampling)
 
-            end_time = datetime.now()
-            return {
-                "nb_utilisateurs": nb_utilisateurs,
-                "nb_follows": nb_follows,
-                "nb_produits": nb_produits,
-                "nb_achats": nb_achats
-            }, (end_time - start_time).total_seconds() * 1000
+    def sample_nodes(self, label, returns, num, sampling):
+        self.check_sampling(sampling)
+        num = int(num)
+        if sampling == "fast":
+            return self.fetch_query(FAST_SAMPLE_QUERY.format(label=label, returns=returns),
+                                    lambda record: record.data(), num=num, start=random.random())
 
-    def requestGlobalFollows(self):
+        timer = PhaseTimer()
         with self.neo4j_driver.session() as session:
-            start_time = datetime.now()
-            result = session.run("""
-                MATCH (u:Utilisateur)
-                OPTIONAL MATCH (f)-[:FOLLOWS]->(u)
-                RETURN u.id AS id, u.nom AS nom, COUNT(f) AS nb_followers ORDER BY nb_followers DESC
-            """)
-            end_time = datetime.now()
-
-            result = [record.data() for record in result]
-
-            return result, (end_time - start_time).total_seconds() * 1000
+            start_ns = time.perf_counter_ns()
+            records = session.execute_read(self.uniform_sample, timer, label, returns, num)
+            timer.add("transaction", elapsed_ms(start_ns) - timer.total())
+
+        with timer.phase("convert"):
+            # Plus de noeuds que demandé : on réduit au hasard
+            results = [record.data() for record in random.sample(records, min(num, len(records)))]
+
+        return results, timer.timing()
+
+    @staticmethod
+    def uniform_sample(tx, timer, label, returns, num):
+        # La fonction peut être rejouée par execute_read : seules les phases du dernier essai sont gardées
+        timer.phases.clear()
+        records = {}
+        probes = max(int(num * SAMPLE_MARGIN), 1)
+        with timer.phase("execute"):
+            for _ in range(SAMPLE_ROUNDS):
+                result = tx.run(UNIFORM_SAMPLE_QUERY.format(label=label, returns=returns),
+                                starts=[random.random() for _ in range(probes)])
+                for record in result:
+                    records.setdefault(record["id"], record)
+                if len(records) >= num:
+                    return list(records.values())
+                probes *= 4
+            # Label plus petit que l'échantillon ou rnd pas encore renseigné partout : tirage exact, tri complet
+            return list(tx.run(f"MATCH (n:{label}) RETURN {returns} ORDER BY rand() LIMIT $num", num=num))
+
+    def db_size(self, exact=False):
+        timer = PhaseTimer()
+        with self.neo4j_driver.session() as session:
+            with timer.phase("execute"):
+                if exact:
+                    size = self.exact_counts(session)
+                else:
+                    size = session.run(COUNT_STORE_QUERY).single().data()
+            with timer.phase("storage"):
+                storage = self.storage_sizes(session)
+
+        size["method"] = "count" if exact else "count_store"
+        size["storage"] = storage
+        return size, timer.timing()
+
+    @staticmethod
+    def exact_counts(session):
+        result = session.run("MATCH (u:Utilisateur) RETURN count(u) AS nb_utilisateurs")
+        nb_utilisateurs = result.single()["nb_utilisateurs"]
+
+        result = session.run("MATCH ()-[:FOLLOWS]->() RETURN count(*) AS nb_follows")
+        nb_follows = result.single()["nb_follows"]
+
+        result = session.run("MATCH (p:Produit) RETURN count(p) AS nb_produits")
+        nb_produits = result.single()["nb_produits"]
+
+        result = session.run("MATCH ()-[:ACHAT]->() RETURN count(*) AS nb_achats")
+        nb_achats = result.single()["nb_achats"]
+
+        return {
+            "nb_utilisateurs": nb_utilisateurs,
+            "nb_follows": nb_follows,
+            "nb_produits": nb_produits,
+            "nb_achats": nb_achats
+        }
+
+    def storage_sizes(self, session):
+        database_path = os.path.join(self.data_dir, "databases", NEO4J_DATABASE)
+        if not os.path.isdir(database_path):
+            return None
+
+        # Fichiers d'index rangés sous schema/index/<fournisseur>/<id de l'index>/
+        index_names = {str(record["id"]): record["name"] for record in session.run("SHOW INDEXES YIELD id, name")}
+        index_sizes = {}
+        index_path = os.path.join(database_path, "schema", "index")
+        if os.path.isdir(index_path):
+            for provider in os.listdir(index_path):
+                for index_id in os.listdir(os.path.join(index_path, provider)):
+                    name = index_names.get(index_id, index_id)
+                    index_sizes[name] = index_sizes.get(name, 0) + directory_size(
+                        os.path.join(index_path, provider, index_id))
+
+        return {
+            "database": directory_size(database_path),
+            "transactions": directory_size(os.path.join(self.data_dir, "transactions", NEO4J_DATABASE)),
+            "store_files": {entry.name: file_size(entry.path) for entry in os.scandir(database_path)
+                            if entry.is_file()},
+            "index_sizes": index_sizes
+        }
+
+    def requestGlobalFollows(self, exact=False, limit=None, cursor=None):
+        return self.fetch_page(GLOBAL_FOLLOWS_QUERY if exact else GLOBAL_FOLLOWS_PRECOMPUTED_QUERY, limit, cursor,
+                               lambda record: record.data(), "nb_followers", "id")
+
+    def requestGlobalAchatsByProduit(self, exact=False, limit=None, cursor=None):
+        results, execution_time = self.fetch_page(GLOBAL_ACHATS_QUERY if exact else GLOBAL_ACHATS_PRECOMPUTED_QUERY,
+                                                  limit, cursor, lambda record: record.data(),
+                                                  "num_buyers", "product_id")
+
+        # Une page a déjà la forme {"results", "next_cursor"}
+        return (results if limit is not None else {"results": results}), execution_time
+
+    def streamGlobalFollows(self, exact=False):
+        query = GLOBAL_FOLLOWS_QUERY if exact else GLOBAL_FOLLOWS_PRECOMPUTED_QUERY
+        with self.neo4j_driver.session() as session:
+            for record in session.run(query.format(keyset="", limit="")):
+                yield record.data()
 
-    def requestGlobalAchatsByProduit(self):
+    def streamGlobalAchatsByProduit(self, exact=False):
+        query = GLOBAL_ACHATS_QUERY if exact else GLOBAL_ACHATS_PRECOMPUTED_QUERY
         with self.neo4j_driver.session() as session:
-            start_time = datetime.now()
+            for record in session.run(query.format(keyset="", limit="")):
+                yield record.data()
 
-            result = session.run("""
-                MATCH (u:Utilisateur)-[:ACHAT]->(p:Produit)
-                RETURN 
-                    p.id AS product_id, 
-                    p.nom AS product_name, 
-                    COUNT(DISTINCT u) AS num_buyers
-                ORDER BY num_buyers DESC
-            """)
+    def requestSpecific1(self, user_id, max_level=3, distinct=False, limit=None, cursor=None):
+        query = SPECIFIC1_QUERIES[(self.check_deep_level(max_level), distinct)]
 
-            end_time = datetime.now()
+        return self.fetch_page(query, limit, cursor,
+                               lambda row: {"product_id": row["product_id"], "product_name": row["product_name"],
+                                            "nb_achats": row["nb_achats"]},
+                               "nb_achats", "product_id", user_id=user_id)
 
-            results = [record.data() for record in result]
+    def requestSpecific2(self, user_id, product_id, max_level=3, distinct=False):
+        query = SPECIFIC2_QUERIES[(self.check_deep_level(max_level), distinct)]
 
-            return {"results": results}, (end_time - start_time).total_seconds() * 1000
+        records, execution_time = self.fetch_query(query, lambda row: row["nb_achats"],
+                                                   user_id=user_id, product_id=product_id)
 
-    def requestSpecific1(self, user_id, max_level=3):
-        query = f"""
-        MATCH (follower)-[:FOLLOWS*1..{max_level}]->(u:Utilisateur {{id: "{user_id}"}})
-        MATCH (follower)-[:ACHAT]->(p:Produit)
-        RETURN 
-            p.id AS product_id, 
-            p.nom AS product_name, 
-            COUNT(*) AS nb_achats
-        ORDER BY nb_achats DESC
-        """
+        return records[0], execution_time
 
-        start_time = datetime.now()
-        with self.neo4j_driver.session() as session:
-            result = session.run(query)
-            records = result.data()
+    def requestSpecific3(self, product_id, max_level=3, distinct=False):
+        query = SPECIFIC3_QUERIES[(self.check_deep_level(max_level), distinct)]
 
-        end_time = datetime.now()
+        return self.fetch_query(query, lambda row: {"product_id": row["product_id"], "product_name": row["product_name"],
+                                                    "num_buyers": row["num_buyers"]}, product_id=product_id)
 
-        results = [
-            {"product_id": row["product_id"], "product_name": row["product_name"], "nb_achats": row["nb_achats"]}
-            for row in records
-        ]
+    def requestSpecific1Batch(self, user_ids, max_level=3, distinct=False):
+        user_ids = self.check_batch_ids(user_ids)
+        query = BATCH_SPECIFIC1_QUERIES[(self.check_deep_level(max_level), distinct)]
 
-        return results, (end_time - start_time).total_seconds() * 1000
+        rows, execution_time = self.fetch_query(query, lambda row: (row["anchor"], {
+            "product_id": row["product_id"], "product_name": row["product_name"], "nb_achats": row["nb_achats"]
+        }), ids=user_ids)
 
-    def requestSpecific2(self, user_id, product_id, max_level=3):
-        query = f"""
-        MATCH (follower)-[:FOLLOWS*1..{max_level}]->(u:Utilisateur {{id: "{user_id}"}})
-        MATCH (follower)-[:ACHAT]->(p:Produit {{id: "{product_id}"}})
-        RETURN
-            COUNT(*) AS nb_achats
-        ORDER BY nb_achats DESC
-        """
+        return self.group_by_anchor(user_ids, rows), execution_time
 
-        start_time = datetime.now()
-        with self.neo4j_driver.session() as session:
-            result = session.run(query)
-            records = [record.data() for record in result]
+    def requestSpecific2Batch(self, user_ids, product_id, max_level=3, distinct=False):
+        user_ids = self.check_batch_ids(user_ids)
+        query = BATCH_SPECIFIC2_QUERIES[(self.check_deep_level(max_level), distinct)]
 
-        end_time = datetime.now()
+        rows, execution_time = self.fetch_query(query, lambda row: (row["anchor"], row["nb_achats"]),
+                                                ids=user_ids, product_id=product_id)
 
-        return records[0]["nb_achats"], (end_time - start_time).total_seconds() * 1000
+        results = dict.fromkeys(user_ids, 0)
+        results.update(rows)
+        return results, execution_time
 
-    def requestSpecific3(self, product_id, max_level=3):
-        query = f"""
-        MATCH (follower)-[:FOLLOWS*1..{max_level}]->(u:Utilisateur)
-        MATCH (follower)-[:ACHAT]->(p:Produit {{id: "{product_id}"}})
-        RETURN p.id AS product_id, p.nom AS product_name, COUNT(DISTINCT follower) AS num_buyers
-        ORDER BY num_buyers DESC
-        """
+    def requestSpecific3Batch(self, product_ids, max_level=3, distinct=False):
+        product_ids = self.check_batch_ids(product_ids)
+        query = BATCH_SPECIFIC3_QUERIES[(self.check_deep_level(max_level), distinct)]
 
-        start_time = datetime.now()
-        with self.neo4j_driver.session() as session:
-            result = session.run(query)
-            records = result.data()
+        rows, execution_time = self.fetch_query(query, lambda row: (row["anchor"], {
+            "product_id": row["product_id"], "product_name": row["product_name"], "num_buyers": row["num_buyers"]
+        }), ids=product_ids)
 
-        end_time = datetime.now()
+        return self.group_by_anchor(product_ids, rows), execution_time
 
-        results = [
-            {"product_id": row["product_id"], "product_name": row["product_name"], "num_buyers": row["num_buyers"]}
-            for row in records
-        ]
+    def fetch_page(self, query, limit, cursor, convert, count_key, id_key, **params):
+        # Sans limit, la requête complète d'origine et une liste de lignes
+        if limit is None:
+            return self.fetch_query(query.format(keyset="", limit=""), convert, **params)
 
-        return results, (end_time - start_time).total_seconds() * 1000
+        limit, cursor = self.check_page(limit, cursor)
+        keyset = ""
+        if cursor is not None:
+            keyset = KEYSET.format(count=count_key, id=id_key)
+            params.update(cursor_count=cursor[0], cursor_id=cursor[1])
+        rows, execution_time = self.fetch_query(query.format(keyset=keyset, limit="LIMIT $limit"), convert,
+                                                limit=limit + 1, **params)
+        return self.page(rows, limit, count_key, id_key), execution_time
+
+    def fetch_query(self, query, convert, **params):
+        timer = PhaseTimer()
+        with self.neo4j_driver.session() as session:
+            start_ns = time.perf_counter_ns()
+            records, summary = session.execute_read(self.read_data, timer, query, **params)
+            # Le reste de execute_read : ouverture et commit de la transaction, essais rejoués
+            timer.add("transaction", elapsed_ms(start_ns) - timer.total())
+
+        with timer.phase("convert"):
+            results = [convert(record) for record in records]
+
+        return results, timer.timing({
+            "result_available_after": summary.result_available_after,
+            "result_consumed_after": summary.result_consumed_after
+        })
+
+    @staticmethod
+    def read_data(tx, timer, query, **params):
+        # La fonction peut être rejouée par execute_read : seules les phases du dernier essai sont gardées
+        timer.phases.clear()
+        with timer.phase("send"):
+            result = tx.run(query, **params)
+        with timer.phase("fetch"):
+            records = list(result)
+        return records, result.consume()
@@ -1,314 +1,1402 @@
+import csv
+import hashlib
+import io
 import os
 import random
+import threading
+import time
 import uuid
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
 
-import psycopg2
+from psycopg2.errors import FeatureNotSupported, UndefinedFunction
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection
+from psycopg2.pool import ThreadedConnectionPool
 
 from app.db.base_db import *
-from app.utils import execute_with_timer
+from app.db.generator import GraphGenerator
+from app.utils import PhaseTimer, batched, elapsed_ms, execute_with_timer
 
+STREAM_ITERSIZE = 5000
+# Marge sur la taille de l'échantillon : le nombre de lignes renvoyées par TABLESAMPLE est lui-même aléatoire
+SAMPLE_MARGIN = 1.5
+SAMPLE_MIN_PAGES = 2
+TABLESAMPLE_METHODS = {"uniform": "BERNOULLI", "fast": "SYSTEM"}
+# Clé du verrou consultatif qui sérialise les chargements massifs différés, tous processus confondus
+BULK_LOAD_LOCK = 0x6e6f73716c
+# Clé du verrou consultatif de transaction qui sérialise le DDL d'init_db entre workers
+SCHEMA_LOCK = 0x6e6f73716d
+SIZE_TABLES = ("utilisateurs", "followers", "produits", "achats")
+# auto : plans personnalisés pour les 5 premières exécutions, puis plan générique s'il n'est pas plus cher
+PLAN_CACHE_MODES = ("auto", "force_generic_plan", "force_custom_plan")
+# Erreurs d'une instruction préparée sur un schéma qui a changé depuis
+STALE_STATEMENT_ERRORS = (FeatureNotSupported, UndefinedFunction)
 
-class PostgresDB(base_db):
+INSERT_USER = "INSERT INTO utilisateurs (id, nom) VALUES (%s, %s) RETURNING id;"
+INSERT_FOLLOW = "INSERT INTO followers (utilisateur_id, follower_id) VALUES (%s, %s) ON CONFLICT DO NOTHING;"
+INSERT_PRODUIT = "INSERT INTO produits (id, nom, prix) VALUES (%s, %s, %s) RETURNING id;"
+INSERT_ACHAT = ("INSERT INTO achats (utilisateur_id, produit_id, date_achat) VALUES (%s, %s, %s) "
+                "ON CONFLICT DO NOTHING;")
+
+ID_TYPES = {"varchar": "VARCHAR(36)", "uuid": "UUID"}
+
+ID_COLUMNS = (
+    ("utilisateurs", "id"),
+    ("produits", "id"),
+    ("followers", "utilisateur_id"),
+    ("followers", "follower_id"),
+    ("achats", "utilisateur_id"),
+    ("achats", "produit_id")
+)
+
+# Deux sémantiques de parcours : "path" compte un follower une fois par chemin (UNION ALL),
+# "distinct" est un BFS avec ensemble de visités : une ligne par niveau porte la frontière, les visités et les
+# utilisateurs atteints, et un utilisateur déjà visité n'est jamais ré-expansé (EXCEPT, par hachage).
+# array_agg dans le terme initial : un tableau sans modificateur de type, comme ceux du terme récursif
+# (ARRAY[u.id] garderait le VARCHAR(36) et PostgreSQL refuserait la récursion)
+FOLLOWER_HIERARCHY = {
+    False: """
+        follower_hierarchy AS (
+            SELECT follower_id, utilisateur_id, 1 AS level
+            FROM followers
+            WHERE utilisateur_id = %s
+            UNION ALL
+            SELECT f.follower_id, f.utilisateur_id, fh.level + 1
+            FROM followers f
+            INNER JOIN follower_hierarchy fh ON f.utilisateur_id = fh.follower_id
+            WHERE fh.level < %s
+        )
+    """,
+    True: """
+        follower_bfs AS (
+            SELECT 0 AS level, array_agg(u.id) AS frontier, array_agg(u.id) AS visited, array_agg(u.id) AS reached
+            FROM utilisateurs u
+            WHERE u.id = %s
+            UNION ALL
+            SELECT b.level + 1, n.frontier, b.visited || n.frontier, r.reached
+            FROM follower_bfs b
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(SELECT DISTINCT f.follower_id FROM followers f WHERE f.utilisateur_id = ANY(b.frontier))
+                    AS reached
+            ) r
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(SELECT unnest(r.reached) EXCEPT SELECT unnest(b.visited)) AS frontier
+            ) n
+            WHERE b.level < %s AND cardinality(b.frontier) > 0
+        ),
+        follower_hierarchy AS (
+            SELECT DISTINCT h.follower_id
+            FROM follower_bfs b, unnest(b.reached) AS h(follower_id)
+            WHERE b.level > 0
+        )
+    """
+}
+
+FOLLOWER_CIRCLE = {
+    False: """
+        follower_circle AS (
+            SELECT a.utilisateur_id, 1 AS level
+            FROM achats a
+            WHERE a.produit_id = %s
+            UNION ALL
+            SELECT f.follower_id, fc.level + 1 AS level
+            FROM followers f
+            JOIN follower_circle fc ON f.utilisateur_id = fc.utilisateur_id
+            WHERE fc.level < %s
+        )
+    """,
+    True: """
+        circle_bfs AS (
+            SELECT 1 AS level, array_agg(a.utilisateur_id) AS frontier, array_agg(a.utilisateur_id) AS visited,
+                   array_agg(a.utilisateur_id) AS reached
+            FROM achats a
+            WHERE a.produit_id = %s
+            UNION ALL
+            SELECT b.level + 1, n.frontier, b.visited || n.frontier, r.reached
+            FROM circle_bfs b
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(SELECT DISTINCT f.follower_id FROM followers f WHERE f.utilisateur_id = ANY(b.frontier))
+                    AS reached
+            ) r
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(SELECT unnest(r.reached) EXCEPT SELECT unnest(b.visited)) AS frontier
+            ) n
+            WHERE b.level < %s AND cardinality(b.frontier) > 0
+        ),
+        follower_circle AS (
+            SELECT DISTINCT c.utilisateur_id
+            FROM circle_bfs b, unnest(b.reached) AS c(utilisateur_id)
+        )
+    """
+}
+
+SPECIFIC1_QUERIES = {
+    distinct: f"""
+        WITH RECURSIVE {hierarchy}
+        SELECT p.id AS product_id, p.nom AS product_name, COUNT(*) AS nb_achats
+        FROM follower_hierarchy fh
+        JOIN achats a ON fh.follower_id = a.utilisateur_id
+        JOIN produits p ON a.produit_id = p.id
+        GROUP BY p.id, p.nom
+        {{keyset}}
+        ORDER BY nb_achats DESC, p.id
+        {{limit}};
+    """
+    for distinct, hierarchy in FOLLOWER_HIERARCHY.items()
+}
+SPECIFIC1_KEYSET = "HAVING COUNT(*) < %s OR (COUNT(*) = %s AND p.id > %s)"
+
+SPECIFIC2_QUERIES = {
+    distinct: f"""
+        WITH RECURSIVE {hierarchy}
+        SELECT COUNT(*) AS nb_achats
+        FROM follower_hierarchy fh
+        JOIN achats a ON fh.follower_id = a.utilisateur_id
+        WHERE a.produit_id = %s;
+    """
+    for distinct, hierarchy in FOLLOWER_HIERARCHY.items()
+}
+
+SPECIFIC3_QUERIES = {
+    distinct: f"""
+        WITH RECURSIVE {circle}
+        SELECT p.id AS product_id, p.nom AS product_name, COUNT(DISTINCT a.utilisateur_id) AS num_buyers
+        FROM produits p
+        JOIN achats a ON p.id = a.produit_id
+        JOIN follower_circle fc ON a.utilisateur_id = fc.utilisateur_id
+        WHERE p.id = %s
+        GROUP BY p.id, p.nom
+        ORDER BY num_buyers DESC;
+    """
+    for distinct, circle in FOLLOWER_CIRCLE.items()
+}
+
+EXPORT_QUERIES = {
+    "utilisateurs": "SELECT id, nom FROM utilisateurs;",
+    "follows": "SELECT utilisateur_id, follower_id FROM followers;",
+    "produits": "SELECT id, nom, prix FROM produits;",
+    "achats": "SELECT utilisateur_id, produit_id, date_achat FROM achats;"
+}
+
+# Index secondaires des requêtes analytiques : recherches inverses des parcours et tris des compteurs
+SECONDARY_INDEXES = (
+    ("followers_follower_id_idx", "followers", "follower_id"),
+    ("achats_produit_id_idx", "achats", "produit_id"),
+    ("utilisateurs_nb_followers_idx", "utilisateurs", "nb_followers DESC"),
+    ("produits_num_buyers_idx", "produits", "num_buyers DESC")
+)
+
+# Entité d'export -> (table, colonnes), dans l'ordre des colonnes de EXPORT_QUERIES
+IMPORT_TABLES = {
+    "utilisateurs": ("utilisateurs", ("id", "nom")),
+    "produits": ("produits", ("id", "nom", "prix")),
+    "follows": ("followers", ("utilisateur_id", "follower_id")),
+    "achats": ("achats", ("utilisateur_id", "produit_id", "date_achat"))
+}
+
+FOREIGN_KEYS = (
+    ("followers", "followers_utilisateur_id_fkey", "utilisateur_id", "utilisateurs"),
+    ("followers", "followers_follower_id_fkey", "follower_id", "utilisateurs"),
+    ("achats", "achats_utilisateur_id_fkey", "utilisateur_id", "utilisateurs"),
+    ("achats", "achats_produit_id_fkey", "produit_id", "produits")
+)
+
+# Variantes multi-ancres : un seul parcours récursif amorcé par toutes les ancres (= ANY), chaque ligne
+# portant la racine dont elle descend ; les deux sémantiques sont conservées ancre par ancre
+BATCH_FOLLOWER_HIERARCHY = {
+    False: """
+        follower_hierarchy AS (
+            SELECT utilisateur_id AS root, follower_id, 1 AS level
+            FROM followers
+            WHERE utilisateur_id = ANY(%s)
+            UNION ALL
+            SELECT fh.root, f.follower_id, fh.level + 1
+            FROM followers f
+            INNER JOIN follower_hierarchy fh ON f.utilisateur_id = fh.follower_id
+            WHERE fh.level < %s
+        )
+    """,
+    True: """
+        follower_bfs AS (
+            SELECT u.id AS root, 0 AS level, array_agg(u.id) AS frontier, array_agg(u.id) AS visited,
+                   array_agg(u.id) AS reached
+            FROM utilisateurs u
+            WHERE u.id = ANY(%s)
+            GROUP BY u.id
+            UNION ALL
+            SELECT b.root, b.level + 1, n.frontier, b.visited || n.frontier, r.reached
+            FROM follower_bfs b
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(SELECT DISTINCT f.follower_id FROM followers f WHERE f.utilisateur_id = ANY(b.frontier))
+                    AS reached
+            ) r
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(SELECT unnest(r.reached) EXCEPT SELECT unnest(b.visited)) AS frontier
+            ) n
+            WHERE b.level < %s AND cardinality(b.frontier) > 0
+        ),
+        follower_hierarchy AS (
+            SELECT DISTINCT b.root, h.follower_id
+            FROM follower_bfs b, unnest(b.reached) AS h(follower_id)
+            WHERE b.level > 0
+        )
+    """
+}
+
+BATCH_FOLLOWER_CIRCLE = {
+    False: """
+        follower_circle AS (
+            SELECT a.produit_id AS root, a.utilisateur_id, 1 AS level
+            FROM achats a
+            WHERE a.produit_id = ANY(%s)
+            UNION ALL
+            SELECT fc.root, f.follower_id, fc.level + 1 AS level
+            FROM followers f
+            JOIN follower_circle fc ON f.utilisateur_id = fc.utilisateur_id
+            WHERE fc.level < %s
+        )
+    """,
+    True: """
+        circle_bfs AS (
+            SELECT a.produit_id AS root, 1 AS level, array_agg(a.utilisateur_id) AS frontier,
+                   array_agg(a.utilisateur_id) AS visited, array_agg(a.utilisateur_id) AS reached
+            FROM achats a
+            WHERE a.produit_id = ANY(%s)
+            GROUP BY a.produit_id
+            UNION ALL
+            SELECT b.root, b.level + 1, n.frontier, b.visited || n.frontier, r.reached
+            FROM circle_bfs b
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(SELECT DISTINCT f.follower_id FROM followers f WHERE f.utilisateur_id = ANY(b.frontier))
+                    AS reached
+            ) r
+            CROSS JOIN LATERAL (
+                SELECT ARRAY(SELECT unnest(r.reached) EXCEPT SELECT unnest(b.visited)) AS frontier
+            ) n
+            WHERE b.level < %s AND cardinality(b.frontier) > 0
+        ),
+        follower_circle AS (
+            SELECT DISTINCT b.root, c.utilisateur_id
+            FROM circle_bfs b, unnest(b.reached) AS c(utilisateur_id)
+        )
+    """
+}
+
+BATCH_SPECIFIC1_QUERIES = {
+    distinct: f"""
+        WITH RECURSIVE {hierarchy}
+        SELECT fh.root, p.id AS product_id, p.nom AS product_name, COUNT(*) AS nb_achats
+        FROM follower_hierarchy fh
+        JOIN achats a ON fh.follower_id = a.utilisateur_id
+        JOIN produits p ON a.produit_id = p.id
+        GROUP BY fh.root, p.id, p.nom
+        ORDER BY fh.root, nb_achats DESC;
+    """
+    for distinct, hierarchy in BATCH_FOLLOWER_HIERARCHY.items()
+}
+
+BATCH_SPECIFIC2_QUERIES = {
+    distinct: f"""
+        WITH RECURSIVE {hierarchy}
+        SELECT fh.root, COUNT(*) AS nb_achats
+        FROM follower_hierarchy fh
+        JOIN achats a ON fh.follower_id = a.utilisateur_id
+        WHERE a.produit_id = %s
+        GROUP BY fh.root;
+    """
+    for distinct, hierarchy in BATCH_FOLLOWER_HIERARCHY.items()
+}
+
+BATCH_SPECIFIC3_QUERIES = {
+    distinct: f"""
+        WITH RECURSIVE {circle}
+        SELECT p.id AS product_id, p.nom AS product_name, COUNT(DISTINCT a.utilisateur_id) AS num_buyers
+        FROM produits p
+        JOIN achats a ON p.id = a.produit_id
+        JOIN follower_circle fc ON a.utilisateur_id = fc.utilisateur_id AND fc.root = p.id
+        GROUP BY p.id, p.nom;
+    """
+    for distinct, circle in BATCH_FOLLOWER_CIRCLE.items()
+}
+
+# Pagination par jeu de clés : {keyset} reprend strictement après la dernière ligne servie, {limit} borne la page
+# (LIMIT permet un tri top-N au lieu d'un tri complet) ; les deux restent vides pour la requête complète
+GLOBAL_FOLLOWS_QUERY = """
+    SELECT u.id, u.nom, COUNT(f.utilisateur_id) AS nb_followers
+    FROM utilisateurs u
+    LEFT JOIN followers f ON u.id = f.follower_id
+    GROUP BY u.id, u.nom
+    {keyset}
+    ORDER BY nb_followers DESC, u.id
+    {limit};
+"""
+GLOBAL_FOLLOWS_KEYSET = "HAVING COUNT(f.utilisateur_id) < %s OR (COUNT(f.utilisateur_id) = %s AND u.id > %s)"
+
+GLOBAL_FOLLOWS_PRECOMPUTED_QUERY = """
+    SELECT id, nom, nb_followers
+    FROM utilisateurs
+    {keyset}
+    ORDER BY nb_followers DESC, id
+    {limit};
+"""
+GLOBAL_FOLLOWS_PRECOMPUTED_KEYSET = "WHERE nb_followers < %s OR (nb_followers = %s AND id > %s)"
+
+GLOBAL_ACHATS_QUERY = """
+    SELECT p.id AS product_id, p.nom AS product_name, COUNT(DISTINCT a.utilisateur_id) AS num_buyers
+    FROM achats a
+    JOIN produits p ON a.produit_id = p.id
+    GROUP BY p.id, p.nom
+    {keyset}
+    ORDER BY num_buyers DESC, p.id
+    {limit};
+"""
+GLOBAL_ACHATS_KEYSET = ("HAVING COUNT(DISTINCT a.utilisateur_id) < %s "
+                        "OR (COUNT(DISTINCT a.utilisateur_id) = %s AND p.id > %s)")
+
+GLOBAL_ACHATS_PRECOMPUTED_QUERY = """
+    SELECT id AS product_id, nom AS product_name, num_buyers
+    FROM produits
+    WHERE num_buyers > 0
+    {keyset}
+    ORDER BY num_buyers DESC, id
+    {limit};
+"""
+GLOBAL_ACHATS_PRECOMPUTED_KEYSET = "AND (num_buyers < %s OR (num_buyers = %s AND id > %s))"
+
+GLOBAL_FOLLOWS_QUERIES = {
+    True: (GLOBAL_FOLLOWS_QUERY, GLOBAL_FOLLOWS_KEYSET),
+    False: (GLOBAL_FOLLOWS_PRECOMPUTED_QUERY, GLOBAL_FOLLOWS_PRECOMPUTED_KEYSET)
+}
+
+GLOBAL_ACHATS_QUERIES = {
+    True: (GLOBAL_ACHATS_QUERY, GLOBAL_ACHATS_KEYSET),
+    False: (GLOBAL_ACHATS_PRECOMPUTED_QUERY, GLOBAL_ACHATS_PRECOMPUTED_KEYSET)
+}
+
+
+class PreparedConnection(connection):
+    # Requêtes préparées de la session serveur : une connexion rouverte par le pool repart d'un ensemble vide
+    prepared = None
+    statements_epoch = None
+    plan_cache_mode = None
+
+
+@lru_cache(maxsize=None)
+def prepared_statement(query):
+    # Nom stable dérivé du texte : chaque requête (et chaque variante keyset / limit) a sa propre instruction
+    name = "stmt_" + hashlib.md5(query.encode("utf-8")).hexdigest()[:16]
+    parts = query.split("%s")
+    positional = parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], start=1))
+    arguments = f" ({', '.join(['%s'] * (len(parts) - 1))})" if len(parts) > 1 else ""
+    return name, f"PREPARE {name} AS {positional}", f"EXECUTE {name}{arguments};"
+
+
+class PostgresDB(GeneratedBackend, base_db):
     def __init__(self):
-        self.pg_conn = psycopg2.connect(
+        self.id_type = os.getenv("POSTGRES_ID_TYPE", "varchar")
+        if self.id_type not in ID_TYPES:
+            raise ValueError(f"Type d'identifiant inconnu : {self.id_type}")
+        self.bulk_defer_threshold = int(os.getenv("POSTGRES_BULK_DEFER_THRESHOLD", 100000))
+        self.rebuild_workers = int(os.getenv("POSTGRES_REBUILD_WORKERS", 4))
+        self.explain = os.getenv("POSTGRES_EXPLAIN", "false").lower() == "true"
+        self.prepared = os.getenv("POSTGRES_PREPARED", "true").lower() == "true"
+        self.set_plan_cache_mode(os.getenv("POSTGRES_PLAN_CACHE_MODE", "auto"))
+        # Incrémenté quand le schéma change le type des colonnes : les requêtes préparées avant sont abandonnées
+        self.statements_epoch = 0
+        self.generator = GraphGenerator()
+        self.pool_min = int(os.getenv("POSTGRES_POOL_MIN", 1))
+        self.pool_max = int(os.getenv("POSTGRES_POOL_MAX", 10))
+        self.pg_pool = ThreadedConnectionPool(
+            self.pool_min,
+            self.pool_max,
             host=os.getenv("POSTGRES_HOST"),
             database=os.getenv("POSTGRES_DB"),
             user=os.getenv("POSTGRES_USER"),
             password=os.getenv("POSTGRES_PASSWORD"),
-            port=os.getenv("POSTGRES_PORT")
+            port=os.getenv("POSTGRES_PORT"),
+            connection_factory=PreparedConnection
         )
-        self.pg_cursor = self.pg_conn.cursor()
+        # ThreadedConnectionPool lève une erreur quand il est vide : on fait attendre les requêtes à la place
+        self.pool_slots = threading.BoundedSemaphore(self.pool_max)
+        self.pool_waiting = 0
+        self.pool_lock = threading.Lock()
+        # Chargement massif différé en cours dans ce thread : les appels imbriqués (morceaux d'un job) n'y touchent pas
+        self.bulk_local = threading.local()
+
+    @contextmanager
+    def connection(self):
+        with self.pool_lock:
+            self.pool_waiting += 1
+        self.pool_slots.acquire()
+        with self.pool_lock:
+            self.pool_waiting -= 1
+
+        pg_conn = None
+        try:
+            pg_conn = self.pg_pool.getconn()
+            self.configure_connection(pg_conn)
+            yield pg_conn
+        finally:
+            if pg_conn is not None:
+                self.pg_pool.putconn(pg_conn, close=bool(pg_conn.closed))
+            self.pool_slots.release()
+
+    @contextmanager
+    def transaction(self, cursor_name=None):
+        with self.connection() as pg_conn:
+            try:
+                # Un curseur nommé est un curseur côté serveur : les lignes arrivent par paquets de itersize
+                with pg_conn.cursor(name=cursor_name) as pg_cursor:
+                    if cursor_name:
+                        pg_cursor.itersize = STREAM_ITERSIZE
+                    yield pg_cursor
+                pg_conn.commit()
+            except Exception:
+                if not pg_conn.closed:
+                    pg_conn.rollback()
+                raise
+
+    @contextmanager
+    def advisory_lock(self, key):
+        # Verrou de session tenu sur sa propre connexion hors transaction : le serveur le libère aussi
+        # si le processus meurt en cours de route
+        with self.connection() as pg_conn:
+            start_ns = time.perf_counter_ns()
+            with pg_conn.cursor() as pg_cursor:
+                pg_cursor.execute("SELECT pg_advisory_lock(%s);", (key,))
+            pg_conn.commit()
+            wait_time = elapsed_ms(start_ns)
+            try:
+                yield wait_time
+            finally:
+                try:
+                    with pg_conn.cursor() as pg_cursor:
+                        pg_cursor.execute("SELECT pg_advisory_unlock(%s);", (key,))
+                    pg_conn.commit()
+                except Exception:
+                    # Fermer la session libère le verrou
+                    pg_conn.close()
+
+    def set_plan_cache_mode(self, plan_cache_mode):
+        if plan_cache_mode not in PLAN_CACHE_MODES:
+            raise ValueError(f"Mode de cache des plans inconnu : {plan_cache_mode}")
+        # Appliqué à chaque connexion à son prochain emprunt
+        self.plan_cache_mode = plan_cache_mode
+
+    def configure_connection(self, pg_conn):
+        if pg_conn.statements_epoch == self.statements_epoch and pg_conn.plan_cache_mode == self.plan_cache_mode:
+            return
+        with pg_conn.cursor() as pg_cursor:
+            if pg_conn.statements_epoch != self.statements_epoch:
+                pg_cursor.execute("DEALLOCATE ALL;")
+            # Réglage de session (is_local = false) : il survit à la transaction, pas à la connexion
+            pg_cursor.execute("SELECT set_config('plan_cache_mode', %s, false);", (self.plan_cache_mode,))
+        pg_conn.commit()
+        if pg_conn.statements_epoch != self.statements_epoch:
+            pg_conn.prepared = set()
+            pg_conn.statements_epoch = self.statements_epoch
+        pg_conn.plan_cache_mode = self.plan_cache_mode
+
+    def prepare(self, pg_cursor, query, params, timer=None):
+        # Analyse et réécriture une seule fois par connexion ; la planification a lieu à chaque EXECUTE,
+        # sauf quand le plan générique mis en cache est retenu
+        if not self.prepared:
+            return query, params
+        name, prepare_sql, execute_sql = prepared_statement(query)
+        pg_conn = pg_cursor.connection
+        if name not in pg_conn.prepared:
+            start_ns = time.perf_counter_ns()
+            pg_cursor.execute(prepare_sql)
+            pg_conn.prepared.add(name)
+            if timer is not None:
+                timer.add("prepare", elapsed_ms(start_ns))
+        return execute_sql, params
+
+    def execute_prepared(self, pg_cursor, query, params=None, timer=None, read_only=False):
+        # Une migration du type des identifiants faite par un autre processus laisse les instructions préparées
+        # sur l'ancien schéma : l'EXECUTE échoue, sur le type du résultat ("cached plan must not change result
+        # type") ou sur celui des paramètres, figé au PREPARE ("operator does not exist: uuid = text"). Elles sont
+        # alors libérées et la requête rejouée une fois, si la transaction n'avait encore rien fait ou ne fait que lire
+        pg_conn = pg_cursor.connection
+        replayable = read_only or pg_conn.info.transaction_status == TRANSACTION_STATUS_IDLE
+        statement, params = self.prepare(pg_cursor, query, params, timer)
+        with timer.phase("execute") if timer is not None else nullcontext():
+            try:
+                pg_cursor.execute(statement, params)
+            except STALE_STATEMENT_ERRORS:
+                if not self.prepared:
+                    raise
+                self.reset_statements(pg_conn)
+                if not replayable:
+                    raise
+                statement, params = self.prepare(pg_cursor, query, params)
+                pg_cursor.execute(statement, params)
+        return statement, params
+
+    def reset_statements(self, pg_conn):
+        pg_conn.rollback()
+        with pg_conn.cursor() as pg_cursor:
+            pg_cursor.execute("DEALLOCATE ALL;")
+        pg_conn.commit()
+        pg_conn.prepared = set()
+        # Les autres connexions du pool ont préparé sur le même schéma : elles repartent de zéro au prochain emprunt
+        with self.pool_lock:
+            self.statements_epoch += 1
+            pg_conn.statements_epoch = self.statements_epoch
+
+    def ping(self):
+        with self.transaction() as pg_cursor:
+            pg_cursor.execute("SELECT 1;")
+
+    def pool_stats(self):
+        with self.pool_lock:
+            return {
+                "min": self.pool_min,
+                "max": self.pool_max,
+                "in_use": len(self.pg_pool._used),
+                "idle": len(self.pg_pool._pool),
+                "waiting": self.pool_waiting,
+                "prepared": self.prepared,
+                "plan_cache_mode": self.plan_cache_mode
+            }
 
     def init_db(self):
-        self.pg_cursor.execute("""
-            CREATE TABLE IF NOT EXISTS utilisateurs (
-                id VARCHAR(36) PRIMARY KEY,
-                nom VARCHAR(255)
-            );
-                               
-            CREATE TABLE IF NOT EXISTS followers (
-                utilisateur_id VARCHAR(36) REFERENCES utilisateurs(id),
-                follower_id VARCHAR(36) REFERENCES utilisateurs(id),
-                PRIMARY KEY (utilisateur_id, follower_id)
-            );
-
-            CREATE TABLE IF NOT EXISTS produits (
-                id VARCHAR(36) PRIMARY KEY,
-                nom VARCHAR(255),
-                prix DECIMAL
-            );
-
-            CREATE TABLE IF NOT EXISTS achats (
-                utilisateur_id VARCHAR(36) REFERENCES utilisateurs(id),
-                produit_id VARCHAR(36) REFERENCES produits(id),
-                date_achat TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (utilisateur_id, produit_id)
-            );
+        id_sql = ID_TYPES[self.id_type]
+        with self.transaction() as pg_cursor:
+            # Chaque worker initialise son backend : deux CREATE OR REPLACE simultanés de la même fonction ou du même
+            # trigger échouent ("tuple concurrently updated"). Verrou relâché au commit
+            pg_cursor.execute("SELECT pg_advisory_xact_lock(%s);", (SCHEMA_LOCK,))
+            pg_cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS utilisateurs (
+                    id {id_sql} PRIMARY KEY,
+                    nom VARCHAR(255)
+                );
+
+                CREATE TABLE IF NOT EXISTS followers (
+                    utilisateur_id {id_sql} REFERENCES utilisateurs(id),
+                    follower_id {id_sql} REFERENCES utilisateurs(id),
+                    PRIMARY KEY (utilisateur_id, follower_id)
+                );
+
+                CREATE TABLE IF NOT EXISTS produits (
+                    id {id_sql} PRIMARY KEY,
+                    nom VARCHAR(255),
+                    prix DECIMAL
+                );
+
+                CREATE TABLE IF NOT EXISTS achats (
+                    utilisateur_id {id_sql} REFERENCES utilisateurs(id),
+                    produit_id {id_sql} REFERENCES produits(id),
+                    date_achat TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (utilisateur_id, produit_id)
+                );
+            """)
+
+            pg_cursor.execute("""
+                SELECT COUNT(*) FROM information_schema.columns
+                WHERE (table_name, column_name) IN (('utilisateurs', 'nb_followers'), ('produits', 'num_buyers'));
+            """)
+            aggregates_exist = pg_cursor.fetchone()[0] == 2
+
+            # Compteurs tenus à jour par des triggers par instruction : un COPY ou un INSERT multi-lignes
+            # ne déclenche qu'une seule mise à jour groupée. Les partitions d'un chargement parallèle les coupent
+            # pour leur transaction (app.defer_aggregates) : un recalcul unique suit
+            pg_cursor.execute("""
+                ALTER TABLE utilisateurs ADD COLUMN IF NOT EXISTS nb_followers INTEGER NOT NULL DEFAULT 0;
+                ALTER TABLE produits ADD COLUMN IF NOT EXISTS num_buyers INTEGER NOT NULL DEFAULT 0;
+
+                CREATE OR REPLACE FUNCTION followers_count_insert() RETURNS trigger AS $$
+                BEGIN
+                    IF current_setting('app.defer_aggregates', true) = 'on' THEN
+                        RETURN NULL;
+                    END IF;
+                    UPDATE utilisateurs u SET nb_followers = u.nb_followers + n.nb
+                    FROM (SELECT follower_id, COUNT(*) AS nb FROM new_followers GROUP BY follower_id) n
+                    WHERE u.id = n.follower_id;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE TRIGGER followers_count_insert
+                    AFTER INSERT ON followers REFERENCING NEW TABLE AS new_followers
+                    FOR EACH STATEMENT EXECUTE FUNCTION followers_count_insert();
+
+                CREATE OR REPLACE FUNCTION achats_count_insert() RETURNS trigger AS $$
+                BEGIN
+                    IF current_setting('app.defer_aggregates', true) = 'on' THEN
+                        RETURN NULL;
+                    END IF;
+                    UPDATE produits p SET num_buyers = p.num_buyers + n.nb
+                    FROM (SELECT produit_id, COUNT(*) AS nb FROM new_achats GROUP BY produit_id) n
+                    WHERE p.id = n.produit_id;
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+
+                CREATE OR REPLACE TRIGGER achats_count_insert
+                    AFTER INSERT ON achats REFERENCING NEW TABLE AS new_achats
+                    FOR EACH STATEMENT EXECUTE FUNCTION achats_count_insert();
+            """)
+
+            # Pendant le chargement différé d'un autre processus, ses index sont retirés exprès et il les reconstruit
+            # à la fin. Pris ici jusqu'au commit, le verrou empêche aussi un chargement de commencer entre-temps
+            pg_cursor.execute("SELECT pg_try_advisory_xact_lock(%s);", (BULK_LOAD_LOCK,))
+            if pg_cursor.fetchone()[0]:
+                for name, table, columns in SECONDARY_INDEXES:
+                    pg_cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns});")
+
+        if not aggregates_exist:
+            self.refresh_aggregates()
+
+    def check_id(self, value):
+        # Un identifiant mal formé ferait échouer le cast en UUID côté serveur
+        if self.id_type == "uuid":
+            try:
+                return str(uuid.UUID(str(value)))
+            except ValueError:
+                raise ValueError(f"Identifiant invalide : {value}")
+        return value
+
+    def id_column_types(self, pg_cursor):
+        pg_cursor.execute("""
+            SELECT table_name, column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name IN ('utilisateurs', 'produits', 'followers', 'achats');
         """)
-        self.pg_conn.commit()
+        types = {(row[0], row[1]): row[2] for row in pg_cursor.fetchall()}
+        return {f"{table}.{column}": types.get((table, column)) for table, column in ID_COLUMNS}
+
+    def index_sizes(self, pg_cursor):
+        pg_cursor.execute("""
+            SELECT relname, pg_indexes_size(relid), pg_total_relation_size(relid)
+            FROM pg_stat_user_tables
+            WHERE relname IN ('utilisateurs', 'produits', 'followers', 'achats');
+        """)
+        return {row[0]: {"indexes": row[1], "total": row[2]} for row in pg_cursor.fetchall()}
+
+    def migrate_id_type(self, id_type):
+        if id_type not in ID_TYPES:
+            raise ValueError(f"Type d'identifiant inconnu : {id_type}")
+        id_sql = ID_TYPES[id_type]
+
+        with self.transaction() as pg_cursor:
+            before = self.index_sizes(pg_cursor)
+            start_ns = time.perf_counter_ns()
+
+            # Les clés étrangères imposent le même type des deux côtés : on les retire le temps de la conversion
+            for table, constraint, _, _ in FOREIGN_KEYS:
+                pg_cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint};")
+            for table, column in ID_COLUMNS:
+                pg_cursor.execute(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {id_sql} USING {column}::{id_sql};")
+            for table, constraint, column, reference in FOREIGN_KEYS:
+                pg_cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {constraint} "
+                                  f"FOREIGN KEY ({column}) REFERENCES {reference}(id);")
+
+            execution_time = elapsed_ms(start_ns)
+            types = self.id_column_types(pg_cursor)
+            after = self.index_sizes(pg_cursor)
+
+        self.id_type = id_type
+        self.statements_epoch += 1
+
+        return {
+            "id_type": id_type,
+            "columns": types,
+            "sizes_before": before,
+            "sizes_after": after
+        }, execution_time
+
+    def refresh_aggregates(self):
+        with self.transaction() as pg_cursor:
+            start_ns = time.perf_counter_ns()
+            pg_cursor.execute("""
+                UPDATE utilisateurs SET nb_followers = 0 WHERE nb_followers <> 0;
+                UPDATE utilisateurs u SET nb_followers = n.nb
+                FROM (SELECT follower_id, COUNT(*) AS nb FROM followers GROUP BY follower_id) n
+                WHERE u.id = n.follower_id;
+
+                UPDATE produits SET num_buyers = 0 WHERE num_buyers <> 0;
+                UPDATE produits p SET num_buyers = n.nb
+                FROM (SELECT produit_id, COUNT(DISTINCT utilisateur_id) AS nb FROM achats GROUP BY produit_id) n
+                WHERE p.id = n.produit_id;
+            """)
+            execution_time = elapsed_ms(start_ns)
+
+        return execution_time
 
     def clear_db(self):
         try:
-            self.pg_cursor.execute("TRUNCATE TABLE utilisateurs, followers, produits, achats RESTART IDENTITY CASCADE;")
-            self.pg_conn.commit()
+            with self.transaction() as pg_cursor:
+                # Pas de TRUNCATE au milieu de l'init_db d'un autre worker
+                pg_cursor.execute("SELECT pg_advisory_xact_lock(%s);", (SCHEMA_LOCK,))
+                pg_cursor.execute("TRUNCATE TABLE utilisateurs, followers, produits, achats RESTART IDENTITY CASCADE;")
+            self.generator.registry.reset()
             print("Base de données PostgreSQL réinitialisée avec succès.")
 
             self.init_db()
         except Exception as e:
-            self.pg_conn.rollback()
             print(f"Erreur lors de la réinitialisation de la base de données PostgreSQL: {e}")
 
-    def create_users(self, num_users):
-        users = []
+    def create_users(self, num_users, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                     checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        if mode == "bulk":
+            return self.bulk_create_users(num_users, batch_size, commit_interval, checkpoint)
+        if mode == "parallel":
+            return self.parallel_create_users(num_users, batch_size, commit_interval, checkpoint)
+
+        self.start_generation()
+        users = [{"id": user_id, "nom": nom} for user_id, nom in self.generator.user_rows(num_users)]
+        users_ids = [user["id"] for user in users]
         execution_time = 0
 
-        for _ in range(num_users):
-            nom = fake.name()
-            user_id = str(uuid.uuid4())
-            execution_time += execute_with_timer(self.pg_cursor.execute,
-                                                 "INSERT INTO utilisateurs (id, nom) VALUES (%s, %s) RETURNING id;",
-                                                 (user_id, nom,)
-                                                 )
-            users.append({"id": user_id, "nom": nom})
+        with self.transaction() as pg_cursor:
+            for user in users:
+                execution_time += execute_with_timer(self.execute_prepared, pg_cursor, INSERT_USER,
+                                                     (user["id"], user["nom"]))
 
-        execution_time += self.commit()
+            execution_time += self.commit(pg_cursor)
+            if checkpoint is not None:
+                checkpoint("users", users_ids)
 
-        self.pg_cursor.execute("SELECT id FROM utilisateurs;")
-        users_ids = [{"id": row[0]} for row in self.pg_cursor.fetchall()]
+            execution_time += self.insert_follows(pg_cursor, users_ids, checkpoint)
 
-        for user in users:
-            num_followers = random.randint(0, 20)
-            followers = random.sample(users_ids, min(num_followers, len(users_ids) - 1))
+        return users, execution_time
 
-            for follower in followers:
-                if follower["id"] != user["id"]:
-                    execution_time += execute_with_timer(self.pg_cursor.execute,
-                                                         "INSERT INTO followers (utilisateur_id, follower_id) VALUES (%s, %s) ON CONFLICT DO NOTHING;",
-                                                         (user["id"], follower["id"])
-                                                         )
+    def create_follows(self, user_ids, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                       checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        self.start_generation()
+        if mode != "default":
+            # Une reprise ne porte que sur les utilisateurs d'un seul morceau : pas de partitions
+            return self.copy_follows(user_ids, batch_size, commit_interval, checkpoint=checkpoint,
+                                     on_conflict_do_nothing=True)
 
-        execution_time += self.commit()
+        with self.transaction() as pg_cursor:
+            return None, self.insert_follows(pg_cursor, user_ids, checkpoint)
 
-        return users, execution_time
+    def insert_follows(self, pg_cursor, users_ids, checkpoint=None):
+        # INSERT_FOLLOW ignore les follows déjà présents : rejouable sur des utilisateurs en partie suivis
+        execution_time = 0
+        for user_id, follower_id in self.generator.follow_rows(users_ids):
+            execution_time += execute_with_timer(self.execute_prepared, pg_cursor, INSERT_FOLLOW,
+                                                 (user_id, follower_id))
+
+        execution_time += self.commit(pg_cursor)
+        if checkpoint is not None:
+            checkpoint("follows", users_ids)
+        return execution_time
 
-    def create_produits(self, num_produits):
+    def create_produits(self, num_produits, mode="default", batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL,
+                        checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        if mode == "bulk":
+            return self.bulk_create_produits(num_produits, batch_size, commit_interval, checkpoint)
+        if mode == "parallel":
+            return self.parallel_create_produits(num_produits, batch_size, commit_interval, checkpoint)
+
+        self.start_generation()
         produits = []
         execution_time = 0
 
-        for _ in range(num_produits):
-            nom = fake.word()
-            prix = round(random.uniform(5, 500), 2)
-            produit_id = str(uuid.uuid4())
-            execution_time += execute_with_timer(self.pg_cursor.execute,
-                                                 "INSERT INTO produits (id, nom, prix) VALUES (%s, %s, %s) RETURNING id;",
-                                                 (produit_id, nom, prix)
-                                                 )
-            produits.append({"id": produit_id, "nom": nom, "prix": prix})
+        with self.transaction() as pg_cursor:
+            for produit_id, nom, prix in self.generator.produit_rows(num_produits):
+                execution_time += execute_with_timer(self.execute_prepared, pg_cursor, INSERT_PRODUIT,
+                                                     (produit_id, nom, prix))
+                produits.append({"id": produit_id, "nom": nom, "prix": prix})
+
+            execution_time += self.commit(pg_cursor)
+            if checkpoint is not None:
+                checkpoint("produits", [produit["id"] for produit in produits])
 
         return produits, execution_time
 
-    def create_achats(self, num_achats_not_used):
+    def create_achats(self, num_achats_not_used, mode="default", batch_size=BATCH_SIZE,
+                      commit_interval=COMMIT_INTERVAL, user_ids=None, checkpoint=None):
+        self.check_insert_mode(mode, batch_size, commit_interval)
+        registry = self.start_generation()
+        if not registry.users or not registry.produits:
+            raise ValueError("Pas assez d'utilisateurs ou de produits disponibles.")
+        if user_ids is None:
+            user_ids = list(registry.users)
+        if mode == "bulk":
+            return self.bulk_create_achats(user_ids, batch_size, commit_interval, checkpoint)
+        if mode == "parallel":
+            return self.parallel_create_achats(user_ids, batch_size, commit_interval, checkpoint)
+
         achats = []
         execution_time = 0
-        self.pg_cursor.execute("SELECT id FROM utilisateurs;")
-        user_ids = [row[0] for row in self.pg_cursor.fetchall()]
 
-        self.pg_cursor.execute("SELECT id FROM produits;")
-        produit_ids = [row[0] for row in self.pg_cursor.fetchall()]
+        with self.transaction() as pg_cursor:
+            for utilisateur_id, produit_id, date_achat in self.generator.achat_rows(user_ids):
+                execution_time += execute_with_timer(self.execute_prepared, pg_cursor, INSERT_ACHAT,
+                                                     (utilisateur_id, produit_id, date_achat))
+                achats.append({"utilisateur_id": utilisateur_id, "produit_id": produit_id, "date_achat": date_achat})
 
-        if not user_ids or not produit_ids:
-            raise ValueError("Pas assez d'utilisateurs ou de produits disponibles.")
+            execution_time += self.commit(pg_cursor)
+            if checkpoint is not None:
+                checkpoint("achats", user_ids)
 
-        for utilisateur_id in user_ids:
-            num_achats_utilisateur = random.randint(0, 5)
-            produits_achetes = random.sample(produit_ids, min(num_achats_utilisateur, len(produit_ids)))
+        return achats, execution_time
 
-            for produit_id in produits_achetes:
-                date_achat = datetime.now()
-                execution_time += execute_with_timer(self.pg_cursor.execute,
-                                                     "INSERT INTO achats (utilisateur_id, produit_id, date_achat) VALUES (%s, %s, %s) ON CONFLICT DO NOTHING;",
-                                                     (utilisateur_id, produit_id, date_achat)
-                                                     )
-                achats.append({"utilisateur_id": utilisateur_id, "produit_id": produit_id, "date_achat": date_achat})
+    def bulk_create_users(self, num_users, batch_size, commit_interval, checkpoint=None):
+        self.start_generation()
+        new_users = self.generator.user_rows(num_users)
 
-        execution_time += self.commit()
+        # 10 follows en moyenne par utilisateur
+        with self.bulk_load(self.estimated_rows("users", num_users)) as bulk_stats:
+            nb_users, execution_time = self.copy_users(new_users, batch_size, commit_interval, checkpoint)
+            nb_follows, follows_time = self.copy_follows([user_id for user_id, _ in new_users],
+                                                         batch_size, commit_interval, checkpoint=checkpoint)
 
-        return achats, execution_time
+        return {
+            "nb_utilisateurs": nb_users,
+            "nb_follows": nb_follows,
+            "bulk_load": bulk_stats
+        }, execution_time + follows_time + bulk_stats["execution_time"]
 
-    def select_users(self, num_users):
-        start_time = datetime.now()
-        self.pg_cursor.execute("SELECT * FROM utilisateurs ORDER BY RANDOM() LIMIT %s;", (num_users,))
-        users = self.pg_cursor.fetchall()
-        end_time = datetime.now()
+    def bulk_create_produits(self, num_produits, batch_size, commit_interval, checkpoint=None):
+        self.start_generation()
+        with self.bulk_load(num_produits) as bulk_stats:
+            _, nb_produits, execution_time = self.generate_produits(num_produits, batch_size, commit_interval,
+                                                                    checkpoint)
 
-        result = [{"id": row[0], "nom": row[1]} for row in users]
+        return {"nb_produits": nb_produits, "bulk_load": bulk_stats}, execution_time + bulk_stats["execution_time"]
 
-        return result, (end_time - start_time).total_seconds() * 1000
+    def bulk_create_achats(self, user_ids, batch_size, commit_interval, checkpoint=None):
+        with self.bulk_load(self.estimated_rows("achats", len(user_ids))) as bulk_stats:
+            nb_achats, execution_time = self.copy_achats(user_ids, batch_size, commit_interval,
+                                                         checkpoint=checkpoint)
 
-    def select_produits(self, num_produits):
-        start_time = datetime.now()
-        self.pg_cursor.execute("SELECT * FROM produits ORDER BY RANDOM() LIMIT %s;", (num_produits,))
-        produits = self.pg_cursor.fetchall()
-        end_time = datetime.now()
+        return {"nb_achats": nb_achats, "bulk_load": bulk_stats}, execution_time + bulk_stats["execution_time"]
 
-        result = [{"id": row[0], "nom": row[1], "prix": row[2]} for row in produits]
+    def parallel_create_users(self, num_users, batch_size, commit_interval, checkpoint=None):
+        registry = self.start_generation()
+        workers = min(INGEST_WORKERS, max(num_users, 1))
 
-        return result, (end_time - start_time).total_seconds() * 1000
+        with self.bulk_load(self.estimated_rows("users", num_users)) as bulk_stats:
+            users, users_time = self.run_partitions("generate_users", [
+                (nb_users, batch_size, commit_interval) for nb_users in split_count(num_users, workers)
+            ], checkpoint)
+            new_users_ids = [user_id for ids, _, _ in users for user_id in ids]
+            with registry.lock:
+                for user_id in new_users_ids:
+                    registry.add_user(user_id)
 
-    def db_size(self):
-        start_time = datetime.now()
-        self.pg_cursor.execute("SELECT COUNT(*) FROM utilisateurs;")
-        nb_utilisateurs = self.pg_cursor.fetchone()[0]
+            # Une fois tous les noeuds créés et enregistrés, chaque processus hérite du registre complet :
+            # ses follows peuvent pointer vers des utilisateurs créés par les autres partitions
+            with self.deferred_aggregates() as aggregates_stats:
+                follows, follows_time = self.run_partitions("copy_follows", [
+                    (users_ids, batch_size, commit_interval, True) for users_ids in split_list(new_users_ids, workers)
+                ], checkpoint)
 
-        self.pg_cursor.execute("SELECT COUNT(*) FROM followers;")
-        nb_followers = self.pg_cursor.fetchone()[0]
+        return {
+            "nb_utilisateurs": len(new_users_ids),
+            "nb_follows": sum(nb_follows for nb_follows, _ in follows),
+            "bulk_load": bulk_stats,
+            "aggregates": aggregates_stats,
+            "parallel": {
+                "workers": workers,
+                "utilisateurs": self.partition_stats(
+                    [(nb_users, execution_time) for _, nb_users, execution_time in users], users_time),
+                "follows": self.partition_stats(follows, follows_time)
+            }
+        }, users_time + follows_time + aggregates_stats["execution_time"] + bulk_stats["execution_time"]
 
-        self.pg_cursor.execute("SELECT COUNT(*) FROM produits;")
-        nb_produits = self.pg_cursor.fetchone()[0]
+    def parallel_create_produits(self, num_produits, batch_size, commit_interval, checkpoint=None):
+        registry = self.start_generation()
+        workers = min(INGEST_WORKERS, max(num_produits, 1))
 
-        self.pg_cursor.execute("SELECT COUNT(*) FROM achats;")
-        nb_achats = self.pg_cursor.fetchone()[0]
-        end_time = datetime.now()
+        with self.bulk_load(num_produits) as bulk_stats:
+            produits, execution_time = self.run_partitions("generate_produits", [
+                (nb_produits, batch_size, commit_interval) for nb_produits in split_count(num_produits, workers)
+            ], checkpoint)
+        with registry.lock:
+            for produit_id in (produit_id for ids, _, _ in produits for produit_id in ids):
+                registry.add_produit(produit_id)
 
         return {
-            "nb_utilisateurs": nb_utilisateurs,
-            "nb_follows": nb_followers,
-            "nb_produits": nb_produits,
-            "nb_achats": nb_achats
-        }, (end_time - start_time).total_seconds() * 1000
+            "nb_produits": sum(nb_produits for _, nb_produits, _ in produits),
+            "bulk_load": bulk_stats,
+            "parallel": {"workers": workers, "produits": self.partition_stats(
+                [(nb_produits, execution_time) for _, nb_produits, execution_time in produits], execution_time)}
+        }, execution_time + bulk_stats["execution_time"]
 
-    def requestGlobalFollows(self):
-        start_time = datetime.now()
+    def parallel_create_achats(self, user_ids, batch_size, commit_interval, checkpoint=None):
+        workers = min(INGEST_WORKERS, max(len(user_ids), 1))
 
-        self.pg_cursor.execute("""
-            SELECT u.id, u.nom, COUNT(f.utilisateur_id) AS nb_followers
-            FROM utilisateurs u
-            LEFT JOIN followers f ON u.id = f.follower_id
-            GROUP BY u.id, u.nom
-            ORDER BY nb_followers DESC;           
-        """)
-        results = self.pg_cursor.fetchall()
-        end_time = datetime.now()
+        with self.bulk_load(self.estimated_rows("achats", len(user_ids))) as bulk_stats, \
+                self.deferred_aggregates() as aggregates_stats:
+            achats, execution_time = self.run_partitions("copy_achats", [
+                (users_ids, batch_size, commit_interval, True) for users_ids in split_list(user_ids, workers)
+            ], checkpoint)
 
-        results = [
-            {"id": row[0], "nom": row[1], "nb_followers": row[2]}
-            for row in results
-        ]
+        return {
+            "nb_achats": sum(nb_achats for nb_achats, _ in achats),
+            "bulk_load": bulk_stats,
+            "aggregates": aggregates_stats,
+            "parallel": {"workers": workers, "achats": self.partition_stats(achats, execution_time)}
+        }, execution_time + aggregates_stats["execution_time"] + bulk_stats["execution_time"]
 
-        return results, (end_time - start_time).total_seconds() * 1000
+    def generate_users(self, num_users, batch_size, commit_interval, checkpoint=None):
+        new_users = self.generator.user_rows(num_users)
+        nb_users, execution_time = self.copy_users(new_users, batch_size, commit_interval, checkpoint)
+        return [user_id for user_id, _ in new_users], nb_users, execution_time
 
-    def requestGlobalAchatsByProduit(self):
-        start_time = datetime.now()
+    def generate_produits(self, num_produits, batch_size, commit_interval, checkpoint=None):
+        new_produits = self.generator.produit_rows(num_produits)
+        on_commit = CommitProgress(checkpoint, "produits", [produit_id for produit_id, _, _ in new_produits],
+                                   single_row=True)
+        with self.transaction() as pg_cursor:
+            nb_produits, execution_time = self.copy_rows(pg_cursor, "produits", ("id", "nom", "prix"), new_produits,
+                                                         batch_size, commit_interval, on_commit=on_commit)
+        return [produit_id for produit_id, _, _ in new_produits], nb_produits, execution_time
 
-        self.pg_cursor.execute("""
-            SELECT p.id AS product_id, p.nom AS product_name, COUNT(DISTINCT a.utilisateur_id) AS num_buyers
-            FROM achats a
-            JOIN produits p ON a.produit_id = p.id
-            GROUP BY p.id, p.nom
-            ORDER BY num_buyers DESC;
-        """)
-        results = self.pg_cursor.fetchall()
-        end_time = datetime.now()
+    def read_registry(self):
+        with self.transaction() as pg_cursor:
+            pg_cursor.execute("SELECT id, nb_followers FROM utilisateurs;")
+            users = pg_cursor.fetchall()
+            pg_cursor.execute("SELECT id, num_buyers FROM produits;")
+            produits = pg_cursor.fetchall()
+        return users, produits
 
-        results = [
-            {"product_id": row[0], "product_name": row[1], "num_buyers": row[2]}
-            for row in results
-        ]
+    def copy_users(self, new_users, batch_size, commit_interval, checkpoint=None):
+        on_commit = CommitProgress(checkpoint, "users", [user_id for user_id, _ in new_users], single_row=True)
+        with self.transaction() as pg_cursor:
+            return self.copy_rows(pg_cursor, "utilisateurs", ("id", "nom"), new_users, batch_size, commit_interval,
+                                  on_commit=on_commit)
 
-        return results, (end_time - start_time).total_seconds() * 1000
+    def copy_follows(self, new_users_ids, batch_size, commit_interval, defer_aggregates=False, checkpoint=None,
+                     on_conflict_do_nothing=False):
+        on_commit = CommitProgress(checkpoint, "follows", new_users_ids)
+        with self.transaction() as pg_cursor:
+            return self.copy_rows(pg_cursor, "followers", ("utilisateur_id", "follower_id"),
+                                  self.generator.follow_rows(new_users_ids), batch_size, commit_interval,
+                                  on_conflict_do_nothing=on_conflict_do_nothing, defer_aggregates=defer_aggregates,
+                                  on_commit=on_commit)
 
-    def requestSpecific1(self, user_id, max_level=3):
-        query = """
-        WITH RECURSIVE follower_hierarchy AS (
-            SELECT follower_id, utilisateur_id, 1 AS level
-            FROM followers
-            WHERE utilisateur_id = %s
-            UNION ALL
-            SELECT f.follower_id, f.utilisateur_id, fh.level + 1
-            FROM followers f
-            INNER JOIN follower_hierarchy fh ON f.utilisateur_id = fh.follower_id
-            WHERE fh.level < %s
-        )
-        SELECT p.id AS product_id, p.nom AS product_name, COUNT(*) AS nb_achats
-        FROM follower_hierarchy fh
-        JOIN achats a ON fh.follower_id = a.utilisateur_id
-        JOIN produits p ON a.produit_id = p.id
-        GROUP BY p.id, p.nom
-        ORDER BY nb_achats DESC;
-        """
+    def copy_achats(self, user_ids, batch_size, commit_interval, defer_aggregates=False, checkpoint=None):
+        on_commit = CommitProgress(checkpoint, "achats", user_ids)
+        with self.transaction() as pg_cursor:
+            # Les achats peuvent déjà exister : on passe par une table temporaire pour garder le ON CONFLICT DO NOTHING
+            return self.copy_rows(pg_cursor, "achats", ("utilisateur_id", "produit_id", "date_achat"),
+                                  self.generator.achat_rows(user_ids), batch_size, commit_interval,
+                                  on_conflict_do_nothing=True, defer_aggregates=defer_aggregates, on_commit=on_commit)
 
-        start_time = datetime.now()
-        self.pg_cursor.execute(query, (user_id, max_level))
-        rows = self.pg_cursor.fetchall()
-        end_time = datetime.now()
+    @contextmanager
+    def deferred_aggregates(self):
+        # Les triggers de partitions concurrentes mettaient à jour les mêmes compteurs (un utilisateur suivi depuis
+        # plusieurs partitions, un produit acheté dans toutes) dans des ordres différents : interblocages.
+        # Un seul recalcul à la fin, repoussé à celle du chargement différé englobant s'il y en a un
+        aggregates_stats = {"deferred": True, "execution_time": 0}
+        if getattr(self.bulk_local, "active", False):
+            self.bulk_local.stale_aggregates = True
+            yield aggregates_stats
+            return
 
-        results = [{"product_id": row[0], "product_name": row[1], "nb_achats": row[2]} for row in rows]
+        try:
+            yield aggregates_stats
+        except BaseException as e:
+            # Des partitions ont pu valider avant l'échec : leurs lignes doivent quand même être comptées
+            try:
+                self.refresh_aggregates()
+            except Exception as refresh_error:
+                e.add_note(f"Recalcul des compteurs échoué : {refresh_error}")
+            raise
+        aggregates_stats["execution_time"] = self.refresh_aggregates()
 
-        return results, (end_time - start_time).total_seconds() * 1000
+    @contextmanager
+    def bulk_load(self, estimated_rows):
+        # En dessous du seuil, maintenir index et clés étrangères ligne à ligne reste moins cher que les reconstruire.
+        # Un job l'ouvre une fois pour son total : ses morceaux, déjà dans un chargement différé, ne refont rien
+        if getattr(self.bulk_local, "active", False):
+            yield {"deferred": False, "enclosing": True, "execution_time": 0}
+            return
+        bulk_stats = {"deferred": estimated_rows >= self.bulk_defer_threshold, "execution_time": 0}
+        if not bulk_stats["deferred"]:
+            yield bulk_stats
+            return
 
-    def requestSpecific2(self, user_id, product_id, max_level=3):
-        query = """
-        WITH RECURSIVE follower_hierarchy AS (
-            SELECT follower_id, utilisateur_id, 1 AS level
-            FROM followers
-            WHERE utilisateur_id = %s
-            UNION ALL
-            SELECT f.follower_id, f.utilisateur_id, fh.level + 1
-            FROM followers f
-            INNER JOIN follower_hierarchy fh ON f.utilisateur_id = fh.follower_id
-            WHERE fh.level < %s
-        )
-        SELECT COUNT(*) AS nb_achats
-        FROM follower_hierarchy fh
-        JOIN achats a ON fh.follower_id = a.utilisateur_id
-        JOIN produits p ON a.produit_id = p.id 
-        WHERE p.id = %s
-        GROUP BY p.id, p.nom
-        ORDER BY nb_achats DESC;
-        """
+        # Le retrait des index est global : deux chargements différés ne se chevauchent jamais
+        with self.advisory_lock(BULK_LOAD_LOCK) as lock_wait:
+            bulk_stats["lock_wait"] = lock_wait
+            with self.transaction() as pg_cursor:
+                start_ns = time.perf_counter_ns()
+                for table, constraint, _, _ in FOREIGN_KEYS:
+                    pg_cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint};")
+                for name, _, _ in SECONDARY_INDEXES:
+                    pg_cursor.execute(f"DROP INDEX IF EXISTS {name};")
+                bulk_stats["drop_time"] = elapsed_ms(start_ns)
 
-        start_time = datetime.now()
-        self.pg_cursor.execute(query, (user_id, max_level, product_id))
-        rows = self.pg_cursor.fetchall()
-        end_time = datetime.now()
+            self.bulk_local.active = True
+            self.bulk_local.stale_aggregates = False
+            try:
+                yield bulk_stats
+            except BaseException as e:
+                try:
+                    self.rebuild_indexes()
+                except Exception as rebuild_error:
+                    # L'erreur du chargement reste celle remontée, l'échec de la reconstruction y est rattaché
+                    e.add_note(f"Reconstruction des index et clés étrangères échouée : {rebuild_error}")
+                if self.bulk_local.stale_aggregates:
+                    try:
+                        self.refresh_aggregates()
+                    except Exception as refresh_error:
+                        e.add_note(f"Recalcul des compteurs échoué : {refresh_error}")
+                raise
+            finally:
+                self.bulk_local.active = False
 
-        return rows[0], (end_time - start_time).total_seconds() * 1000
+            bulk_stats["rebuild_time"] = self.rebuild_indexes()
+            bulk_stats["execution_time"] = bulk_stats["drop_time"] + bulk_stats["rebuild_time"]
+            if self.bulk_local.stale_aggregates:
+                # Compteurs laissés de côté par les chargements parallèles du job : un seul recalcul, index en place
+                bulk_stats["refresh_time"] = self.refresh_aggregates()
+                bulk_stats["execution_time"] += bulk_stats["refresh_time"]
 
-    def requestSpecific3(self, product_id, max_level=3):
-        query = """
-        WITH RECURSIVE follower_circle AS (
-            SELECT a.utilisateur_id, 1 AS level
-            FROM achats a
-            WHERE a.produit_id = %s
-            UNION ALL
-            SELECT f.follower_id, fc.level + 1 AS level
-            FROM follows f
-            JOIN follower_circle fc ON f.utilisateur_id = fc.utilisateur_id
-            WHERE fc.level < %s
-        )
-        SELECT p.id AS product_id, p.nom AS product_name, COUNT(DISTINCT a.utilisateur_id) AS num_buyers
-        FROM produits p
-        JOIN achats a ON p.id = a.produit_id
-        JOIN follower_circle fc ON a.utilisateur_id = fc.utilisateur_id
-        WHERE p.id = %s
-        GROUP BY p.id, p.nom
-        ORDER BY num_buyers DESC;
-        """
+    def rebuild_indexes(self):
+        start_ns = time.perf_counter_ns()
+
+        statements = [f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns});"
+                      for name, table, columns in SECONDARY_INDEXES]
+        if self.rebuild_workers > 1:
+            # Chaque index est construit sur sa propre connexion du pool
+            with ThreadPoolExecutor(max_workers=min(self.rebuild_workers, self.pool_max)) as executor:
+                list(executor.map(self.execute_in_transaction, statements))
+        else:
+            for statement in statements:
+                self.execute_in_transaction(statement)
+
+        with self.transaction() as pg_cursor:
+            for table, constraint, column, reference in FOREIGN_KEYS:
+                pg_cursor.execute(f"""
+                    DO $$ BEGIN
+                        ALTER TABLE {table} ADD CONSTRAINT {constraint} FOREIGN KEY ({column}) REFERENCES {reference}(id);
+                    EXCEPTION WHEN duplicate_object THEN NULL;
+                    END $$;
+                """)
+
+        self.execute_in_transaction("ANALYZE utilisateurs, followers, produits, achats;")
+
+        return elapsed_ms(start_ns)
+
+    def execute_in_transaction(self, statement):
+        with self.transaction() as pg_cursor:
+            pg_cursor.execute(statement)
+
+    def copy_rows(self, pg_cursor, table, columns, rows, batch_size, commit_interval, on_conflict_do_nothing=False,
+                  defer_aggregates=False, on_commit=None):
+        columns = ", ".join(columns)
+        copy_table = table
+        if on_conflict_do_nothing:
+            copy_table = f"{table}_staging"
+            pg_cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {copy_table} (LIKE {table} INCLUDING DEFAULTS);")
+
+        nb_rows = 0
+        execution_time = 0
+        for nb_batches, batch in enumerate(batched(rows, batch_size), start=1):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            if defer_aggregates:
+                # SET LOCAL : le réglage meurt avec la transaction, la connexion rendue au pool n'en garde rien
+                execution_time += execute_with_timer(pg_cursor.execute, "SET LOCAL app.defer_aggregates = on;")
+            execution_time += execute_with_timer(pg_cursor.copy_expert,
+                                                 f"COPY {copy_table} ({columns}) FROM STDIN WITH (FORMAT csv);",
+                                                 buffer)
+
+            if on_conflict_do_nothing:
+                execution_time += execute_with_timer(pg_cursor.execute,
+                                                     f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {copy_table} "
+                                                     f"ON CONFLICT DO NOTHING;")
+                nb_rows += pg_cursor.rowcount
+                execution_time += execute_with_timer(pg_cursor.execute, f"TRUNCATE {copy_table};")
+            else:
+                nb_rows += len(batch)
+
+            if nb_batches % commit_interval == 0:
+                execution_time += self.commit(pg_cursor)
+                if on_commit is not None:
+                    on_commit(batch[-1])
+
+        execution_time += self.commit(pg_cursor)
+        if on_commit is not None:
+            on_commit()
+
+        return nb_rows, execution_time
+
+    def import_snapshot(self, snapshot, batch_size=BATCH_SIZE, commit_interval=COMMIT_INTERVAL):
+        counts = {}
+        execution_time = 0
+        # Un seul report des index et clés étrangères pour l'ensemble du snapshot
+        with self.bulk_load(snapshot.total_rows()) as bulk_stats:
+            for entity, (table, columns) in IMPORT_TABLES.items():
+                with self.transaction() as pg_cursor:
+                    counts[entity], copy_time = self.copy_rows(pg_cursor, table, columns,
+                                                               snapshot.export_rows(entity),
+                                                               batch_size, commit_interval)
+                execution_time += copy_time
+
+        # Les identifiants chargés n'ont pas été vus par le générateur
+        self.generator.registry.loaded = False
+
+        return {"counts": counts, "bulk_load": bulk_stats}, execution_time + bulk_stats["execution_time"]
+
+    def export_rows(self, entity):
+        if entity not in EXPORT_QUERIES:
+            raise ValueError(f"Entité inconnue : {entity}")
+
+        with self.transaction(cursor_name=f"export_{entity}") as pg_cursor:
+            pg_cursor.execute(EXPORT_QUERIES[entity])
+            yield from pg_cursor
+
+    def clear_caches(self):
+        # Seuls les plans mis en cache par session sont purgeables : on le fait sur chaque connexion libre du pool
+        connections = []
+        try:
+            while self.pg_pool._pool and self.pool_slots.acquire(blocking=False):
+                try:
+                    connections.append(self.pg_pool.getconn())
+                except Exception:
+                    self.pool_slots.release()
+                    raise
+            for pg_conn in connections:
+                with pg_conn.cursor() as pg_cursor:
+                    pg_cursor.execute("DISCARD PLANS;")
+                pg_conn.commit()
+        finally:
+            for pg_conn in connections:
+                self.pg_pool.putconn(pg_conn)
+                self.pool_slots.release()
+
+    def select_users(self, num_users, sampling="uniform"):
+        return self.sample_rows("utilisateurs", "id, nom", num_users, sampling,
+                                lambda row: {"id": row[0], "nom": row[1]})
+
+    def select_produits(self, num_produits, sampling="uniform"):
+        return self.sample_rows("produits", "id, nom, prix", num_produits, sampling,
+                                lambda row: {"id": row[0], "nom": row[1], "prix": row[2]})
+
+    def sample_rows(self, table, columns, num_rows, sampling, convert):
+        # BERNOULLI tire chaque ligne indépendamment (uniforme, mais parcourt toute la table sans la trier),
+        # SYSTEM tire des pages entières : seules les pages retenues sont lues, les lignes voisines arrivent ensemble
+        self.check_sampling(sampling)
+        num_rows = int(num_rows)
+        timer = PhaseTimer()
+        with self.transaction() as pg_cursor:
+            with timer.phase("execute"):
+                self.execute_prepared(pg_cursor, "SELECT reltuples, relpages FROM pg_class WHERE oid = %s::regclass;",
+                                      (table,))
+                estimated_rows, pages = pg_cursor.fetchone()
+                rows = []
+                percent = 0
+                if estimated_rows > 0 and pages > 0:
+                    percent = min(100.0, max(100.0 * num_rows * SAMPLE_MARGIN / estimated_rows,
+                                             100.0 * SAMPLE_MIN_PAGES / pages))
+                    while True:
+                        self.execute_prepared(pg_cursor, f"SELECT {columns} FROM {table} "
+                                                         f"TABLESAMPLE {TABLESAMPLE_METHODS[sampling]} (%s);", (percent,),
+                                              read_only=True)
+                        rows = pg_cursor.fetchall()
+                        if len(rows) >= num_rows or percent >= 100:
+                            break
+                        # Complément : on retire avec un pourcentage plus large plutôt que de cumuler des doublons
+                        percent = min(100.0, percent * 4)
+                if len(rows) < num_rows and percent < 100:
+                    # Table jamais analysée (reltuples = -1) ou vide d'après les statistiques : tirage exact
+                    self.execute_prepared(pg_cursor, f"SELECT {columns} FROM {table} ORDER BY RANDOM() LIMIT %s;",
+                                          (num_rows,), read_only=True)
+                    rows = pg_cursor.fetchall()
+
+        with timer.phase("convert"):
+            # L'échantillon est plus large que demandé et dans l'ordre physique : on le réduit au hasard
+            results = [convert(row) for row in random.sample(rows, min(num_rows, len(rows)))]
+
+        return results, timer.timing()
+
+    def db_size(self, exact=False):
+        timer = PhaseTimer()
+        with self.transaction() as pg_cursor:
+            with timer.phase("execute"):
+                if exact:
+                    counts = self.exact_counts(pg_cursor)
+                else:
+                    counts = self.estimated_counts(pg_cursor)
+            with timer.phase("storage"):
+                storage = self.storage_sizes(pg_cursor)
+
+        return {
+            "nb_utilisateurs": counts["utilisateurs"],
+            "nb_follows": counts["followers"],
+            "nb_produits": counts["produits"],
+            "nb_achats": counts["achats"],
+            "method": "count" if exact else "statistics",
+            "storage": storage
+        }, timer.timing()
+
+    @staticmethod
+    def exact_counts(pg_cursor):
+        counts = {}
+        for table in SIZE_TABLES:
+            pg_cursor.execute(f"SELECT COUNT(*) FROM {table};")
+            counts[table] = pg_cursor.fetchone()[0]
+        return counts
+
+    @staticmethod
+    def estimated_counts(pg_cursor):
+        # n_live_tup suit chaque insertion, suppression et TRUNCATE validés, sans parcourir la table ;
+        # après une remise à zéro des statistiques (n_tup_ins = 0), on retombe sur l'estimation du dernier ANALYZE
+        pg_cursor.execute("""
+            SELECT s.relname, s.n_live_tup, s.n_tup_ins, c.reltuples
+            FROM pg_stat_user_tables s
+            JOIN pg_class c ON c.oid = s.relid
+            WHERE s.relname = ANY(%s);
+        """, (list(SIZE_TABLES),))
+        return {
+            relname: n_live_tup if n_live_tup or n_tup_ins else max(int(reltuples), 0)
+            for relname, n_live_tup, n_tup_ins, reltuples in pg_cursor.fetchall()
+        }
+
+    @staticmethod
+    def storage_sizes(pg_cursor):
+        pg_cursor.execute("""
+            SELECT relname, pg_relation_size(relid), pg_indexes_size(relid), pg_total_relation_size(relid)
+            FROM pg_stat_user_tables
+            WHERE relname = ANY(%s);
+        """, (list(SIZE_TABLES),))
+        tables = {row[0]: {"table": row[1], "indexes": row[2], "total": row[3], "index_sizes": {}}
+                  for row in pg_cursor.fetchall()}
+
+        pg_cursor.execute("""
+            SELECT relname, indexrelname, pg_relation_size(indexrelid)
+            FROM pg_stat_user_indexes
+            WHERE relname = ANY(%s);
+        """, (list(SIZE_TABLES),))
+        for relname, index_name, size in pg_cursor.fetchall():
+            tables[relname]["index_sizes"][index_name] = size
+
+        pg_cursor.execute("SELECT pg_database_size(current_database());")
+        return {"database": pg_cursor.fetchone()[0], "tables": tables}
+
+    def requestGlobalFollows(self, exact=False, limit=None, cursor=None):
+        return self.fetch_page(*GLOBAL_FOLLOWS_QUERIES[exact], None, limit, cursor,
+                               lambda row: {"id": row[0], "nom": row[1], "nb_followers": row[2]},
+                               "nb_followers", "id")
+
+    def requestGlobalAchatsByProduit(self, exact=False, limit=None, cursor=None):
+        return self.fetch_page(*GLOBAL_ACHATS_QUERIES[exact], None, limit, cursor,
+                               lambda row: {"product_id": row[0], "product_name": row[1], "num_buyers": row[2]},
+                               "num_buyers", "product_id")
+
+    def streamGlobalFollows(self, exact=False):
+        with self.transaction(cursor_name="stream_global_follows") as pg_cursor:
+            pg_cursor.execute(GLOBAL_FOLLOWS_QUERIES[exact][0].format(keyset="", limit=""))
+            for row in pg_cursor:
+                yield {"id": row[0], "nom": row[1], "nb_followers": row[2]}
+
+    def streamGlobalAchatsByProduit(self, exact=False):
+        with self.transaction(cursor_name="stream_global_achats") as pg_cursor:
+            pg_cursor.execute(GLOBAL_ACHATS_QUERIES[exact][0].format(keyset="", limit=""))
+            for row in pg_cursor:
+                yield {"product_id": row[0], "product_name": row[1], "num_buyers": row[2]}
+
+    def requestSpecific1(self, user_id, max_level=3, distinct=False, limit=None, cursor=None):
+        return self.fetch_page(SPECIFIC1_QUERIES[distinct], SPECIFIC1_KEYSET,
+                               (self.check_id(user_id), self.check_deep_level(max_level)), limit, cursor,
+                               lambda row: {"product_id": row[0], "product_name": row[1], "nb_achats": row[2]},
+                               "nb_achats", "product_id")
+
+    def requestSpecific2(self, user_id, product_id, max_level=3, distinct=False):
+        rows, execution_time = self.fetch_query(SPECIFIC2_QUERIES[distinct],
+                                                (self.check_id(user_id), self.check_deep_level(max_level),
+                                                 self.check_id(product_id)), tuple)
+        # Agrégat sans GROUP BY : une ligne à 0 quand aucun follower n'a acheté le produit
+        return rows[0], execution_time
+
+    def requestSpecific3(self, product_id, max_level=3, distinct=False):
+        product_id = self.check_id(product_id)
+        return self.fetch_query(SPECIFIC3_QUERIES[distinct], (product_id, self.check_deep_level(max_level), product_id),
+                                lambda row: {"product_id": row[0], "product_name": row[1], "num_buyers": row[2]})
+
+    def requestSpecific1Batch(self, user_ids, max_level=3, distinct=False):
+        user_ids = self.check_batch_anchors(user_ids)
+        rows, execution_time = self.fetch_query(
+            BATCH_SPECIFIC1_QUERIES[distinct], (self.id_array(user_ids), self.check_deep_level(max_level)),
+            lambda row: (row[0], {"product_id": row[1], "product_name": row[2], "nb_achats": row[3]}))
+        return self.group_by_anchor(user_ids, rows), execution_time
+
+    def requestSpecific2Batch(self, user_ids, product_id, max_level=3, distinct=False):
+        user_ids = self.check_batch_anchors(user_ids)
+        rows, execution_time = self.fetch_query(
+            BATCH_SPECIFIC2_QUERIES[distinct],
+            (self.id_array(user_ids), self.check_deep_level(max_level), self.check_id(product_id)), tuple)
+        results = dict.fromkeys(user_ids, 0)
+        results.update((str(root), nb_achats) for root, nb_achats in rows)
+        return results, execution_time
+
+    def requestSpecific3Batch(self, product_ids, max_level=3, distinct=False):
+        product_ids = self.check_batch_anchors(product_ids)
+        rows, execution_time = self.fetch_query(
+            BATCH_SPECIFIC3_QUERIES[distinct], (self.id_array(product_ids), self.check_deep_level(max_level)),
+            lambda row: (row[0], {"product_id": row[0], "product_name": row[1], "num_buyers": row[2]}))
+        return self.group_by_anchor(product_ids, rows), execution_time
+
+    def check_batch_anchors(self, ids):
+        return list(dict.fromkeys(self.check_id(value) for value in self.check_batch_ids(ids)))
+
+    @staticmethod
+    def id_array(ids):
+        # Littéral de tableau non typé : le serveur le convertit dans le type de la colonne (VARCHAR ou UUID),
+        # là où une liste Python serait envoyée en text[] et ferait échouer la comparaison avec un UUID
+        return "{" + ",".join('"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"' for value in ids) + "}"
+
+    def fetch_page(self, query, keyset, params, limit, cursor, convert, count_key, id_key):
+        # Sans limit, la requête complète d'origine et une liste de lignes
+        if limit is None:
+            return self.fetch_query(query.format(keyset="", limit=""), params, convert)
 
-        start_time = datetime.now()
+        limit, cursor = self.check_page(limit, cursor)
+        params = tuple(params or ())
+        if cursor is not None:
+            count, last_id = cursor
+            params += (count, count, self.check_id(last_id))
+        rows, execution_time = self.fetch_query(query.format(keyset=keyset if cursor else "", limit="LIMIT %s"),
+                                                params + (limit + 1,), convert)
+        return self.page(rows, limit, count_key, id_key), execution_time
 
-        self.pg_cursor.execute(query, (product_id, max_level, product_id))
+    def fetch_query(self, query, params, convert):
+        # Avec un curseur client, execute() couvre l'envoi, la planification, l'exécution et le transfert des lignes ;
+        # la phase prepare n'apparaît qu'au premier usage de la requête sur une connexion
+        timer = PhaseTimer()
+        with self.transaction() as pg_cursor:
+            statement, params = self.execute_prepared(pg_cursor, query, params, timer, read_only=True)
+            with timer.phase("fetch"):
+                rows = pg_cursor.fetchall()
+            server = self.explain_query(pg_cursor, query, statement, params) if self.explain else None
 
-        products = self.pg_cursor.fetchall()
-        end_time = datetime.now()
+        with timer.phase("convert"):
+            results = [convert(row) for row in rows]
 
-        products = [
-            {"product_id": row[0], "product_name": row[1], "num_buyers": row[2]}
-            for row in products
-        ]
+        return results, timer.timing(server)
 
-        return products, (end_time - start_time).total_seconds() * 1000
+    def explain_query(self, pg_cursor, query, statement, params):
+        # EXPLAIN ANALYZE réexécute la requête : les durées serveur viennent de cette seconde exécution.
+        # Sur un EXECUTE, Planning Time est quasi nul quand le plan générique en cache est réutilisé
+        pg_cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement, params)
+        plan = pg_cursor.fetchone()[0][0]
+        server = {
+            "planning_time": plan["Planning Time"],
+            "execution_time": plan["Execution Time"],
+            "shared_hit_blocks": plan["Plan"].get("Shared Hit Blocks", 0),
+            "shared_read_blocks": plan["Plan"].get("Shared Read Blocks", 0)
+        }
+        if self.prepared:
+            pg_cursor.execute("SELECT generic_plans, custom_plans FROM pg_prepared_statements WHERE name = %s;",
+                              (prepared_statement(query)[0],))
+            server["generic_plans"], server["custom_plans"] = pg_cursor.fetchone()
+            server["plan_cache_mode"] = self.plan_cache_mode
+        return server
 
-    def commit(self):
-        return execute_with_timer(self.pg_conn.commit)
+    @staticmethod
+    def commit(pg_cursor):
+        return execute_with_timer(pg_cursor.connection.commit)
@@ -0,0 +1,107 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.utils import elapsed_ms
+
+
+class QueryCache:
+    def __init__(self, max_entries=None, ttl=None, max_bytes=None, path=None):
+        self.max_entries = max_entries or int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 256))
+        self.ttl = ttl or float(os.getenv("QUERY_CACHE_TTL", 3600))
+        self.max_bytes = max_bytes or int(os.getenv("QUERY_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # Un cache par processus : une écriture dans un worker invalide les autres via la date de modification
+        # d'un fichier par base, relue à chaque appel
+        self.path = path or os.getenv("QUERY_CACHE_DIR", "/app/logs/cache")
+        os.makedirs(self.path, exist_ok=True)
+        self.generations = {}
+
+    def call(self, db_target, db, method, *params):
+        key = (db_target, method, json.dumps(params, default=str))
+
+        start_ns = time.perf_counter_ns()
+        generation = self.generation(db_target)
+        with self.lock:
+            if self.generations.get(db_target) != generation:
+                self.drop(db_target)
+                self.generations[db_target] = generation
+            entry = self.get(key)
+            if entry is not None:
+                self.hits += 1
+                execution_time = elapsed_ms(start_ns)
+                return entry[0], execution_time, self.stats(True)
+            self.misses += 1
+
+        results, execution_time = getattr(db, method)(*params)
+
+        entry_size = len(json.dumps(results, default=str))
+        with self.lock:
+            # Résultat calculé pendant une invalidation : on le sert sans le garder
+            if entry_size <= self.max_bytes and self.generations.get(db_target) == generation:
+                self.put(key, results, entry_size)
+            return results, execution_time, self.stats(False)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] < time.monotonic():
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, results, entry_size):
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = (results, entry_size, time.monotonic() + self.ttl)
+        self.size += entry_size
+
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, key):
+        self.size -= self.entries.pop(key)[1]
+
+    def generation_path(self, db_target):
+        return os.path.join(self.path, f"{db_target}.generation")
+
+    def generation(self, db_target):
+        try:
+            return os.stat(self.generation_path(db_target)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def invalidate(self, db_target):
+        # Renvoie les générations avant et après : l'appelant sait si un autre worker a écrit entre-temps
+        before = self.generation(db_target)
+        path = self.generation_path(db_target)
+        with open(path, "a"):
+            pass
+        now_ns = time.time_ns()
+        os.utime(path, ns=(now_ns, now_ns))
+        after = self.generation(db_target)
+        with self.lock:
+            self.drop(db_target)
+            self.generations[db_target] = after
+        return before, after
+
+    def drop(self, db_target):
+        for key in [key for key in self.entries if key[0] == db_target]:
+            self.remove(key)
+
+    def stats(self, hit):
+        return {
+            "hit": hit,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.entries),
+            "size": self.size
+        }
@@ -0,0 +1,51 @@
+import os
+import threading
+
+from app.utils import execute_with_timer
+
+
+class BackendRegistry:
+    def __init__(self, factories, on_create=None):
+        self.factories = factories
+        self.on_create = on_create
+        self.backends = {}
+        self.lock = threading.Lock()
+        # Connexions héritées d'un fork : jamais réutilisées, jamais fermées non plus
+        self.inherited = []
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        # Fermer une connexion héritée enverrait la déconnexion sur la socket du parent : on garde seulement
+        # une référence pour que le ramasse-miettes n'y touche pas, et le fils ouvre les siennes à la demande
+        self.inherited.extend(self.backends.values())
+        self.backends = {}
+        self.lock = threading.Lock()
+
+    def get(self, db_target):
+        # None pour une cible inconnue, comme un dict
+        factory = self.factories.get(db_target)
+        if factory is None:
+            return None
+
+        backend = self.backends.get(db_target)
+        if backend is None:
+            with self.lock:
+                backend = self.backends.get(db_target)
+                if backend is None:
+                    backend = factory()
+                    if self.on_create is not None:
+                        self.on_create(db_target, backend)
+                    backend.init_db()
+                    self.backends[db_target] = backend
+        return backend
+
+    def targets(self):
+        return list(self.factories)
+
+    def health(self, db_target):
+        # Crée le backend au besoin : une sonde de disponibilité réchauffe aussi le processus
+        try:
+            latency = execute_with_timer(self.get(db_target).ping)
+            return {"status": "ok", "latency": round(latency, 3)}
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
@@ -0,0 +1,23 @@
+import os
+
+# Serveur de production : workers préforkés (un par coeur par défaut), chacun avec un pool de threads.
+# Les backends sont ouverts à la première requête dans chaque worker, jamais dans le maître
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv("WEB_WORKERS", os.cpu_count() or 1))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", 4))
+
+# Les insertions synchrones ("background": false) et les parcours profonds peuvent durer plusieurs minutes
+timeout = int(os.getenv("WEB_TIMEOUT", 600))
+graceful_timeout = 30
+
+# Application importée une fois dans le maître puis forkée : démarrage immédiat, pages mémoire partagées
+preload_app = os.getenv("WEB_PRELOAD", "true").lower() == "true"
+
+accesslog = os.getenv("WEB_ACCESS_LOG")
+
+
+def post_fork(server, worker):
+    # Nombre de workers effectif (options de ligne de commande comprises), lu par l'application à chaque requête :
+    # la base memory, propre à un processus, n'est servie qu'avec un seul worker
+    os.environ["WEB_WORKERS"] = str(server.cfg.workers)
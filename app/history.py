@@ -0,0 +1,165 @@
+import json
+import os
+import sqlite3
+import threading
+from itertools import groupby
+
+from app.utils import percentile
+
+HISTORY_COLUMNS = ("id", "date", "db_target", "command", "nb_entities", "execution_time", "phases")
+
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+class HistoryStore:
+    def __init__(self, path=None, max_rows=None):
+        self.path = path or os.getenv("HISTORY_DB", "/app/logs/history.db")
+        self.max_rows = max_rows or int(os.getenv("HISTORY_MAX_ROWS", 1000000))
+        self.local = threading.local()
+        self.inserts = 0
+        self.lock = threading.Lock()
+        self.init_db()
+
+    def connection(self):
+        # sqlite3 interdit de partager une connexion entre threads : une par thread
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            self.local.conn = conn
+        return conn
+
+    def init_db(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = self.connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT NOT NULL,
+                    db_target TEXT,
+                    command TEXT,
+                    nb_entities INTEGER,
+                    execution_time REAL,
+                    phases TEXT
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS history_target_command_date "
+                         "ON history (db_target, command, date);")
+            conn.execute("CREATE INDEX IF NOT EXISTS history_date ON history (date);")
+        self.import_legacy()
+
+    def import_legacy(self):
+        # Reprise de l'ancien historique en lignes JSON ; le renommage passe en premier pour qu'un seul
+        # des workers démarrés ensemble fasse l'import
+        legacy_path = os.path.join(os.path.dirname(self.path), "history.json")
+        try:
+            os.replace(legacy_path, legacy_path + ".imported")
+        except FileNotFoundError:
+            return
+        with open(legacy_path + ".imported", "r") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        conn = self.connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO history (date, db_target, command, nb_entities, execution_time, phases) "
+                "VALUES (?, ?, ?, ?, ?, ?);",
+                [(entry["date"], entry["db_target"], entry["command"], entry["nb_entities"],
+                  entry["execution_time"], json.dumps(entry["phases"]) if entry.get("phases") else None)
+                 for entry in entries]
+            )
+
+    def add(self, command_history):
+        conn = self.connection()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO history (date, db_target, command, nb_entities, execution_time, phases) "
+                "VALUES (?, ?, ?, ?, ?, ?);",
+                (command_history["date"], command_history["db_target"], command_history["command"],
+                 command_history["nb_entities"], command_history["execution_time"],
+                 json.dumps(command_history["phases"]) if command_history.get("phases") else None)
+            )
+
+        # La rotation supprime les entrées les plus anciennes, vérifiée toutes les 1000 insertions
+        with self.lock:
+            self.inserts += 1
+            rotate = self.inserts % 1000 == 0
+        if rotate:
+            with conn:
+                conn.execute("DELETE FROM history WHERE id <= ?;", (cursor.lastrowid - self.max_rows,))
+
+        return cursor.lastrowid
+
+    @staticmethod
+    def filters(db_target=None, command=None, since=None, until=None):
+        # Dates au format de l'historique ("%Y-%m-%d %H:%M:%S"), la comparaison de chaînes suffit
+        clauses, params = [], []
+        for clause, value in (("db_target = ?", db_target), ("command = ?", command),
+                              ("date >= ?", since), ("date <= ?", until)):
+            if value:
+                clauses.append(clause)
+                params.append(value.replace("T", " ") if clause.startswith("date") else value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def page(self, cursor=None, limit=None, order="asc", **filters):
+        limit = int(limit or PAGE_SIZE)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit doit être compris entre 1 et {MAX_PAGE_SIZE}.")
+        # desc : les entrées les plus récentes d'abord, le curseur remonte vers les plus anciennes
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Ordre inconnu : {order}")
+
+        where, params = self.filters(**filters)
+        if cursor is not None:
+            where += (" AND " if where else " WHERE ") + ("id > ?" if order == "asc" else "id < ?")
+            params.append(int(cursor))
+
+        rows = self.connection().execute(
+            f"SELECT {', '.join(HISTORY_COLUMNS)} FROM history{where} ORDER BY id {order.upper()} LIMIT ?;",
+            params + [limit + 1]
+        ).fetchall()
+
+        entries = [self.entry(row) for row in rows[:limit]]
+        return {
+            "history": entries,
+            "next_cursor": entries[-1]["id"] if len(rows) > limit else None
+        }
+
+    def stats(self, **filters):
+        where, params = self.filters(**filters)
+        rows = self.connection().execute(
+            f"SELECT db_target, command, execution_time FROM history{where} "
+            f"ORDER BY db_target, command, execution_time;",
+            params
+        )
+
+        stats = []
+        for (db_target, command), group in groupby(rows, key=lambda row: (row[0], row[1])):
+            timings = [row[2] for row in group]
+            stats.append({
+                "db_target": db_target,
+                "command": command,
+                "count": len(timings),
+                "mean": round(sum(timings) / len(timings), 3),
+                "min": timings[0],
+                "p50": round(percentile(timings, 50), 3),
+                "p90": round(percentile(timings, 90), 3),
+                "p99": round(percentile(timings, 99), 3),
+                "max": timings[-1]
+            })
+        return stats
+
+    def clear(self):
+        conn = self.connection()
+        with conn:
+            conn.execute("DELETE FROM history;")
+
+    @staticmethod
+    def entry(row):
+        entry = dict(zip(HISTORY_COLUMNS, row))
+        if entry["phases"]:
+            entry["phases"] = json.loads(entry["phases"])
+        else:
+            del entry["phases"]
+        return entry
@@ -0,0 +1,263 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from app.utils import elapsed_ms
+
+RESUMABLE_STATUSES = ("cancelled", "interrupted", "failed")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, db_target, command, params, total=None, chunk_size=None, job_id=None):
+        self.id = job_id or str(uuid.uuid4())
+        self.db_target = db_target
+        self.command = command
+        self.params = params
+        self.total = total
+        self.chunk_size = chunk_size or total
+        self.status = "pending"
+        self.rows_done = 0
+        self.execution_time = 0
+        self.created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.finished_at = None
+        self.error = None
+        self.result = None
+        self.command_history = None
+        # Étapes en cours, sauvegardées à chaque commit du backend : ce qu'une reprise doit terminer avant d'avancer
+        self.state = {}
+        # Débit calculé sur l'exécution en cours uniquement, une reprise repart de son propre point de départ
+        self.run_start_ns = None
+        self.run_start_rows = 0
+        self.cancel_event = threading.Event()
+
+    def chunks(self):
+        # Découpage du travail ; les points de reprise sont les commits du backend, sauvegardés au fil du morceau
+        while self.total is None or self.rows_done < self.total:
+            self.check_cancelled()
+            if self.total is None:
+                yield None
+                return
+            yield min(self.chunk_size, self.total - self.rows_done)
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def checkpoint(self, rows, execution_time):
+        self.rows_done += rows
+        self.execution_time += execution_time
+
+    def rows_per_second(self):
+        if self.run_start_ns is None:
+            return None
+        seconds = elapsed_ms(self.run_start_ns) / 1000
+        rows = self.rows_done - self.run_start_rows
+        return round(rows / seconds, 1) if seconds and rows else None
+
+    def to_dict(self):
+        rows_per_second = self.rows_per_second() if self.status == "running" else None
+        eta = None
+        if rows_per_second and self.total is not None:
+            eta = round((self.total - self.rows_done) / rows_per_second, 1)
+
+        return {
+            "id": self.id,
+            "db_target": self.db_target,
+            "command": self.command,
+            "params": self.params,
+            "status": self.status,
+            "total": self.total,
+            "chunk_size": self.chunk_size,
+            "rows_done": self.rows_done,
+            "rows_per_second": rows_per_second,
+            "eta": eta,
+            "execution_time": round(self.execution_time, 3),
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "result": self.result,
+            "command_history": self.command_history,
+            "state": self.state
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data["db_target"], data["command"], data["params"], data["total"], data["chunk_size"], data["id"])
+        for name in ("status", "rows_done", "execution_time", "created_at", "finished_at", "error", "result",
+                     "command_history"):
+            setattr(job, name, data[name])
+        # Jobs sauvegardés avant le suivi par étapes
+        job.state = data.get("state", {})
+        return job
+
+
+class JobManager:
+    # Plusieurs workers partagent le répertoire des jobs : le disque fait foi, chaque processus ne garde en
+    # mémoire que les jobs qu'il exécute
+    def __init__(self, runner, workers=None, path=None):
+        self.runner = runner
+        self.workers = workers or int(os.getenv("JOB_WORKERS", 2))
+        self.path = path or os.getenv("JOBS_DIR", "/app/logs/jobs")
+        os.makedirs(self.path, exist_ok=True)
+        self.executor = None
+        self.jobs = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def after_fork(self):
+        # Les threads du pool ne survivent pas au fork : le fils crée le sien au premier job
+        self.executor = None
+        self.jobs = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def job_path(self, job_id, extension=".json"):
+        return os.path.join(self.path, f"{job_id}{extension}")
+
+    def acquire(self, job):
+        # Verrou tenu par le processus propriétaire tant que le job est en file ou en cours ; le système le
+        # libère si ce processus meurt, ce qui permet aux autres de reconnaître un job interrompu
+        fd = os.open(self.job_path(job.id, ".lock"), os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            raise ValueError(f"Le job {job.id} est déjà en cours dans un autre processus.")
+        self.locks[job.id] = fd
+        # Marqueur d'annulation arrivé après la fin d'une exécution précédente : il ne vise pas celle-ci
+        if os.path.exists(self.job_path(job.id, ".cancel")):
+            os.remove(self.job_path(job.id, ".cancel"))
+
+    def release(self, job):
+        if os.path.exists(self.job_path(job.id, ".cancel")):
+            os.remove(self.job_path(job.id, ".cancel"))
+        fd = self.locks.pop(job.id)
+        os.unlink(self.job_path(job.id, ".lock"))
+        os.close(fd)
+
+    def is_locked(self, job_id):
+        try:
+            fd = os.open(self.job_path(job_id, ".lock"), os.O_RDWR)
+        except FileNotFoundError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            return False
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+
+    def read(self, job_id):
+        try:
+            with open(self.job_path(job_id), "r") as f:
+                job = Job.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        # Un job encore "pending" ou "running" sur disque sans processus propriétaire a été interrompu
+        if job.status in ("pending", "running") and not self.is_locked(job_id):
+            job.status = "interrupted"
+        return job
+
+    def save(self, job):
+        path = self.job_path(job.id)
+        with open(path + ".tmp", "w") as f:
+            json.dump(job.to_dict(), f, default=str)
+        os.replace(path + ".tmp", path)
+
+    def submit(self, job):
+        self.acquire(job)
+        with self.lock:
+            self.jobs[job.id] = job
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self.save(job)
+        self.executor.submit(self.run, job)
+        return job
+
+    def run(self, job):
+        job.status = "running"
+        job.run_start_ns = time.perf_counter_ns()
+        job.run_start_rows = job.rows_done
+        self.check_cancel(job)
+        self.save(job)
+
+        try:
+            self.runner(job, lambda rows, execution_time: self.checkpoint(job, rows, execution_time))
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        else:
+            job.status = "completed"
+        finally:
+            job.finished_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.save(job)
+            # Terminé : les lectures suivantes passent par le disque, comme pour les autres processus
+            with self.lock:
+                self.jobs.pop(job.id, None)
+            self.release(job)
+
+    def checkpoint(self, job, rows, execution_time):
+        job.checkpoint(rows, execution_time)
+        self.check_cancel(job)
+        self.save(job)
+
+    def check_cancel(self, job):
+        # Annulation demandée par un autre processus : un fichier marqueur à côté du job
+        if os.path.exists(self.job_path(job.id, ".cancel")):
+            job.cancel_event.set()
+
+    def get(self, job_id):
+        try:
+            job_id = str(uuid.UUID(job_id))
+        except ValueError:
+            return None
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return job or self.read(job_id)
+
+    def list(self):
+        jobs = []
+        for name in sorted(os.listdir(self.path)):
+            if name.endswith(".json"):
+                job = self.get(name[:-len(".json")])
+                if job is not None:
+                    jobs.append(job)
+        return jobs
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if job.status in ("pending", "running"):
+            job.cancel_event.set()
+            with self.lock:
+                local = job.id in self.jobs
+            if not local:
+                open(self.job_path(job.id, ".cancel"), "w").close()
+        return job
+
+    def resume(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        if job.status not in RESUMABLE_STATUSES:
+            raise ValueError(f"Le job {job_id} ne peut pas être repris (statut {job.status}).")
+
+        job.status = "pending"
+        job.error = None
+        job.finished_at = None
+        job.cancel_event = threading.Event()
+        return self.submit(job)
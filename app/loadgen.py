@@ -0,0 +1,266 @@
+import argparse
+import csv
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from app.utils import elapsed_ms, percentile
+
+# Routes pilotées et leur poids par défaut dans le mélange : surtout des parcours, quelques classements globaux
+ROUTES = {
+    "specific1": "/request/specific/1",
+    "specific2": "/request/specific/2",
+    "specific3": "/request/specific/3",
+    "global_follows": "/request/global/follows",
+    "global_achats": "/request/global/achats"
+}
+DEFAULT_MIX = "specific1=4,specific2=3,specific3=2,global_follows=1,global_achats=1"
+
+COLUMNS = ("route", "db_target", "requests", "errors", "error_rate", "throughput",
+           "p50", "p90", "p99", "max", "mean", "statuses")
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(","):
+        route, _, weight = item.partition("=")
+        if route not in ROUTES:
+            raise argparse.ArgumentTypeError(f"route inconnue : {route}")
+        mix[route] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("au moins une route doit avoir un poids positif")
+    return mix
+
+
+class Client:
+    # Une connexion HTTP persistante par thread : le coût mesuré est celui du serveur, pas d'un handshake TCP
+    def __init__(self, url, timeout):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def post(self, path, payload):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            connection.request("POST", path, json.dumps(payload), {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            body = response.read()
+        except Exception:
+            # Connexion fermée par le serveur (redémarrage d'un worker, timeout) : la suivante repart d'une neuve
+            connection.close()
+            self.local.connection = None
+            raise
+        return response.status, body
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+        self.samples = {}
+
+    def record(self, key, latency, status, error=None):
+        with self.lock:
+            self.latencies.setdefault(key, []).append(latency)
+            statuses = self.statuses.setdefault(key, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if error is not None:
+                self.errors[key] = self.errors.get(key, 0) + 1
+                # Un exemple par route et backend suffit pour diagnostiquer
+                self.samples.setdefault(key, error)
+
+    def report(self, duration):
+        results = []
+        for (route, db_target), latencies in sorted(self.latencies.items()):
+            errors = self.errors.get((route, db_target), 0)
+            results.append({
+                "route": route,
+                "db_target": db_target,
+                "requests": len(latencies),
+                "errors": errors,
+                "error_rate": round(errors / len(latencies), 4),
+                "throughput": round(len(latencies) / duration, 3) if duration else None,
+                "p50": round(percentile(latencies, 50), 3),
+                "p90": round(percentile(latencies, 90), 3),
+                "p99": round(percentile(latencies, 99), 3),
+                "max": round(max(latencies), 3),
+                "mean": round(sum(latencies) / len(latencies), 3),
+                "statuses": dict(sorted(self.statuses[route, db_target].items())),
+                "error_sample": self.samples.get((route, db_target))
+            })
+        return results
+
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.client = Client(args.url, args.timeout)
+        self.recorder = None
+        self.routes = list(args.mix)
+        self.weights = [args.mix[route] for route in self.routes]
+        self.ids = {}
+
+    def sample_ids(self):
+        # Identifiants tirés une fois par backend via les routes de sélection : les bases n'ont pas les mêmes
+        for db_target in self.args.backends:
+            ids = {}
+            for entity in ("users", "produits"):
+                status, body = self.client.post(f"/select_{entity}", {
+                    "db_target": db_target,
+                    "nb_entities": self.args.samples,
+                    "sampling": self.args.sampling
+                })
+                if status != 200:
+                    raise ValueError(f"select_{entity} sur {db_target} a échoué ({status}) : {body[:200]!r}")
+                ids[entity] = [row["id"] for row in json.loads(body)["results"]]
+                if not ids[entity]:
+                    raise ValueError(f"Pas assez de {entity} dans {db_target} pour échantillonner.")
+            self.ids[db_target] = ids
+
+    def next_request(self, rng):
+        args = self.args
+        route = rng.choices(self.routes, self.weights)[0]
+        db_target = rng.choice(args.backends)
+        payload = {"db_target": db_target, "cache": args.cache}
+
+        if route.startswith("specific"):
+            ids = self.ids[db_target]
+            payload["deep_level"] = rng.choice(args.depths)
+            payload["semantics"] = args.semantics
+            if route in ("specific1", "specific2"):
+                payload["user_id"] = rng.choice(ids["users"])
+            if route in ("specific2", "specific3"):
+                payload["product_id"] = rng.choice(ids["produits"])
+        else:
+            payload["exact"] = args.exact
+        if route in ("specific1", "global_follows", "global_achats") and args.limit:
+            payload["limit"] = args.limit
+
+        return route, db_target, payload
+
+    def send(self, route, db_target, payload, start_ns):
+        # start_ns est l'instant d'arrivée prévu : en boucle ouverte, l'attente avant l'envoi compte dans la latence
+        try:
+            status, body = self.client.post(ROUTES[route], payload)
+            error = None if status < 400 else body[:200].decode("utf-8", "replace")
+        except Exception as e:
+            status, error = "exception", f"{type(e).__name__}: {e}"
+        if self.recorder is not None:
+            self.recorder.record((route, db_target), elapsed_ms(start_ns), status, error)
+
+    def closed_loop(self, deadline):
+        # Concurrence fixe : chaque utilisateur virtuel attend sa réponse (puis son temps de réflexion) avant d'envoyer
+        def user(seed):
+            rng = random.Random(seed)
+            while time.monotonic() < deadline:
+                self.send(*self.next_request(rng), time.perf_counter_ns())
+                if self.args.think_time:
+                    time.sleep(rng.expovariate(1000 / self.args.think_time))
+
+        threads = [threading.Thread(target=user, args=(self.args.seed + i,), daemon=True)
+                   for i in range(self.args.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def open_loop(self, deadline):
+        # Débit d'arrivée fixe (processus de Poisson), indépendant des temps de réponse : quand le serveur sature,
+        # les requêtes s'accumulent dans la file au lieu de ralentir les arrivées
+        rng = random.Random(self.args.seed)
+        with ThreadPoolExecutor(max_workers=self.args.users, thread_name_prefix="loadgen") as executor:
+            next_arrival = time.monotonic()
+            while next_arrival < deadline:
+                delay = next_arrival - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                start_ns = time.perf_counter_ns() - int(max(-delay, 0) * 1e9)
+                executor.submit(self.send, *self.next_request(rng), start_ns)
+                next_arrival += rng.expovariate(self.args.rate)
+
+    def run(self):
+        self.sample_ids()
+        load = self.open_loop if self.args.mode == "open" else self.closed_loop
+
+        if self.args.warmup:
+            # Les réponses de la chauffe ne sont pas enregistrées
+            load(time.monotonic() + self.args.warmup)
+
+        self.recorder = Recorder()
+        start_ns = time.perf_counter_ns()
+        load(time.monotonic() + self.args.duration)
+        # En boucle ouverte, la durée inclut la vidange de la file : le débit mesuré est celui réellement servi
+        return self.recorder.report(elapsed_ms(start_ns) / 1000)
+
+
+def write_results(results, output_format, output):
+    if output_format == "csv":
+        writer = csv.DictWriter(output, fieldnames=COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows({**result, "statuses": json.dumps(result["statuses"])} for result in results)
+    else:
+        json.dump(results, output, indent=2, ensure_ascii=False)
+        output.write("\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Générateur de charge concurrente sur les routes d'analyse")
+    parser.add_argument("--url", default="http://localhost:5000", help="application (stack docker-compose locale)")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed",
+                        help="closed : concurrence fixe, open : débit d'arrivée fixe")
+    parser.add_argument("--users", type=int, default=50,
+                        help="utilisateurs virtuels (closed) ou requêtes en vol au plus (open)")
+    parser.add_argument("--rate", type=float, default=20, help="requêtes par seconde (open)")
+    parser.add_argument("--think-time", type=float, default=0, help="temps de réflexion moyen en ms (closed)")
+    parser.add_argument("--duration", type=float, default=60, help="durée mesurée en secondes")
+    parser.add_argument("--warmup", type=float, default=5, help="secondes de chauffe non mesurées")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"routes et poids (défaut : {DEFAULT_MIX})")
+    parser.add_argument("--backends", type=lambda value: value.split(","), default=["postgres", "neo4j"])
+    parser.add_argument("--depths", type=lambda value: [int(depth) for depth in value.split(",")], default=[3])
+    parser.add_argument("--semantics", choices=("path", "distinct"), default="path")
+    parser.add_argument("--samples", type=int, default=100, help="identifiants tirés par base")
+    parser.add_argument("--sampling", choices=("uniform", "fast"), default="fast")
+    parser.add_argument("--limit", type=int, default=100, help="taille de page des classements (0 : complet)")
+    parser.add_argument("--exact", action="store_true", help="classements globaux recalculés plutôt que précalculés")
+    parser.add_argument("--cache", action="store_true", help="autorise le cache de requêtes de l'application")
+    parser.add_argument("--timeout", type=float, default=600, help="timeout HTTP en secondes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", choices=("json", "csv"), default="json")
+    parser.add_argument("--output", help="fichier de sortie (stdout par défaut)")
+
+    args = parser.parse_args(argv)
+    if args.users < 1:
+        parser.error("--users doit être positif")
+    if args.mode == "open" and args.rate <= 0:
+        parser.error("--rate doit être positif")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = LoadGenerator(args).run()
+    for result in results:
+        print(f"{result['db_target']} {result['route']} {result['throughput']} req/s p50={result['p50']} ms "
+              f"p99={result['p99']} ms erreurs={result['error_rate']:.2%}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            write_results(results, args.format, f)
+    else:
+        write_results(results, args.format, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import argparse
+import json
+
+from app.db.postgres_db import PostgresDB, ID_TYPES
+from app.db.query_cache import QueryCache
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convertit les identifiants PostgreSQL vers un autre type de colonne")
+    parser.add_argument("id_type", choices=sorted(ID_TYPES))
+    args = parser.parse_args()
+
+    postgres_db = PostgresDB()
+    try:
+        result, execution_time = postgres_db.migrate_id_type(args.id_type)
+    finally:
+        # Identifiants réécrits hors de l'application : les workers abandonnent cache et registre
+        QueryCache().invalidate("postgres")
+    result["execution_time"] = round(execution_time, 3)
+
+    print(json.dumps(result, indent=2))
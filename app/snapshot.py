@@ -0,0 +1,166 @@
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from app.db.query_cache import QueryCache
+from app.utils import batched, elapsed_ms
+
+# Ordre de chargement : les noeuds avant les arêtes qui les référencent
+SNAPSHOT_ENTITIES = ("utilisateurs", "produits", "follows", "achats")
+
+SNAPSHOT_COLUMNS = {
+    "utilisateurs": ("id", "nom"),
+    "produits": ("id", "nom", "prix"),
+    "follows": ("utilisateur_id", "follower_id"),
+    "achats": ("utilisateur_id", "produit_id", "date_achat")
+}
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "/app/snapshots")
+CHUNK_ROWS = int(os.getenv("SNAPSHOT_CHUNK_ROWS", 1000000))
+
+
+def snapshot_path(name):
+    if not re.fullmatch(r"[A-Za-z0-9_.-]+", name or "") or name.startswith("."):
+        raise ValueError(f"Nom de snapshot invalide : {name}")
+    return os.path.join(SNAPSHOT_DIR, name)
+
+
+def csv_value(value):
+    # Une seule représentation texte par valeur, quel que soit le backend source
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def list_snapshots():
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+
+    snapshots = []
+    for name in sorted(os.listdir(SNAPSHOT_DIR)):
+        manifest_path = os.path.join(SNAPSHOT_DIR, name, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as f:
+                manifest = json.load(f)
+            snapshots.append({"name": name, "source": manifest["source"], "created_at": manifest["created_at"],
+                              "rows": {entity: info["rows"] for entity, info in manifest["entities"].items()}})
+    return snapshots
+
+
+def export_snapshot(db, db_target, name, chunk_rows=CHUNK_ROWS):
+    path = snapshot_path(name)
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        raise ValueError(f"Le snapshot {name} existe déjà.")
+    os.makedirs(path, exist_ok=True)
+
+    start_ns = time.perf_counter_ns()
+    manifest = {
+        "version": 1,
+        "source": db_target,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "entities": {}
+    }
+    for entity in SNAPSHOT_ENTITIES:
+        chunks = []
+        for num_chunk, rows in enumerate(batched(db.export_rows(entity), chunk_rows)):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows([csv_value(value) for value in row] for row in rows)
+            # mtime=0 : deux exports des mêmes lignes donnent des fichiers identiques octet pour octet
+            data = gzip.compress(buffer.getvalue().encode("utf-8"), compresslevel=6, mtime=0)
+
+            file_name = f"{entity}-{num_chunk:05d}.csv.gz"
+            with open(os.path.join(path, file_name), "wb") as f:
+                f.write(data)
+            chunks.append({"file": file_name, "rows": len(rows), "sha256": hashlib.sha256(data).hexdigest()})
+
+        manifest["entities"][entity] = {
+            "columns": SNAPSHOT_COLUMNS[entity],
+            "rows": sum(chunk["rows"] for chunk in chunks),
+            "chunks": chunks
+        }
+
+    # Le manifeste est écrit en dernier : un export interrompu n'est jamais pris pour un snapshot complet
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest, elapsed_ms(start_ns)
+
+
+class SnapshotReader:
+    # Même interface que export_rows des backends : un snapshot peut remplacer une base source
+    def __init__(self, name):
+        self.path = snapshot_path(name)
+        manifest_path = os.path.join(self.path, "manifest.json")
+        if not os.path.exists(manifest_path):
+            raise ValueError(f"Snapshot introuvable : {name}")
+        with open(manifest_path, "r") as f:
+            self.manifest = json.load(f)
+
+    def rows(self, entity):
+        return self.manifest["entities"][entity]["rows"]
+
+    def total_rows(self):
+        return sum(self.rows(entity) for entity in SNAPSHOT_ENTITIES)
+
+    def export_rows(self, entity):
+        if entity not in SNAPSHOT_COLUMNS:
+            raise ValueError(f"Entité inconnue : {entity}")
+
+        for chunk in self.manifest["entities"][entity]["chunks"]:
+            with open(os.path.join(self.path, chunk["file"]), "rb") as f:
+                data = f.read()
+            if hashlib.sha256(data).hexdigest() != chunk["sha256"]:
+                raise ValueError(f"Fichier corrompu : {chunk['file']}")
+
+            for row in csv.reader(io.StringIO(gzip.decompress(data).decode("utf-8"))):
+                yield tuple(value if value != "" else None for value in row)
+
+
+def import_snapshot(db, name):
+    snapshot = SnapshotReader(name)
+    # Le snapshot remplace le contenu de la base cible
+    db.clear_db()
+    return db.import_snapshot(snapshot)
+
+
+def main(argv=None):
+    from app.bench import create_backend
+
+    parser = argparse.ArgumentParser(description="Export et import de jeux de données en CSV.gz découpés")
+    parser.add_argument("action", choices=("export", "import", "list"))
+    parser.add_argument("db_target", nargs="?", choices=("postgres", "neo4j", "memory"))
+    parser.add_argument("name", nargs="?")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    if args.action == "list":
+        result, execution_time = list_snapshots(), 0
+    elif not args.db_target or not args.name:
+        parser.error("db_target et name sont requis pour export et import")
+    elif args.action == "export":
+        result, execution_time = export_snapshot(create_backend(args.db_target), args.db_target, args.name,
+                                                 args.chunk_rows)
+    else:
+        try:
+            result, execution_time = import_snapshot(create_backend(args.db_target), args.name)
+        finally:
+            # Base vidée puis rechargée hors de l'application : les workers abandonnent cache et registre
+            QueryCache().invalidate(args.db_target)
+
+    json.dump({"result": result, "execution_time": round(execution_time, 3)}, sys.stdout, indent=2, default=str)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,33 +9,46 @@ document.addEventListener("DOMContentLoaded", function () {
     const executionTable = document.getElementById('executionTable').querySelector("tbody");
     let loadingInterval;
 
-    let postgresCommandCount = 0;
-    let neo4jCommandCount = 0;
+    const datasetIndexes = {postgres: 0, neo4j: 1, memory: 2};
+    // Seules les premières lignes sont affichées : le tri top-N est fait par la base
+    const resultsPageSize = 100;
+    const datasetColors = {postgres: '#FFDDAE', neo4j: '#D4F6FF', memory: '#E2F0CB'};
+    // Le tableau ne garde que les dernières entrées, le graphique vient des statistiques calculées par le serveur
+    const historyPageSize = 200;
+    let statsTimeout;
 
     let performanceData = {
         labels: [],
         datasets: [
             {
-                label: 'PostgreSQL - Temps d\'exécution (ms)',
+                label: 'PostgreSQL - p50 (ms)',
                 data: [],
                 borderColor: '#FFB38E',
                 backgroundColor: '#FFDDAEAA',
-                tension: 0.1,
-                commandLabels: []
+                borderWidth: 1,
+                stats: []
             },
             {
-                label: 'Neo4j - Temps d\'exécution (ms)',
+                label: 'Neo4j - p50 (ms)',
                 data: [],
                 borderColor: '#789DBC',
                 backgroundColor: '#D4F6FFAA',
-                tension: 0.1,
-                commandLabels: []
+                borderWidth: 1,
+                stats: []
+            },
+            {
+                label: 'Mémoire - p50 (ms)',
+                data: [],
+                borderColor: '#8DB87A',
+                backgroundColor: '#E2F0CBAA',
+                borderWidth: 1,
+                stats: []
             }
         ]
     };
 
     let chart = new Chart(performanceGraph, {
-        type: 'line',
+        type: 'bar',
         data: performanceData,
         options: {
             responsive: true,
@@ -46,9 +59,8 @@ document.addEventListener("DOMContentLoaded", function () {
                 tooltip: {
                     callbacks: {
                         label: function (tooltipItem) {
-                            const datasetIndex = tooltipItem.datasetIndex;
-                            const commandLabel = performanceData.datasets[datasetIndex].commandLabels[tooltipItem.dataIndex];
-                            return `${commandLabel} : ${tooltipItem.raw} ms`;
+                            const stats = performanceData.datasets[tooltipItem.datasetIndex].stats[tooltipItem.dataIndex];
+                            return `p50 ${stats.p50} ms - p90 ${stats.p90} ms - p99 ${stats.p99} ms (${stats.count} exécutions)`;
                         }
                     }
                 }
@@ -57,16 +69,13 @@ document.addEventListener("DOMContentLoaded", function () {
                 x: {
                     title: {
                         display: true,
-                        text: 'Nombre de commandes exécutées'
-                    },
-                    ticks: {
-                        beginAtZero: true
+                        text: 'Commande'
                     }
                 },
                 y: {
                     title: {
                         display: true,
-                        text: 'Temps d\'exécution (ms)'
+                        text: 'Temps d\'exécution médian (ms)'
                     },
                     min: 0
                 }
@@ -75,13 +84,31 @@ document.addEventListener("DOMContentLoaded", function () {
     });
 
     async function getHistory() {
-        fetch('/history')
-            .then(response => response.json())
-            .then(data => {
-                for (let i = 0; i < data.length; i++) {
-                    updateExecutionTable(data[i]);
-                }
-            });
+        const response = await fetch(`/history?order=desc&limit=${historyPageSize}`);
+        const data = await response.json();
+        for (let i = data.history.length - 1; i >= 0; i--) {
+            addExecutionRow(data.history[i]);
+        }
+        await getHistoryStats();
+    }
+
+    async function getHistoryStats() {
+        const response = await fetch('/history/stats');
+        const stats = await response.json();
+
+        const commands = [...new Set(stats.map(entry => entry.command))].sort();
+        const byTarget = {};
+        for (const entry of stats) {
+            (byTarget[entry.db_target] ??= {})[entry.command] = entry;
+        }
+
+        performanceData.labels = commands;
+        for (const [dbTarget, datasetIndex] of Object.entries(datasetIndexes)) {
+            const dataset = performanceData.datasets[datasetIndex];
+            dataset.stats = commands.map(command => byTarget[dbTarget]?.[command] ?? null);
+            dataset.data = dataset.stats.map(entry => entry ? entry.p50 : null);
+        }
+        chart.update();
     }
 
     function showResponse(message) {
@@ -93,10 +120,16 @@ document.addEventListener("DOMContentLoaded", function () {
     }
 
     function updateExecutionTable(data) {
+        addExecutionRow(data);
+        // Plusieurs commandes rapprochées ne déclenchent qu'un recalcul des statistiques
+        clearTimeout(statsTimeout);
+        statsTimeout = setTimeout(getHistoryStats, 500);
+    }
+
+    function addExecutionRow(data) {
         let newRow = executionTable.insertRow();
 
-        let color = data.db_target === 'postgres' ? '#FFDDAE' : '#D4F6FF';
-        newRow.style.backgroundColor = color;
+        newRow.style.backgroundColor = datasetColors[data.db_target] || datasetColors.neo4j;
 
         newRow.innerHTML = `
                 <td>${data.date}</td>
@@ -106,27 +139,11 @@ document.addEventListener("DOMContentLoaded", function () {
                 <td>${data.execution_time}</td>
             `;
 
-        executionTable.scrollIntoView({behavior: "smooth", block: "end"});
-
-
-        if (data.db_target === "postgres") {
-            postgresCommandCount++;
-            if (postgresCommandCount > neo4jCommandCount) {
-                performanceData.labels.push(postgresCommandCount);
-            }
-            performanceData.datasets[0].data.push(data.execution_time);
-            performanceData.datasets[0].commandLabels.push(`${data.command} ${data.nb_entities}`);
-
-        } else {
-            neo4jCommandCount++;
-            if (neo4jCommandCount > postgresCommandCount) {
-                performanceData.labels.push(neo4jCommandCount);
-            }
-            performanceData.datasets[1].data.push(data.execution_time);
-            performanceData.datasets[1].commandLabels.push(`${data.command} ${data.nb_entities}`);
+        while (executionTable.rows.length > historyPageSize) {
+            executionTable.deleteRow(0);
         }
 
-        chart.update();
+        executionTable.scrollIntoView({behavior: "smooth", block: "end"});
     }
 
     async function executeInsertOrSelect(endpoint, commandName, nbEntities) {
@@ -136,14 +153,43 @@ document.addEventListener("DOMContentLoaded", function () {
         const response = await fetch(`/${endpoint}`, {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({nb_entities: nbEntities, db_target: db})
+            body: JSON.stringify({
+                nb_entities: nbEntities,
+                db_target: db,
+                mode: document.getElementById('insertMode').value,
+                sampling: document.getElementById('samplingMode').value
+            })
         });
-        hideLoading();
 
-        const data = await response.json();
+        let data = await response.json();
+        if (response.status === 202) {
+            data = await waitForJob(data.job, commandName + " " + nbEntities + " (" + db + ")");
+        }
+        hideLoading();
 
         showResponse(data);
-        updateExecutionTable(data.command_history);
+        if (data.command_history) {
+            updateExecutionTable(data.command_history);
+        }
+    }
+
+    async function waitForJob(job, commandLabel) {
+        // Les insertions et la réinitialisation tournent en tâche de fond : on suit leur avancement
+        while (job.status === 'pending' || job.status === 'running') {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const response = await fetch(`/jobs/${job.id}`);
+            job = await response.json();
+
+            let progress = job.rows_done + (job.total !== null ? " / " + job.total : "");
+            if (job.rows_per_second) {
+                progress += " - " + job.rows_per_second + " lignes/s";
+            }
+            if (job.eta !== null) {
+                progress += " - reste " + Math.round(job.eta) + "s";
+            }
+            document.getElementById('loadingTextCommande').textContent = commandLabel + " : " + progress;
+        }
+        return job;
     }
 
     async function executeGlobalRequest(endpoint, commandName) {
@@ -152,7 +198,7 @@ document.addEventListener("DOMContentLoaded", function () {
         const response = await fetch(`/${endpoint}`, {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({db_target: db})
+            body: JSON.stringify({db_target: db, limit: resultsPageSize})
         });
         hideLoading();
 
@@ -171,7 +217,7 @@ document.addEventListener("DOMContentLoaded", function () {
         const response = await fetch(`/request/specific/1`, {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({db_target: db, user_id: userId, deep_level: deepLevel})
+            body: JSON.stringify({db_target: db, user_id: userId, deep_level: deepLevel, limit: resultsPageSize})
         });
         hideLoading();
 
@@ -225,16 +271,23 @@ document.addEventListener("DOMContentLoaded", function () {
             return;
         }
         const db = dbSelector.value;
-        fetch(`/clear`, {
+        showLoading("Réinitialisation (" + db + ")");
+        const response = await fetch(`/clear`, {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
             body: JSON.stringify({db_target: db})
-        })
-            .then(response => response.json())
-            .then(data => {
-                showResponse(data);
-                updateExecutionTable(data.command_history);
-            });
+        });
+
+        let data = await response.json();
+        if (response.status === 202) {
+            data = await waitForJob(data.job, "Réinitialisation (" + db + ")");
+        }
+        hideLoading();
+
+        showResponse(data);
+        if (data.command_history) {
+            updateExecutionTable(data.command_history);
+        }
     }
 
     async function clearHistory() {
@@ -1,17 +1,110 @@
 import json
 import os
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
 
+def elapsed_ms(start_ns):
+    return (time.perf_counter_ns() - start_ns) / 1e6
+
+
 def execute_with_timer(func, *args, **kwargs):
-    start_time = datetime.now()
+    start_ns = time.perf_counter_ns()
     func(*args, **kwargs)
-    end_time = datetime.now()
-    execution_time = (end_time - start_time).total_seconds() * 1000
-    return execution_time
+    return elapsed_ms(start_ns)
+
+
+class Timing(float):
+    # Durée totale en ms (somme des phases côté client), avec le détail par phase
+    # et les durées rapportées par le serveur, qui se recouvrent avec les phases client
+    def __new__(cls, phases, server=None):
+        timing = super().__new__(cls, sum(phases.values()))
+        timing.phases = {name: round(duration, 3) for name, duration in phases.items()}
+        timing.server = server or {}
+        return timing
+
+    def to_dict(self):
+        return {**self.phases, "server": self.server} if self.server else dict(self.phases)
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, elapsed_ms(start_ns))
+
+    def add(self, name, duration):
+        self.phases[name] = self.phases.get(name, 0) + duration
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def timing(self, server=None):
+        return Timing(self.phases, server)
+
 
+def timing_phases(execution_time):
+    # Les résultats servis par le cache ou les écritures n'ont pas de détail par phase
+    return execution_time.to_dict() if isinstance(execution_time, Timing) else None
 
-def add_to_history(db_target, command, nb_entities, execution_time):
+
+def batched(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def percentile(values, p):
+    # Interpolation linéaire entre les deux rangs encadrants
+    values = sorted(values)
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def history_store():
+    # Ouvert à la première utilisation : les imports (bench, migrate) ne touchent pas à /app/logs
+    global _history_store
+    with _history_lock:
+        if _history_store is None:
+            from app.history import HistoryStore
+            _history_store = HistoryStore()
+    return _history_store
+
+
+def _reset_history_after_fork():
+    # Une connexion SQLite ne traverse pas un fork : le fils ouvre la sienne, l'héritée reste référencée
+    # pour ne pas être fermée sous le parent
+    global _history_store, _history_lock
+    if _history_store is not None:
+        _history_inherited.append(_history_store)
+    _history_store = None
+    _history_lock = threading.Lock()
+
+
+_history_store = None
+_history_lock = threading.Lock()
+_history_inherited = []
+os.register_at_fork(after_in_child=_reset_history_after_fork)
+
+
+def add_to_history(db_target, command, nb_entities, execution_time, phases=None):
     command_history = {
         "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "db_target": db_target,
@@ -19,25 +112,22 @@ def add_to_history(db_target, command, nb_entities, execution_time):
         "nb_entities": nb_entities,
         "execution_time": execution_time
     }
+    if phases:
+        command_history["phases"] = phases
 
-    with open("/app/logs/history.json", "a") as f:
-        f.write(json.dumps(command_history) + "\n")  # Convertir en JSON et ajouter un saut de ligne
+    command_history["id"] = history_store().add(command_history)
 
     return command_history
 
 
-def get_history():
-    if not os.path.exists("/app/logs/history.json"):
-        return []
+def get_history(cursor=None, limit=None, order="asc", **filters):
+    return history_store().page(cursor, limit, order, **filters)
+
 
-    history = []
-    with open("/app/logs/history.json", "r") as f:
-        for line in f:
-            history.append(json.loads(line))
-    return history
+def history_stats(**filters):
+    return history_store().stats(**filters)
 
 
 def clear_history():
-    if os.path.exists("/app/logs/history.json"):
-        os.remove("/app/logs/history.json")
+    history_store().clear()
     return "Historique effacé"